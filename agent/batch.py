@@ -0,0 +1,134 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from fastapi import HTTPException
+
+BATCH_MAX_COMMANDS = int(os.environ.get("AGENT_BATCH_MAX_COMMANDS", "256"))
+BATCH_CONCURRENCY = int(os.environ.get("AGENT_BATCH_CONCURRENCY", "16"))
+
+# Actions that only read their file (or, for retrieve, the whole workspace).
+# Build and test, and anything without a file, are barriers: they run after
+# everything before them and before everything after them.
+READ_ACTIONS = {"read", "analyze"}
+WORKSPACE_READ_ACTIONS = {"retrieve"}
+
+
+def _path_key(filepath: str) -> str:
+    return os.path.normpath(filepath).lstrip("/")
+
+
+def plan_dependencies(commands: Sequence[Any]) -> Tuple[List[Set[int]], List[Set[int]]]:
+    """For each command, the indices of earlier commands it must wait for,
+    and the subset of those whose failure means it must not run.
+
+    Reads of a file wait for its last write; a write also waits for the
+    reads since then, so commands see the workspace as if run in order.
+    Only data edges (a read or write after a write) and explicit
+    `depends_on` edges block on failure; a write that merely has to come
+    after a read, or anything ordered around a barrier, still runs once
+    the earlier command has finished, however it ended. `depends_on`
+    edges may only point backwards so the plan can't cycle.
+    """
+    deps: List[Set[int]] = []
+    blocking: List[Set[int]] = []
+    barrier: Optional[int] = None
+    since_barrier: List[int] = []
+    last_write: Dict[str, int] = {}
+    readers: Dict[str, List[int]] = {}
+    workspace_readers: List[int] = []
+    for i, command in enumerate(commands):
+        wait: Set[int] = set() if barrier is None else {barrier}
+        needs: Set[int] = set()
+        for dep in getattr(command, "depends_on", None) or ():
+            if not 0 <= dep < i:
+                raise ValueError(f"Command {i} depends on {dep}; dependencies must refer to earlier commands")
+            needs.add(dep)
+        if command.action in WORKSPACE_READ_ACTIONS:
+            needs.update(last_write.values())
+            workspace_readers.append(i)
+        elif command.action in READ_ACTIONS and command.filepath:
+            key = _path_key(command.filepath)
+            if key in last_write:
+                needs.add(last_write[key])
+            readers.setdefault(key, []).append(i)
+        elif command.filepath and command.action not in ("build", "test"):
+            key = _path_key(command.filepath)
+            if key in last_write:
+                needs.add(last_write[key])
+            wait.update(readers.pop(key, ()))
+            wait.update(workspace_readers)
+            last_write[key] = i
+        else:
+            wait.update(since_barrier)
+            barrier = i
+            since_barrier = []
+            last_write, readers, workspace_readers = {}, {}, []
+            deps.append(wait | needs)
+            blocking.append(needs)
+            continue
+        since_barrier.append(i)
+        deps.append(wait | needs)
+        blocking.append(needs)
+    return deps, blocking
+
+
+async def run_batch(commands: Sequence[Any], execute: Callable[[Any], Awaitable[Any]],
+                    concurrency: int = BATCH_CONCURRENCY, stop_on_error: bool = False) -> Dict[str, Any]:
+    """Run `commands` concurrently where their dependencies allow.
+
+    Returns per-command results with start offsets and durations relative to
+    the start of the batch. A command is skipped if a write it reads from
+    or overwrites, or an explicit `depends_on`, did not succeed, as is
+    everything not yet started once a command fails with `stop_on_error`.
+    """
+    if len(commands) > BATCH_MAX_COMMANDS:
+        raise ValueError(f"Batch has {len(commands)} commands; the limit is {BATCH_MAX_COMMANDS}")
+    deps, blocking = plan_dependencies(commands)
+    results: List[Dict[str, Any]] = [None] * len(commands)
+    done = [asyncio.Event() for _ in commands]
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    failed = False
+    batch_start = time.perf_counter()
+
+    async def run(i: int, command: Any):
+        nonlocal failed
+        entry = {"index": i, "action": command.action, "filepath": command.filepath}
+        results[i] = entry
+        try:
+            for dep in deps[i]:
+                await done[dep].wait()
+            blocked = [dep for dep in sorted(blocking[i]) if results[dep].get("status") != "success"]
+            if blocked or (stop_on_error and failed):
+                entry.update(status="skipped", blocked_by=blocked)
+                return
+            async with semaphore:
+                if stop_on_error and failed:
+                    entry.update(status="skipped", blocked_by=[])
+                    return
+                started = time.perf_counter()
+                entry["started"] = round(started - batch_start, 6)
+                try:
+                    entry["result"] = await execute(command)
+                    entry["status"] = "success"
+                except HTTPException as e:
+                    entry.update(status="error", status_code=e.status_code, error=e.detail)
+                except Exception as e:
+                    entry.update(status="error", status_code=500, error=str(e))
+                entry["duration"] = round(time.perf_counter() - started, 6)
+                if entry["status"] == "error":
+                    failed = True
+        finally:
+            done[i].set()
+
+    await asyncio.gather(*(run(i, command) for i, command in enumerate(commands)))
+    counts: Dict[str, int] = {}
+    for entry in results:
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    return {
+        "status": "success" if counts.get("success", 0) == len(results) else "partial",
+        "counts": counts,
+        "duration": round(time.perf_counter() - batch_start, 6),
+        "results": results,
+    }
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import re
+import stat
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import docker
+from docker.utils.build import create_archive, exclude_paths
+
+BUILD_CONTEXT = os.environ.get("AGENT_BUILD_CONTEXT", ".")
+BUILD_TAG = os.environ.get("AGENT_BUILD_TAG", "devops-agent:latest")
+# Extra images whose layers may seed the build cache, e.g. one pulled from a registry
+BUILD_CACHE_FROM = [ref for ref in os.environ.get("AGENT_BUILD_CACHE_FROM", "").split(",") if ref]
+CONTEXT_LABEL = "devops-agent.context-sha256"
+
+_STEP_RE = re.compile(r'^Step (\d+)/(\d+) : (.*)')
+
+
+def read_dockerignore(context_dir: str) -> List[str]:
+    """Patterns from `.dockerignore`, parsed the way docker-py does."""
+    try:
+        with open(os.path.join(context_dir, ".dockerignore")) as f:
+            lines = [line.strip() for line in f.read().splitlines()]
+    except FileNotFoundError:
+        return []
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+class ContextHasher:
+    """Content digest of a Docker build context.
+
+    Only files that survive `.dockerignore` count, so the digest changes
+    exactly when the context docker would receive changes. Per-file hashes
+    are memoized on (mtime, size, mode); an unchanged tree costs one stat
+    per file.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._memo: Dict[str, Tuple[Tuple[int, int, int], str]] = {}
+        self._lock = threading.Lock()
+
+    def _file_digest(self, full_path: str, st: os.stat_result) -> str:
+        signature = (st.st_mtime_ns, st.st_size, st.st_mode)
+        with self._lock:
+            memo = self._memo.get(full_path)
+        if memo is not None and memo[0] == signature:
+            return memo[1]
+        digest = hashlib.sha256()
+        with open(full_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        value = digest.hexdigest()
+        with self._lock:
+            if len(self._memo) >= self.max_entries:
+                self._memo.clear()
+            self._memo[full_path] = (signature, value)
+        return value
+
+    def digest(self, context_dir: str, files: List[str], dockerfile: str,
+               buildargs: Optional[Dict[str, str]] = None) -> Tuple[str, int]:
+        """(sha256 over paths, modes and contents of `files`, total bytes)."""
+        root = os.path.abspath(context_dir)
+        digest = hashlib.sha256()
+        digest.update(f"dockerfile={dockerfile}\0".encode())
+        for key, value in sorted((buildargs or {}).items()):
+            digest.update(f"arg:{key}={value}\0".encode())
+        total = 0
+        for rel in files:
+            full_path = os.path.join(root, rel)
+            st = os.lstat(full_path)
+            if stat.S_ISLNK(st.st_mode):
+                entry = f"link:{os.readlink(full_path)}"
+            elif stat.S_ISREG(st.st_mode):
+                entry = self._file_digest(full_path, st)
+                total += st.st_size
+            else:
+                entry = "dir" if stat.S_ISDIR(st.st_mode) else "other"
+            digest.update(f"{rel}\0{stat.S_IMODE(st.st_mode) & 0o111:o}\0{entry}\0".encode())
+        return digest.hexdigest(), total
+
+
+def _image_label(client, tag: str) -> Optional[str]:
+    try:
+        image = client.images.get(tag)
+    except docker.errors.ImageNotFound:
+        return None
+    return (image.labels or {}).get(CONTEXT_LABEL, "")
+
+
+def build_image(client, hasher: ContextHasher, log: Callable[[str], None], context_dir: str = BUILD_CONTEXT,
+                tag: str = BUILD_TAG, dockerfile: str = "Dockerfile", buildargs: Optional[Dict[str, str]] = None,
+                cache_from: Optional[List[str]] = None, force: bool = False) -> Dict[str, Any]:
+    """Build `tag` from `context_dir` unless the image already matches the context.
+
+    The image is labelled with the context digest, so an unchanged context
+    is detected even across agent restarts. Returns the digest, whether the
+    build was skipped, and a timing breakdown.
+    """
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    root = os.path.abspath(context_dir)
+    files = sorted(exclude_paths(root, read_dockerignore(root), dockerfile=dockerfile))
+    context_digest, context_bytes = hasher.digest(root, files, dockerfile, buildargs)
+    timings["hash"] = time.perf_counter() - started
+    summary = {"image": tag, "context_digest": context_digest, "context_files": len(files),
+               "context_bytes": context_bytes}
+
+    existing = _image_label(client, tag)
+    if not force and existing == context_digest:
+        log(f"Context {context_digest[:12]} unchanged; reusing {tag}")
+        timings["total"] = time.perf_counter() - started
+        return {**summary, "skipped": True, "timings": _rounded(timings), "steps": []}
+
+    mark = time.perf_counter()
+    with tempfile.TemporaryFile() as archive:
+        create_archive(root, files=files, fileobj=archive)
+        archive_size = archive.seek(0, os.SEEK_END)
+        archive.seek(0)
+        timings["archive"] = time.perf_counter() - mark
+        log(f"Sending {len(files)} files ({archive_size} bytes) as build context {context_digest[:12]}")
+
+        sources = list(cache_from if cache_from is not None else BUILD_CACHE_FROM)
+        if existing is not None and tag not in sources:
+            sources.append(tag)
+        mark = time.perf_counter()
+        first_response = None
+        steps: List[Dict[str, Any]] = []
+        image_id = None
+        for chunk in client.api.build(fileobj=archive, custom_context=True, dockerfile=dockerfile, tag=tag,
+                                      rm=True, decode=True, buildargs=buildargs, cache_from=sources or None,
+                                      labels={CONTEXT_LABEL: context_digest}):
+            now = time.perf_counter()
+            if first_response is None:
+                # The daemon answers once it has the whole context
+                first_response = now
+                timings["upload"] = now - mark
+            if "error" in chunk:
+                raise Exception(chunk["error"].strip())
+            text = chunk.get("stream") or chunk.get("status")
+            if text and text.strip():
+                log(text)
+                _track_step(steps, text.strip(), now)
+            image_id = chunk.get("aux", {}).get("ID", image_id)
+        end = time.perf_counter()
+        if steps:
+            steps[-1]["seconds"] = end - steps[-1].pop("_start")
+        timings["build"] = end - (first_response or mark)
+    timings["total"] = time.perf_counter() - started
+    return {**summary, "skipped": False, "image_id": image_id, "cache_from": sources,
+            "timings": _rounded(timings), "steps": [_rounded(step) for step in steps],
+            "cached_steps": sum(1 for step in steps if step["cached"])}
+
+
+def _track_step(steps: List[Dict[str, Any]], line: str, now: float):
+    match = _STEP_RE.match(line)
+    if match:
+        if steps:
+            steps[-1]["seconds"] = now - steps[-1].pop("_start")
+        steps.append({"step": int(match.group(1)), "instruction": match.group(3), "cached": False, "_start": now})
+    elif steps and "Using cache" in line:
+        steps[-1]["cached"] = True
+
+
+def _rounded(values: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: round(value, 4) if isinstance(value, float) else value for key, value in values.items()}
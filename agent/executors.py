@@ -0,0 +1,67 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from .latency import add_phase
+
+# Blocking file I/O runs on a bounded thread pool so a slow disk can't stall
+# the event loop; GIL-bound parsing runs on a process pool.
+IO_WORKERS = int(os.environ.get('AGENT_IO_WORKERS', str(min(32, (os.cpu_count() or 1) + 4))))
+CPU_WORKERS = int(os.environ.get('AGENT_CPU_WORKERS', os.environ.get('AGENT_PDF_WORKERS', str(os.cpu_count() or 1))))
+
+_io_pool = None
+_cpu_pool = None
+_pools_lock = threading.Lock()
+
+
+def get_io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    with _pools_lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='agent-io')
+        return _io_pool
+
+
+def get_cpu_pool() -> ProcessPoolExecutor:
+    global _cpu_pool
+    with _pools_lock:
+        if _cpu_pool is None:
+            # spawn: forking a process that runs server and watcher threads is unsafe
+            _cpu_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _cpu_pool
+
+
+async def run_io(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking call on the I/O pool and await its result.
+
+    The call runs in a copy of the caller's context, so phase timings
+    reach the caller's collector; time spent waiting for a free worker is
+    recorded as the 'queue' phase.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(func, *args, **kwargs)
+    submitted = time.perf_counter()
+
+    def run():
+        add_phase('queue', time.perf_counter() - submitted)
+        return call()
+
+    return await loop.run_in_executor(get_io_pool(), context.run, run)
+
+
+def shutdown_pools():
+    global _io_pool, _cpu_pool
+    with _pools_lock:
+        io_pool, cpu_pool = _io_pool, _cpu_pool
+        _io_pool = _cpu_pool = None
+    if io_pool is not None:
+        io_pool.shutdown(wait=True)
+    if cpu_pool is not None:
+        cpu_pool.shutdown(wait=True, cancel_futures=True)
@@ -2,38 +2,209 @@ import yaml
 from docx import Document
 from PyPDF2 import PdfReader
 import pandas as pd
+import copy
+import io
+import itertools
+import os
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Union
 from loguru import logger
 
+from .executors import CPU_WORKERS, get_cpu_pool
+from .latency import phase
+from .parse_cache import ParseCache, content_hash
+
+PARSERS = {'.yaml': 'yaml', '.yml': 'yaml', '.docx': 'docx', '.pdf': 'pdf'}
+PARSE_CACHE_DISK = os.environ.get('AGENT_PARSE_CACHE_DISK', '1') != '0'
+# Least recently used entries are deleted once the on-disk cache passes this size
+PARSE_CACHE_DISK_BYTES = int(os.environ.get('AGENT_PARSE_CACHE_DISK_BYTES', str(512 * 1024 * 1024)))
+# PDFs with at least this many pages (in the requested range) are extracted on a process pool
+PDF_PARALLEL_PAGES = int(os.environ.get('AGENT_PDF_PARALLEL_PAGES', '64'))
+PDF_WORKERS = int(os.environ.get('AGENT_PDF_WORKERS', str(CPU_WORKERS)))
+# Documents at least this large are parsed on the process pool instead of in the calling thread
+PARSE_OFFLOAD_BYTES = int(os.environ.get('AGENT_PARSE_OFFLOAD_BYTES', str(256 * 1024)))
+
+def _read_yaml(data: bytes) -> Dict[str, Any]:
+    return {"content": yaml.safe_load(data), "type": "yaml"}
+
+def _read_docx(data: bytes) -> Dict[str, Any]:
+    doc = Document(io.BytesIO(data))
+    content = [paragraph.text for paragraph in doc.paragraphs]
+    return {"content": content, "type": "docx"}
+
+def _source_size(source: Union[bytes, str]) -> int:
+    return len(source) if isinstance(source, bytes) else os.path.getsize(source)
+
+def _extract_pdf_pages(source: Union[bytes, str], start: int, stop: int) -> List[Tuple[int, str]]:
+    """Worker: text of pages [start, stop) of a PDF given as bytes or a path."""
+    reader = PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+    return [(i, reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+def iter_pdf_pages(source: Union[bytes, str, Path], start: int = 0, stop: Optional[int] = None,
+                   workers: int = PDF_WORKERS) -> Iterator[Tuple[int, str]]:
+    """Yield (page_index, text) for pages [start, stop), in order, extracting each page once.
+
+    Large ranges are split into batches on a process pool with a bounded
+    number in flight, so memory stays proportional to the window rather
+    than the document.
+    """
+    if isinstance(source, Path):
+        source = str(source)
+    reader = PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+    total = len(reader.pages)
+    start = max(0, start)
+    stop = total if stop is None else min(stop, total)
+    count = stop - start
+    if count <= 0:
+        return
+    if workers <= 1:
+        for i in range(start, stop):
+            yield i, reader.pages[i].extract_text() or ""
+        return
+    if count < PDF_PARALLEL_PAGES:
+        if _source_size(source) < PARSE_OFFLOAD_BYTES:
+            for i in range(start, stop):
+                yield i, reader.pages[i].extract_text() or ""
+        else:
+            # Too few pages to split, but enough work to hold the GIL for a while
+            yield from get_cpu_pool().submit(_extract_pdf_pages, source, start, stop).result()
+        return
+
+    spooled = None
+    if isinstance(source, bytes):
+        # Workers get a path rather than a pickled copy of the document per batch
+        with tempfile.NamedTemporaryFile(prefix='agent-pdf-', suffix='.pdf', delete=False) as f:
+            f.write(source)
+        spooled = source = f.name
+    pool = get_cpu_pool()
+    batch = max(8, -(-count // (workers * 2)))
+    batches = iter(range(start, stop, batch))
+    in_flight = deque()
+    try:
+        for b in itertools.islice(batches, workers * 2):
+            in_flight.append(pool.submit(_extract_pdf_pages, source, b, min(b + batch, stop)))
+        while in_flight:
+            future = in_flight.popleft()
+            b = next(batches, None)
+            if b is not None:
+                in_flight.append(pool.submit(_extract_pdf_pages, source, b, min(b + batch, stop)))
+            yield from future.result()
+    finally:
+        # The consumer may stop early; don't leave batches queued behind it
+        for future in in_flight:
+            future.cancel()
+        if spooled is not None:
+            os.unlink(spooled)
+
 class FileHandler:
-    def __init__(self, workspace_path: Path):
+    def __init__(self, workspace_path: Path, hash_memo_size: int = 4096):
         self.workspace = workspace_path
+        # Parsed YAML/DOCX/PDF content is cached by content hash. The path ->
+        # hash memo spares re-hashing files whose stat hasn't changed; the
+        # workspace watcher also calls invalidate() as files change.
+        disk_dir = workspace_path / '.devops-agent' / 'parse-cache' if PARSE_CACHE_DISK else None
+        self.parse_cache = ParseCache(disk_dir=disk_dir, disk_max_bytes=PARSE_CACHE_DISK_BYTES)
+        self.hash_memo_size = hash_memo_size
+        self._hashes = OrderedDict()
+        self._hashes_lock = threading.Lock()
+        self._parsing: Dict[Tuple[str, str], Future] = {}
+        self._parsing_lock = threading.Lock()
+
+    def invalidate(self, filepath: Optional[str] = None):
+        """Forget the content hash of one workspace-relative path, or of all paths."""
+        with self._hashes_lock:
+            if filepath is None:
+                self._hashes.clear()
+            else:
+                self._hashes.pop(Path(filepath).as_posix(), None)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        stats = self.parse_cache.stats()
+        stats["hashed_paths"] = len(self._hashes)
+        return stats
 
     def read_file(self, filepath: str) -> Dict[str, Any]:
         """Read various file types and return their content"""
         file_path = self.workspace / filepath
-        if not file_path.exists():
+        try:
+            st = file_path.stat()
+        except FileNotFoundError:
+            self.invalidate(filepath)
             raise FileNotFoundError(f"File {filepath} not found")
 
-        file_extension = file_path.suffix.lower()
+        parser = PARSERS.get(file_path.suffix.lower())
         try:
-            if file_extension == '.yaml' or file_extension == '.yml':
-                return self._read_yaml(file_path)
-            elif file_extension == '.docx':
-                return self._read_docx(file_path)
-            elif file_extension == '.pdf':
-                return self._read_pdf(file_path)
-            else:
+            if parser is None:
                 return self._read_text(file_path)
+
+            key = Path(filepath).as_posix()
+            signature = (st.st_mtime_ns, st.st_size)
+            with self._hashes_lock:
+                memo = self._hashes.get(key)
+            data = None
+            if memo is not None and memo[0] == signature:
+                digest = memo[1]
+            else:
+                data = file_path.read_bytes()
+                digest = content_hash(data)
+                self._remember_hash(key, signature, digest)
+
+            cached = self.parse_cache.get(digest, parser)
+            if cached is not None:
+                return cached
+            if data is None:
+                data = file_path.read_bytes()
+                digest = content_hash(data)
+                self._remember_hash(key, signature, digest)
+
+            # Concurrent reads of the same uncached content wait for one parse
+            with self._parsing_lock:
+                pending = self._parsing.get((digest, parser))
+                owner = pending is None
+                if owner:
+                    pending = self._parsing[(digest, parser)] = Future()
+            if not owner:
+                # Every waiter shares the future's value; hand each its own copy
+                return copy.deepcopy(pending.result())
+            try:
+                value = self.parse_cache.put(digest, parser, self._parse(parser, data))
+                pending.set_result(value)
+                return copy.deepcopy(value)
+            except BaseException as e:
+                pending.set_exception(e)
+                raise
+            finally:
+                with self._parsing_lock:
+                    del self._parsing[(digest, parser)]
         except Exception as e:
             logger.error(f"Error reading file {filepath}: {str(e)}")
             raise
 
+    def _parse(self, parser: str, data: bytes) -> Dict[str, Any]:
+        with phase('parse'):
+            if parser == 'pdf':
+                return self._read_pdf(data)
+            reader = _read_yaml if parser == 'yaml' else _read_docx
+            if len(data) >= PARSE_OFFLOAD_BYTES and CPU_WORKERS > 1:
+                return get_cpu_pool().submit(reader, data).result()
+            return reader(data)
+
+    def _remember_hash(self, key: str, signature, digest: str):
+        with self._hashes_lock:
+            self._hashes[key] = (signature, digest)
+            self._hashes.move_to_end(key)
+            while len(self._hashes) > self.hash_memo_size:
+                self._hashes.popitem(last=False)
+
     def write_file(self, filepath: str, content: Any, file_type: Optional[str] = None) -> Dict[str, str]:
         """Write content to various file types"""
         file_path = self.workspace / filepath
         file_path.parent.mkdir(parents=True, exist_ok=True)
+        self.invalidate(filepath)
 
         try:
             if file_type == 'yaml' or filepath.endswith(('.yaml', '.yml')):
@@ -49,42 +220,57 @@ class FileHandler:
     def analyze_yaml(self, content: str) -> Dict[str, Any]:
         """Analyze YAML content and provide suggestions"""
         try:
-            yaml_data = yaml.safe_load(content)
-            suggestions = []
-
-            # Check for common YAML best practices
-            if isinstance(yaml_data, dict):
-                if not yaml_data.get('version'):
-                    suggestions.append("Consider adding a 'version' field")
-                if not yaml_data.get('description'):
-                    suggestions.append("Consider adding a 'description' field")
-
-            return {
-                "valid": True,
-                "structure": yaml_data,
-                "suggestions": suggestions
-            }
+            with phase('parse'):
+                if len(content) >= PARSE_OFFLOAD_BYTES and CPU_WORKERS > 1:
+                    yaml_data = get_cpu_pool().submit(yaml.safe_load, content).result()
+                else:
+                    yaml_data = yaml.safe_load(content)
         except yaml.YAMLError as e:
-            return {
-                "valid": False,
-                "error": str(e),
-                "suggestions": ["Fix YAML syntax errors"]
-            }
+            return self._yaml_invalid(e)
+        return self._yaml_report(yaml_data)
 
-    def _read_yaml(self, file_path: Path) -> Dict[str, Any]:
-        with open(file_path, 'r') as f:
-            return {"content": yaml.safe_load(f), "type": "yaml"}
+    def analyze_yaml_file(self, filepath: str) -> Dict[str, Any]:
+        """Analyze a workspace YAML file, reusing its cached parse"""
+        try:
+            yaml_data = self.read_file(filepath)["content"]
+        except yaml.YAMLError as e:
+            return self._yaml_invalid(e)
+        return self._yaml_report(yaml_data)
 
-    def _read_docx(self, file_path: Path) -> Dict[str, Any]:
-        doc = Document(file_path)
-        content = [paragraph.text for paragraph in doc.paragraphs]
-        return {"content": content, "type": "docx"}
+    def _yaml_report(self, yaml_data: Any) -> Dict[str, Any]:
+        suggestions = []
 
-    def _read_pdf(self, file_path: Path) -> Dict[str, Any]:
-        reader = PdfReader(file_path)
-        content = [page.extract_text() for page in reader.pages]
+        # Check for common YAML best practices
+        if isinstance(yaml_data, dict):
+            if not yaml_data.get('version'):
+                suggestions.append("Consider adding a 'version' field")
+            if not yaml_data.get('description'):
+                suggestions.append("Consider adding a 'description' field")
+
+        return {
+            "valid": True,
+            "structure": yaml_data,
+            "suggestions": suggestions
+        }
+
+    def _yaml_invalid(self, error: Exception) -> Dict[str, Any]:
+        return {
+            "valid": False,
+            "error": str(error),
+            "suggestions": ["Fix YAML syntax errors"]
+        }
+
+    def _read_pdf(self, data: bytes) -> Dict[str, Any]:
+        content = [text for _, text in iter_pdf_pages(data)]
         return {"content": content, "type": "pdf"}
 
+    def stream_pdf(self, filepath: str, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """Lazily yield (page_index, text) for a page range of a workspace PDF."""
+        file_path = self.workspace / filepath
+        if not file_path.exists():
+            raise FileNotFoundError(f"File {filepath} not found")
+        return iter_pdf_pages(file_path, start, stop)
+
     def _read_text(self, file_path: Path) -> Dict[str, Any]:
         with open(file_path, 'r') as f:
             return {"content": f.read(), "type": "text"}
@@ -0,0 +1,73 @@
+import os
+from typing import Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+try:
+    from .latency import LATENCY_BUCKETS, QUANTILES, LatencyTracker
+except ImportError:
+    # Imported by the dashboard when run as a script
+    from latency import LATENCY_BUCKETS, QUANTILES, LatencyTracker
+
+# Set to a shared, empty directory when the agent runs under several worker
+# processes (e.g. `uvicorn --workers N`); each process then writes its
+# samples there and any worker's /metrics reports the sum across all of them.
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+# Every agent metric is registered here and nowhere else
+REGISTRY = CollectorRegistry()
+command_counter = Counter('devops_agent_commands_total', 'Total commands executed', registry=REGISTRY)
+file_operations = Counter('devops_agent_file_operations', 'File operations', ['operation'], registry=REGISTRY)
+execution_time_histogram = Histogram('devops_agent_execution_time', 'Command execution time', ['action'],
+                                     registry=REGISTRY, buckets=LATENCY_BUCKETS)
+phase_latency = Histogram('devops_agent_phase_seconds', 'Time spent in each phase (queue, io, parse, docker, ...) of a command',
+                          ['action', 'phase'], registry=REGISTRY, buckets=LATENCY_BUCKETS)
+file_operation_latency = Histogram('devops_agent_file_operation_seconds', 'File operation latency, including time queued for a worker',
+                                   ['operation'], registry=REGISTRY,
+                                   buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+# Summed over live workers in multiprocess mode
+memory_usage_gauge = Gauge('devops_agent_memory_usage_bytes', 'Memory usage in bytes', registry=REGISTRY,
+                           multiprocess_mode='livesum')
+
+# Sliding-window percentiles per (action, phase); 'total' is the whole command
+latency_tracker = LatencyTracker()
+
+
+class LatencyCollector:
+    """Exports the sliding-window percentiles as gauges, one per quantile."""
+
+    def collect(self):
+        family = GaugeMetricFamily('devops_agent_latency_window_seconds',
+                                   f'Latency percentiles over the last {latency_tracker.window:g}s',
+                                   labels=['action', 'phase', 'quantile'])
+        for action, phases in latency_tracker.snapshot().items():
+            for name, stats in phases.items():
+                for q in QUANTILES:
+                    family.add_metric([action, name, f"{q:g}"], stats[f"p{q * 100:g}"])
+        yield family
+
+
+REGISTRY.register(LatencyCollector())
+
+
+def metrics_payload() -> Tuple[bytes, str]:
+    """Body and content type for a Prometheus scrape.
+
+    In multiprocess mode the samples are merged from every worker's files.
+    Window percentiles are per process and can't be merged, so they are
+    left out there; use histogram_quantile() over the histograms instead.
+    """
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: Optional[int] = None):
+    """Drop a finished worker's live gauges from the multiprocess files."""
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(os.getpid() if pid is None else pid)
@@ -0,0 +1,394 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from loguru import logger
+
+JOB_WORKERS = int(os.environ.get("AGENT_JOB_WORKERS", "2"))
+JOB_HISTORY = int(os.environ.get("AGENT_JOB_HISTORY", "200"))
+JOB_LOG_LINES = int(os.environ.get("AGENT_JOB_LOG_LINES", "10000"))
+# Job state and logs live here so every worker process (uvicorn --workers N)
+# can list, follow and cancel any job, whichever process runs it
+JOB_DB = os.environ.get("AGENT_JOB_DB", "/workspace/.devops-agent/jobs.db")
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = {SUCCEEDED, FAILED, CANCELLED}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    result TEXT,
+    error TEXT,
+    log_written INTEGER NOT NULL DEFAULT 0,
+    owner TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created);
+CREATE TABLE IF NOT EXISTS job_logs (
+    job_id TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    line TEXT NOT NULL,
+    PRIMARY KEY (job_id, n)
+) WITHOUT ROWID;
+"""
+
+# Identifies the worker process that runs a job
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Job:
+    """A unit of background work with a bounded, followable log.
+
+    Log lines are numbered from the start of the job; once more than
+    `max_lines` have been written the oldest are dropped, and
+    `log_lines()` reports where the retained lines begin. With a store,
+    each line is also written there for other worker processes to read.
+    """
+
+    def __init__(self, kind: str, params: Optional[Dict[str, Any]] = None, max_lines: int = JOB_LOG_LINES,
+                 store: Optional["JobStore"] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.status = QUEUED
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self._lines = deque(maxlen=max_lines)
+        self._written = 0
+        self._lock = threading.Lock()
+        self._future: Optional[Future] = None
+        self._store = store
+        # True for a snapshot read from the store rather than the job being run here
+        self._remote = False
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row, store: "JobStore") -> "Job":
+        """Snapshot of a stored job; its log is read from the store."""
+        job = cls(row["kind"], json.loads(row["params"]), store=store)
+        job.id = row["id"]
+        job.status = row["status"]
+        job.created = row["created"]
+        job.started = row["started"]
+        job.finished = row["finished"]
+        job.result = json.loads(row["result"]) if row["result"] is not None else None
+        job.error = row["error"]
+        job._written = row["log_written"]
+        job._remote = True
+        return job
+
+    def log(self, line: str):
+        parts = line.rstrip("\n").split("\n")
+        with self._lock:
+            first = self._written
+            self._lines.extend(parts)
+            self._written += len(parts)
+        if self._store is not None:
+            self._store.append_lines(self.id, first, parts)
+
+    def log_lines(self, since: int = 0) -> Dict[str, Any]:
+        """Lines numbered `since` onward that are still retained, and the number to ask for next."""
+        if self._remote:
+            return self._store.read_lines(self.id, since)
+        with self._lock:
+            start = self._written - len(self._lines)
+            skip = max(since - start, 0)
+            lines = list(self._lines)[skip:] if skip < len(self._lines) else []
+            return {"lines": lines, "first": max(since, start), "next": self._written}
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED
+
+    def summary(self) -> Dict[str, Any]:
+        end = self.finished or time.time()
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "queued_seconds": round((self.started or end) - self.created, 3),
+            "run_seconds": round(end - self.started, 3) if self.started else None,
+            "result": self.result,
+            "error": self.error,
+            "log_lines": self._written,
+        }
+
+
+
+
+def _owner_alive(owner: str) -> bool:
+    """False only for an owner on this host whose process has exited."""
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobStore:
+    """Job rows and log lines in SQLite, shared by every agent worker process.
+
+    Each thread gets its own connection; WAL lets other workers read a
+    log while the worker running the job appends to it. The database is
+    opened on first use, and jobs left queued or running by a worker that
+    has since exited are marked failed then.
+    """
+
+    def __init__(self, path: str = JOB_DB, max_lines: int = JOB_LOG_LINES):
+        self.path = Path(path)
+        self.max_lines = max_lines
+        self._local = threading.local()
+        self._reap_lock = threading.Lock()
+        self._reaped = False
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            with self._reap_lock:
+                if not self._reaped:
+                    self._reaped = True
+                    self._reap(conn)
+        return conn
+
+    def _reap(self, conn: sqlite3.Connection):
+        rows = conn.execute(f"SELECT id, owner FROM jobs WHERE status IN ('{QUEUED}', '{RUNNING}')").fetchall()
+        for row in rows:
+            if not _owner_alive(row["owner"]):
+                self.abandon(row["id"], "Agent worker exited before the job finished", conn)
+                logger.warning(f"Job {row['id']} was left unfinished by exited worker {row['owner']}")
+
+    def abandon(self, job_id: str, error: str, conn: Optional[sqlite3.Connection] = None):
+        """Fail a job that will never finish because its worker is gone."""
+        (conn or self.conn).execute(f"UPDATE jobs SET status = '{FAILED}', finished = ?, error = ? "
+                                    f"WHERE id = ? AND status IN ('{QUEUED}', '{RUNNING}')",
+                                    (time.time(), error, job_id))
+
+    def insert(self, job: Job):
+        self.conn.execute(
+            "INSERT INTO jobs (id, kind, params, status, created, owner) VALUES (?, ?, ?, ?, ?, ?)",
+            (job.id, job.kind, json.dumps(job.params, default=str), job.status, job.created, OWNER))
+
+    def claim(self, job_id: str, started: float) -> bool:
+        """Mark a queued job running; False if it was cancelled first."""
+        cursor = self.conn.execute(f"UPDATE jobs SET status = '{RUNNING}', started = ? "
+                                   f"WHERE id = ? AND status = '{QUEUED}'", (started, job_id))
+        return cursor.rowcount == 1
+
+    def finish(self, job: Job):
+        result = json.dumps(job.result, default=str) if job.result is not None else None
+        self.conn.execute("UPDATE jobs SET status = ?, finished = ?, result = ?, error = ? WHERE id = ?",
+                          (job.status, job.finished, result, job.error, job.id))
+
+    def cancel(self, job_id: str, finished: float) -> bool:
+        """Mark a queued job cancelled; False if it has already started or doesn't exist."""
+        cursor = self.conn.execute(f"UPDATE jobs SET status = '{CANCELLED}', finished = ? "
+                                   f"WHERE id = ? AND status = '{QUEUED}'", (finished, job_id))
+        return cursor.rowcount == 1
+
+    def append_lines(self, job_id: str, first: int, lines: List[str]):
+        conn = self.conn
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany("INSERT OR REPLACE INTO job_logs (job_id, n, line) VALUES (?, ?, ?)",
+                                 [(job_id, first + i, line) for i, line in enumerate(lines)])
+                written = first + len(lines)
+                conn.execute("UPDATE jobs SET log_written = MAX(log_written, ?) WHERE id = ?", (written, job_id))
+                if written > self.max_lines:
+                    conn.execute("DELETE FROM job_logs WHERE job_id = ? AND n < ?", (job_id, written - self.max_lines))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            # The job keeps its in-memory log; only other workers miss these lines
+            logger.warning(f"Could not store log lines of job {job_id}: {e}")
+
+    def read_lines(self, job_id: str, since: int = 0) -> Dict[str, Any]:
+        conn = self.conn
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT log_written FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            rows = conn.execute("SELECT n, line FROM job_logs WHERE job_id = ? AND n >= ? ORDER BY n",
+                                (job_id, since)).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        return {"lines": [r["line"] for r in rows], "first": rows[0]["n"] if rows else since,
+                "next": row["log_written"] if row is not None else since}
+
+    def load(self, job_id: str) -> Optional[sqlite3.Row]:
+        return self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def rows(self, status: Optional[str] = None) -> List[sqlite3.Row]:
+        if status is None:
+            return self.conn.execute("SELECT * FROM jobs ORDER BY created DESC").fetchall()
+        return self.conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created DESC", (status,)).fetchall()
+
+    def counts(self) -> Dict[str, int]:
+        return {row["status"]: row["n"] for row in
+                self.conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+
+    def prune(self, history: int):
+        """Delete all but the `history` most recently finished jobs, with their logs."""
+        conn = self.conn
+        stale = [row["id"] for row in conn.execute(
+            f"SELECT id FROM jobs WHERE status IN ('{SUCCEEDED}', '{FAILED}', '{CANCELLED}') "
+            "ORDER BY finished DESC LIMIT -1 OFFSET ?", (history,))]
+        for job_id in stale:
+            conn.execute("DELETE FROM job_logs WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+
+class JobQueue:
+    """Runs jobs on a fixed pool of worker threads and keeps recent ones for inspection.
+
+    Jobs run in the process that queued them, but their state and logs go
+    through a shared JobStore, so get(), list(), follow() and cancel() work
+    from any agent worker process.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, history: int = JOB_HISTORY, store: Optional[JobStore] = None):
+        self.workers = max(1, workers)
+        self.history = history
+        self.store = store if store is not None else JobStore()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="agent-job")
+        # Jobs this process has queued and not yet finished
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, func: Callable[[Job], Any], params: Optional[Dict[str, Any]] = None) -> Job:
+        """Queue `func(job)`; its return value becomes the job result, an exception fails the job."""
+        job = Job(kind, params, store=self.store)
+        self.store.insert(job)
+        self.store.prune(self.history)
+        with self._lock:
+            self._jobs[job.id] = job
+        job._future = self._pool.submit(self._run, job, func)
+        return job
+
+    def _run(self, job: Job, func: Callable[[Job], Any]):
+        started = time.time()
+        if job.status == CANCELLED or not self.store.claim(job.id, started):
+            # Cancelled, possibly from another worker process
+            self._cancelled(job)
+            return
+        job.status = RUNNING
+        job.started = started
+        try:
+            job.result = func(job)
+            job.status = SUCCEEDED
+            logger.info(f"{job.kind} job {job.id} finished in {time.time() - job.started:.1f}s")
+        except Exception as e:
+            job.error = str(e)
+            job.log(f"ERROR: {e}")
+            job.status = FAILED
+            logger.error(f"{job.kind} job {job.id} failed: {str(e)}")
+        finally:
+            job.finished = time.time()
+            try:
+                self.store.finish(job)
+            finally:
+                self._forget(job)
+
+    def _cancelled(self, job: Job):
+        job.status = CANCELLED
+        job.finished = job.finished or time.time()
+        self._forget(job)
+
+    def _forget(self, job: Job):
+        with self._lock:
+            self._jobs.pop(job.id, None)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        row = self.store.load(job_id)
+        return Job.from_row(row, self.store) if row is not None else None
+
+    def list(self, status: Optional[str] = None) -> List[Job]:
+        rows = self.store.rows(status)
+        with self._lock:
+            local = dict(self._jobs)
+        return [local.get(row["id"]) or Job.from_row(row, self.store) for row in rows]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that hasn't started, whichever worker queued it; running jobs are left to finish."""
+        if not self.store.cancel(job_id, time.time()):
+            return False
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            job._future.cancel()
+            self._cancelled(job)
+        return True
+
+    async def wait(self, job: Job) -> Job:
+        """Wait for `job` to finish without tying up a thread."""
+        if job._future is not None and not job.done:
+            try:
+                await asyncio.wrap_future(job._future)
+            except asyncio.CancelledError:
+                if not job.done:
+                    raise
+        return job
+
+    async def follow(self, job: Job, since: int = 0, poll_interval: float = 0.25) -> AsyncIterator[str]:
+        """Yield log lines from `since` as they are written, until the job finishes."""
+        while True:
+            if job._remote:
+                job = self.get(job.id) or job
+            finished = job.done
+            chunk = job.log_lines(since)
+            for line in chunk["lines"]:
+                yield line
+            since = chunk["next"]
+            if finished:
+                return
+            await asyncio.sleep(poll_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "jobs": self.store.counts()}
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            unfinished = list(self._jobs)
+        # Other workers would otherwise show these as pending forever
+        for job_id in unfinished:
+            if not self.store.cancel(job_id, time.time()):
+                self.store.abandon(job_id, "Agent worker shut down before the job finished")
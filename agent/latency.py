@@ -0,0 +1,198 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Percentiles are over the last LATENCY_WINDOW seconds, kept as LATENCY_SLICES
+# sub-windows that expire one at a time.
+LATENCY_WINDOW = float(os.environ.get('AGENT_LATENCY_WINDOW', '300'))
+LATENCY_SLICES = int(os.environ.get('AGENT_LATENCY_SLICES', '10'))
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Prometheus buckets: file operations sit in the millisecond range, Docker
+# builds and test runs in the minutes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# HDR-style bins: fixed log-spaced edges from 1µs to 1h, each 2% wider than
+# the last, so any percentile is within ~1% of the true value
+_MIN_VALUE = 1e-6
+_MAX_VALUE = 3600.0
+_GROWTH = 1.02
+_LOG_GROWTH = math.log(_GROWTH)
+_BINS = int(math.ceil(math.log(_MAX_VALUE / _MIN_VALUE) / _LOG_GROWTH)) + 2
+
+
+def _bin(value: float) -> int:
+    """Bin 0 holds values below the range, the last bin values above it."""
+    if value < _MIN_VALUE:
+        return 0
+    return min(int(math.log(value / _MIN_VALUE) / _LOG_GROWTH) + 1, _BINS - 1)
+
+
+def _bin_value(index: np.ndarray) -> np.ndarray:
+    """Geometric middle of each bin."""
+    return _MIN_VALUE * _GROWTH ** (np.maximum(index, 1) - 0.5)
+
+
+def bin_indices(values: np.ndarray) -> np.ndarray:
+    """Bin of each value, as _bin() does for one."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        index = np.floor(np.log(values / _MIN_VALUE) / _LOG_GROWTH) + 1
+    return np.where(values < _MIN_VALUE, 0, np.minimum(index, _BINS - 1)).astype(np.int64)
+
+
+def bin_quantiles(bins: np.ndarray, counts: np.ndarray, maximum: float, quantiles=QUANTILES) -> np.ndarray:
+    """Quantile estimates from sample counts per bin (bins may repeat), capped at the largest sample."""
+    order = np.argsort(bins, kind='stable')
+    cumulative = np.cumsum(counts[order])
+    ranks = np.ceil(np.array(quantiles) * cumulative[-1])
+    return np.minimum(_bin_value(bins[order][np.searchsorted(cumulative, ranks)]), maximum)
+
+
+class WindowedQuantiles:
+    """Streaming percentiles over a sliding time window.
+
+    Samples are counted into fixed log-scale bins, one row of bins per
+    slice of the window. Adding a sample is one increment; reading sums
+    the live slices and walks the cumulative counts, so cost does not
+    grow with the number of samples.
+    """
+
+    def __init__(self, window: float = LATENCY_WINDOW, slices: int = LATENCY_SLICES):
+        self.slice_seconds = window / slices
+        self._counts = np.zeros((slices, _BINS), dtype=np.int64)
+        self._sums = np.zeros(slices)
+        self._maxima = np.zeros(slices)
+        # Slice number (time // slice_seconds) each row currently holds
+        self._epochs = np.full(slices, -1, dtype=np.int64)
+
+    def _row(self, now: float) -> int:
+        epoch = int(now // self.slice_seconds)
+        row = epoch % len(self._epochs)
+        if self._epochs[row] != epoch:
+            self._counts[row] = 0
+            self._sums[row] = 0.0
+            self._maxima[row] = 0.0
+            self._epochs[row] = epoch
+        return row
+
+    def add(self, value: float, now: float):
+        row = self._row(now)
+        self._counts[row, _bin(value)] += 1
+        self._sums[row] += value
+        if value > self._maxima[row]:
+            self._maxima[row] = value
+
+    def snapshot(self, now: float, quantiles=QUANTILES) -> Dict[str, float]:
+        live = self._epochs > int(now // self.slice_seconds) - len(self._epochs)
+        counts = self._counts[live].sum(axis=0)
+        total = int(counts.sum())
+        if not total:
+            return {'count': 0}
+        maximum = float(self._maxima[live].max())
+        estimates = bin_quantiles(np.arange(_BINS), counts, maximum, quantiles)
+        stats = {'count': total, 'mean': float(self._sums[live].sum() / total), 'max': maximum}
+        for q, estimate in zip(quantiles, estimates):
+            stats[f"p{q * 100:g}"] = float(estimate)
+        return stats
+
+
+class LatencyTracker:
+    """A WindowedQuantiles per (action, phase)."""
+
+    def __init__(self, window: float = LATENCY_WINDOW, slices: int = LATENCY_SLICES):
+        self.window = window
+        self.slices = slices
+        self._sketches: Dict[Tuple[str, str], WindowedQuantiles] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, action: str, phase: str, seconds: float, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            sketch = self._sketches.get((action, phase))
+            if sketch is None:
+                sketch = self._sketches[(action, phase)] = WindowedQuantiles(self.window, self.slices)
+            sketch.add(seconds, now)
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """{action: {phase: {count, mean, max, p50, p95, p99}}} for the current window."""
+        now = time.time() if now is None else now
+        result: Dict[str, Dict[str, Dict[str, float]]] = {}
+        with self._lock:
+            for (action, phase), sketch in sorted(self._sketches.items()):
+                stats = sketch.snapshot(now)
+                if stats['count']:
+                    result.setdefault(action, {})[phase] = stats
+        return result
+
+
+def percentile_table(labels: pd.Series, values: pd.Series, quantiles=QUANTILES) -> pd.DataFrame:
+    """Exact per-label count, mean, percentiles and max of raw samples, slowest p95 first."""
+    columns = ['label', 'count', 'mean'] + [f"p{q * 100:g}" for q in quantiles] + ['max']
+    samples = pd.DataFrame({'label': labels, 'value': values}).dropna()
+    if samples.empty:
+        return pd.DataFrame(columns=columns)
+    grouped = samples.groupby('label', observed=True)['value']
+    table = grouped.agg(['count', 'mean', 'max'])
+    for q in quantiles:
+        table[f"p{q * 100:g}"] = grouped.quantile(q)
+    return table.reset_index()[columns].sort_values(f"p{quantiles[1] * 100:g}", ascending=False, ignore_index=True)
+
+
+# -- per-phase timing ------------------------------------------------------
+
+# (timings of the command being run, name of the innermost open phase)
+_current: ContextVar[Optional[Tuple[Dict[str, float], Optional[str]]]] = ContextVar('latency_phases', default=None)
+
+
+@contextmanager
+def collect_phases() -> Iterator[Dict[str, float]]:
+    """Gather the `phase()` timings of everything run inside the block, including work sent to run_io."""
+    timings: Dict[str, float] = {}
+    token = _current.set((timings, None))
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def phase(name: str):
+    """Time the block as `name` for the enclosing collect_phases(), if any.
+
+    Phases are exclusive: time spent in a nested phase is taken off the
+    phase around it, so the phases of a command add up to at most its total.
+    """
+    state = _current.get()
+    if state is None:
+        yield
+        return
+    timings, parent = state
+    token = _current.set((timings, name))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _current.reset(token)
+        timings[name] = timings.get(name, 0.0) + elapsed
+        if parent is not None:
+            timings[parent] = timings.get(parent, 0.0) - elapsed
+
+
+def add_phase(name: str, seconds: float):
+    """Record time measured elsewhere (e.g. waiting for a worker) under `name`, like a nested phase."""
+    state = _current.get()
+    if state is None:
+        return
+    timings, parent = state
+    timings[name] = timings.get(name, 0.0) + seconds
+    if parent is not None:
+        timings[parent] = timings.get(parent, 0.0) - seconds
@@ -1,129 +1,377 @@
-from fastapi import FastAPI, HTTPException, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, File, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from loguru import logger
 import os
-from typing import Optional, Dict, Any
+import json
+from typing import Optional, Dict, Any, List
 import docker
 import git
 from pathlib import Path
 import time
 
+from .executors import run_io, shutdown_pools
+from .batch import run_batch
+from .docker_build import BUILD_TAG, ContextHasher, build_image
 from .file_handler import FileHandler
+from .instrumentation import latency_tracker, mark_process_dead, metrics_payload
+from .jobs import CANCELLED, FAILED, JobQueue
+from .latency import collect_phases, phase
+from .patching import PatchConflict, apply_edits, line_range_edit, parse_unified_diff, write_atomic
+from .metrics_log import METRICS_PERSIST, MetricsLog
+from .monitoring import MonitoringGuide
 from .streamlit_dashboard import MetricsManager
+from .workspace_index import WorkspaceIndex
+from .watcher import WorkspaceWatcher
+from .uploads import UPLOAD_CHUNK_SIZE, UPLOAD_MAX_BYTES, UploadTooLarge, resolve_target, save_stream
 
 app = FastAPI(title="DevOps Agent")
 
+AGENT_WATCH = os.environ.get("AGENT_WATCH", "1") != "0"
+AGENT_WATCH_POLL_INTERVAL = float(os.environ.get("AGENT_WATCH_POLL_INTERVAL", "2.0"))
+
+class Edit(BaseModel):
+    line_range: str
+    content: str = ""
+
 class Command(BaseModel):
     action: str
     filepath: Optional[str] = None
     content: Optional[str] = None
     line_range: Optional[str] = None
     file_type: Optional[str] = None
+    # write: several line-range edits, or a unified diff, applied in one pass
+    edits: Optional[List[Edit]] = None
+    patch: Optional[str] = None
+    # build/test: wait for the job to finish instead of returning its ID
+    wait: bool = False
+    # build: rebuild even if the image already matches the build context
+    force: bool = False
+
+class BatchCommand(Command):
+    # Indices of earlier commands in the batch to wait for, on top of the
+    # implicit per-file ordering
+    depends_on: Optional[List[int]] = None
+
+class BatchRequest(BaseModel):
+    commands: List[BatchCommand]
+    stop_on_error: bool = False
 
 class Agent:
     def __init__(self):
         self.docker_client = docker.from_env()
         self.workspace = Path("/workspace")
         self.file_handler = FileHandler(self.workspace)
-        self.metrics_manager = MetricsManager()
+        self.workspace_index = WorkspaceIndex(self.workspace, self.file_handler)
+        self.watcher = WorkspaceWatcher(self.workspace, poll_interval=AGENT_WATCH_POLL_INTERVAL)
+        self.watcher.subscribe(self._on_workspace_change)
+        self._index_primed = False
+        # The agent never charts its own samples; the dashboard charts from the log's rollups
+        self.metrics_manager = MetricsManager(log=MetricsLog() if METRICS_PERSIST else None, rollups=False)
+        self.jobs = JobQueue()
+        self.build_hasher = ContextHasher()
+
+    def _on_workspace_change(self, changed):
+        if changed is None:
+            self.file_handler.invalidate()
+            self.workspace_index.refresh()
+            return
+        for filepath in changed:
+            self.file_handler.invalidate(filepath)
+            self.workspace_index.update(filepath)
         
     async def execute_command(self, command: Command):
         start_time = time.time()
         try:
-            result = None
-            if command.action == "write":
-                result = await self._write_file(command.filepath, command.content, command.line_range, command.file_type)
-            elif command.action == "read":
-                result = await self._read_file(command.filepath)
-            elif command.action == "analyze":
-                result = await self._analyze_file(command.filepath, command.content)
-            elif command.action == "retrieve":
-                result = await self._retrieve_content(command.content)
-            elif command.action == "build":
-                result = await self._build()
-            elif command.action == "test":
-                result = await self._run_tests()
-            else:
-                raise ValueError(f"Unknown command: {command.action}")
+            with collect_phases() as phases:
+                result = await self._dispatch(command)
             
             # Record metrics
             execution_time = time.time() - start_time
-            self.metrics_manager.record_command(command.action, execution_time)
+            self.metrics_manager.record_command(command.action, execution_time, phases)
             return result
+        except PatchConflict as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error executing command: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
 
-    async def _write_file(self, filepath: str, content: str, line_range: Optional[str] = None):
+    async def _dispatch(self, command: Command):
+        if command.action == "write":
+            return await self._write_file(command.filepath, command.content, command.line_range, command.file_type,
+                                          command.edits, command.patch)
+        elif command.action == "read":
+            return await self._read_file(command.filepath)
+        elif command.action == "analyze":
+            return await self._analyze_file(command.filepath, command.content)
+        elif command.action == "retrieve":
+            return await self._retrieve_content(command.content)
+        elif command.action == "build":
+            return await self._build(command.wait, command.force)
+        elif command.action == "test":
+            return await self._run_tests(command.wait)
+        raise ValueError(f"Unknown command: {command.action}")
+
+    async def _offload(self, operation: str, func, *args, **kwargs):
+        """Run blocking work on the I/O pool and record its latency under `operation`."""
+        start = time.perf_counter()
+        try:
+            with phase("io"):
+                return await run_io(func, *args, **kwargs)
+        finally:
+            self.metrics_manager.record_file_operation(operation, time.perf_counter() - start)
+
+    async def _read_file(self, filepath: str):
+        if not filepath:
+            raise ValueError("Filepath is required for read operation")
+        return await self._offload("read", self.file_handler.read_file, filepath)
+
+    async def _analyze_file(self, filepath: Optional[str], content: Optional[str] = None):
+        return await self._offload("analyze", self._analyze_file_sync, filepath, content)
+
+    def _analyze_file_sync(self, filepath: Optional[str], content: Optional[str]):
+        if content is None:
+            if not filepath:
+                raise ValueError("Filepath or content is required for analyze operation")
+            if Path(filepath).suffix.lower() not in ('.yaml', '.yml'):
+                result = self.file_handler.read_file(filepath)
+                text = result["content"] if isinstance(result["content"], str) else "\n".join(filter(None, result["content"]))
+                return {"type": result["type"], "lines": text.count("\n") + 1, "characters": len(text)}
+            return self.file_handler.analyze_yaml_file(filepath)
+        return self.file_handler.analyze_yaml(content)
+
+    async def _write_file(self, filepath: str, content: str, line_range: Optional[str] = None, file_type: Optional[str] = None,
+                          edits: Optional[List[Edit]] = None, patch: Optional[str] = None):
         if not filepath:
             raise ValueError("Filepath is required for write operation")
-        
+        return await self._offload("write", self._write_file_sync, filepath, content, line_range, edits, patch)
+
+    def _write_file_sync(self, filepath: str, content: Optional[str], line_range: Optional[str],
+                         edits: Optional[List[Edit]], patch: Optional[str]):
         file_path = self.workspace / filepath
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        if line_range:
-            # Handle line range edits
-            start, end = map(int, line_range.split('-'))
-            with open(file_path, 'r') as f:
-                lines = f.readlines()
-            lines[start:end] = content.splitlines(True)
-            with open(file_path, 'w') as f:
-                f.writelines(lines)
+
+        if patch:
+            changes = parse_unified_diff(patch)
         else:
-            # Write entire file
-            with open(file_path, 'w') as f:
-                f.write(content)
-        
-        return {"status": "success", "message": f"File {filepath} written successfully"}
+            changes = [line_range_edit(edit.line_range, edit.content) for edit in edits or []]
+            if line_range:
+                changes.append(line_range_edit(line_range, content))
+
+        if changes:
+            # Streams the file once and renames the result into place
+            stored = apply_edits(file_path, changes)
+        else:
+            if content is None:
+                raise ValueError("Content is required for write operation")
+            stored = write_atomic(file_path, content)
+
+        # Don't wait for the watcher to notice our own write
+        self.file_handler.invalidate(filepath)
+        self.workspace_index.update(filepath)
+        return {"status": "success", "message": f"File {filepath} written successfully", **stored}
 
     async def _retrieve_content(self, query: str):
-        # Implement content retrieval logic
-        # This could search through files, logs, or other resources
-        pass
+        if not query:
+            raise ValueError("Query is required for retrieve operation")
+        results = await self._offload("retrieve", self._search_workspace, query)
+        return {"status": "success", "query": query, "results": results}
+
+    def _search_workspace(self, query: str):
+        # One full scan primes the index; after that the watcher keeps it current.
+        # Without a watcher, rescan per query (unchanged files cost one stat).
+        if not self._index_primed or not self.watcher.running:
+            self.workspace_index.refresh()
+            self._index_primed = True
+        return self.workspace_index.search(query)
+
+    async def _build(self, wait: bool = False, force: bool = False):
+        job = self.jobs.submit("build", lambda job: self._build_job(job, force), {"tag": BUILD_TAG, "force": force})
+        if not wait:
+            return {"status": "queued", "job_id": job.id, "message": "Build queued"}
+        with phase("job"):
+            await self.jobs.wait(job)
+        if job.status == CANCELLED:
+            raise HTTPException(status_code=409, detail=f"Build job {job.id} was cancelled")
+        if job.status == FAILED:
+            raise Exception(f"Build failed: {job.error}")
+        message = "Build skipped: image is up to date" if job.result["skipped"] else "Build completed successfully"
+        return {"status": "success", "job_id": job.id, "message": message, **job.result}
+
+    async def _run_tests(self, wait: bool = False):
+        job = self.jobs.submit("test", self._test_job, {"image": BUILD_TAG})
+        if not wait:
+            return {"status": "queued", "job_id": job.id, "message": "Tests queued"}
+        with phase("job"):
+            await self.jobs.wait(job)
+        if job.status == CANCELLED:
+            raise HTTPException(status_code=409, detail=f"Test job {job.id} was cancelled")
+        if job.status == FAILED:
+            raise Exception(f"Tests failed: {job.error}")
+        return {"status": "success", "job_id": job.id, "message": "Tests completed successfully"}
+
+    def _build_job(self, job, force: bool = False):
+        self.metrics_manager.record_phase("build", "job_queue", job.started - job.created)
+        result = build_image(self.docker_client, self.build_hasher, job.log, force=force)
+        for step, name in (("hash", "context_hash"), ("archive", "archive"), ("upload", "upload"), ("build", "docker")):
+            if step in result["timings"]:
+                self.metrics_manager.record_phase("build", name, result["timings"][step])
+        return result
 
-    async def _build(self):
+    def _test_job(self, job):
+        self.metrics_manager.record_phase("test", "job_queue", job.started - job.created)
+        start = time.perf_counter()
         try:
-            # Example: Build using docker
-            self.docker_client.images.build(
-                path=".",
-                tag="devops-agent:latest",
-                rm=True
-            )
-            return {"status": "success", "message": "Build completed successfully"}
-        except Exception as e:
-            raise Exception(f"Build failed: {str(e)}")
+            return self._run_test_container(job)
+        finally:
+            self.metrics_manager.record_phase("test", "docker", time.perf_counter() - start)
 
-    async def _run_tests(self):
+    def _run_test_container(self, job):
+        container = self.docker_client.containers.run(
+            BUILD_TAG,
+            command=["pytest"],
+            volumes={str(self.workspace): {'bind': '/app/tests', 'mode': 'ro'}},
+            detach=True
+        )
         try:
-            # Run tests in container
-            container = self.docker_client.containers.run(
-                "devops-agent:latest",
-                command=["pytest"],
-                volumes={str(self.workspace): {'bind': '/app/tests', 'mode': 'ro'}},
-                remove=True
-            )
-            return {"status": "success", "message": "Tests completed successfully"}
-        except Exception as e:
-            raise Exception(f"Tests failed: {str(e)}")
+            for line in container.logs(stream=True, follow=True):
+                job.log(line.decode("utf-8", errors="replace"))
+            exit_code = container.wait().get("StatusCode", 1)
+        finally:
+            container.remove(force=True)
+        if exit_code != 0:
+            raise Exception(f"pytest exited with status {exit_code}")
+        return {"exit_code": exit_code}
 
 agent = Agent()
 
+@app.on_event("startup")
+async def start_workspace_watcher():
+    if AGENT_WATCH:
+        agent.watcher.start()
+
+@app.on_event("shutdown")
+async def stop_workspace_watcher():
+    agent.watcher.stop()
+    agent.jobs.shutdown()
+    shutdown_pools()
+    if agent.metrics_manager.log is not None:
+        agent.metrics_manager.log.close()
+    mark_process_dead()
+
 @app.post("/execute")
 async def execute_command(command: Command):
     return await agent.execute_command(command)
 
+@app.post("/execute/batch")
+async def execute_batch(batch: BatchRequest):
+    """Run many commands in one round-trip: independent ones concurrently, same-file ones in order."""
+    try:
+        return await run_batch(batch.commands, agent.execute_command, stop_on_error=batch.stop_on_error)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _upload_stored(filepath: str, stored: Dict[str, Any]):
+    if not stored["deduplicated"]:
+        agent.file_handler.invalidate(filepath)
+        await run_io(agent.workspace_index.update, filepath)
+    return {"status": "success", "message": f"File {filepath} uploaded successfully", "filepath": filepath, **stored}
+
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     try:
-        contents = await file.read()
-        file_path = agent.workspace / file.filename
-        with open(file_path, 'wb') as f:
-            f.write(contents)
-        return {"status": "success", "message": f"File {file.filename} uploaded successfully"}
+        target = resolve_target(agent.workspace, file.filename)
+        filepath = target.relative_to(agent.workspace.resolve()).as_posix()
+
+        async def chunks():
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                yield chunk
+
+        stored = await save_stream(chunks(), target)
+        return await _upload_stored(filepath, stored)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.put("/upload/{filepath:path}")
+async def upload_raw(filepath: str, request: Request):
+    """Upload the raw request body to `filepath`, streamed straight from the socket."""
+    try:
+        target = resolve_target(agent.workspace, filepath)
+        declared = request.headers.get("content-length")
+        if declared is not None and int(declared) > UPLOAD_MAX_BYTES:
+            raise UploadTooLarge(f"Upload exceeds the {UPLOAD_MAX_BYTES} byte limit")
+        stored = await save_stream(request.stream(), target)
+        return await _upload_stored(target.relative_to(agent.workspace.resolve()).as_posix(), stored)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/files/pdf-pages")
+def stream_pdf_pages(filepath: str, start: int = 0, stop: Optional[int] = None):
+    """Stream a PDF's page text as NDJSON, one {"page", "text"} object per line."""
+    try:
+        pages = agent.file_handler.stream_pdf(filepath, start, stop)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    lines = (json.dumps({"page": i, "text": text}) + "\n" for i, text in pages)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+def _get_job(job_id: str):
+    job = agent.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@app.get("/jobs")
+async def list_jobs(status: Optional[str] = None):
+    return {**agent.jobs.stats(), "items": [job.summary() for job in agent.jobs.list(status)]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return _get_job(job_id).summary()
+
+@app.get("/jobs/{job_id}/logs")
+async def get_job_logs(job_id: str, since: int = 0, follow: bool = False):
+    """Job log lines from `since`; with follow=true, stream them as plain text until the job ends."""
+    job = _get_job(job_id)
+    if not follow:
+        return {"job_id": job.id, "status": job.status, **job.log_lines(since)}
+    lines = (line + "\n" async for line in agent.jobs.follow(job, since))
+    return StreamingResponse(lines, media_type="text/plain")
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = _get_job(job_id)
+    if not agent.jobs.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job.status} and can't be cancelled")
+    return _get_job(job_id).summary()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    body, content_type = metrics_payload()
+    return Response(body, media_type=content_type)
+
+@app.get("/metrics/latency")
+async def latency_metrics():
+    """Sliding-window p50/p95/p99 per action and phase ('total' is the whole command)."""
+    return {"window_seconds": latency_tracker.window, "actions": latency_tracker.snapshot()}
+
+@app.get("/metrics/operations")
+async def operation_metrics():
+    return agent.metrics_manager.operation_latency_stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {"parse_cache": agent.file_handler.cache_stats(), "workspace_index": agent.workspace_index.stats()}
+
 @app.get("/monitoring/guide")
 async def get_monitoring_guide():
     return JSONResponse(content=MonitoringGuide.get_setup_instructions())
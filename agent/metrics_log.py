@@ -0,0 +1,391 @@
+import json
+import math
+import os
+import threading
+import time
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer only
+    fcntl = None
+
+try:
+    from .latency import QUANTILES, bin_indices, bin_quantiles, percentile_table
+except ImportError:
+    # Imported by the dashboard when run as a script
+    from latency import QUANTILES, bin_indices, bin_quantiles, percentile_table
+
+METRICS_DIR = os.environ.get('AGENT_METRICS_DIR', '/workspace/.devops-agent/metrics')
+METRICS_PERSIST = os.environ.get('AGENT_METRICS_PERSIST', '1') != '0'
+SEGMENT_SECONDS = int(os.environ.get('AGENT_METRICS_SEGMENT_SECONDS', '3600'))
+RETENTION_DAYS = float(os.environ.get('AGENT_METRICS_RETENTION_DAYS', '30'))
+# Reads covering at most this many raw records scan them directly; longer ones use the rollups
+RAW_SCAN_RECORDS = int(os.environ.get('AGENT_METRICS_RAW_SCAN_RECORDS', '200000'))
+
+# Fixed-width record: epoch seconds, series id (crc32 of metric + label), value
+RECORD = np.dtype([('ts', '<f8'), ('series', '<u4'), ('value', '<f8')])
+# Bucket widths tried, finest first, when a range has too many points to plot raw
+BUCKET_WIDTHS = (10, 60, 600, 3600)
+# Widths kept next to each closed segment; 10s buckets are only needed for short windows
+ROLLUP_WIDTHS = (60, 600, 3600)
+ROLLUP_COLUMNS = ['timestamp', 'label', 'count', 'sum', 'mean', 'min', 'max', 'p95']
+# One bucket of one series
+ROLLUP_RECORD = np.dtype([('ts', '<f8'), ('series', '<u4'), ('count', '<u4'), ('sum', '<f8'),
+                          ('min', '<f8'), ('max', '<f8'), ('p95', '<f8')])
+# Samples of one series in one latency.py histogram bin
+HISTOGRAM_RECORD = np.dtype([('series', '<u4'), ('bin', '<u2'), ('count', '<u4')])
+
+
+def series_id(metric: str, label: str) -> int:
+    return zlib.crc32(f"{metric}\0{label}".encode())
+
+
+def _rollup(records: np.ndarray, width: int) -> np.ndarray:
+    """Raw records aggregated into `width`-second buckets per series, p95 interpolated as pandas does."""
+    series, values = records['series'], records['value']
+    buckets = (records['ts'] // width).astype(np.int64)
+    # Order by (series, bucket, value) with one plain argsort over a unique integer key
+    value_rank = np.empty(len(values), dtype=np.int64)
+    value_rank[np.argsort(values)] = np.arange(len(values))
+    _, series_rank = np.unique(series, return_inverse=True)
+    first = buckets.min() if len(buckets) else 0
+    span = int(buckets.max() - first) + 1 if len(buckets) else 1
+    order = np.argsort((series_rank.astype(np.int64) * span + (buckets - first)) * len(values) + value_rank)
+    series, buckets, values = series[order], buckets[order] * width, values[order]
+    starts = np.flatnonzero(np.r_[True, (series[1:] != series[:-1]) | (buckets[1:] != buckets[:-1])]) \
+        if len(order) else np.empty(0, dtype=np.int64)
+    counts = np.diff(np.r_[starts, len(order)])
+    position = (counts - 1) * 0.95
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, counts - 1)
+    rollup = np.empty(len(starts), dtype=ROLLUP_RECORD)
+    rollup['ts'] = buckets[starts]
+    rollup['series'] = series[starts]
+    rollup['count'] = counts
+    rollup['sum'] = np.add.reduceat(values, starts) if len(starts) else 0
+    rollup['min'] = values[starts]
+    rollup['max'] = values[starts + counts - 1]
+    rollup['p95'] = values[starts + low] + (values[starts + high] - values[starts + low]) * (position - low)
+    return rollup
+
+
+def _histogram(records: np.ndarray) -> np.ndarray:
+    """Raw records counted per (series, latency bin)."""
+    keys, counts = np.unique((records['series'].astype(np.uint64) << np.uint64(16))
+                             | bin_indices(records['value']).astype(np.uint64), return_counts=True)
+    histogram = np.empty(len(keys), dtype=HISTOGRAM_RECORD)
+    histogram['series'] = keys >> np.uint64(16)
+    histogram['bin'] = keys & np.uint64(0xffff)
+    histogram['count'] = counts
+    return histogram
+
+
+class MetricsLog:
+    """Append-only on-disk metric samples, split into one file per time segment.
+
+    Each sample is a 20-byte record written with a single O_APPEND write,
+    so several processes can log to the same directory and readers see
+    complete records without coordination. Range scans memory-map only the
+    segments that overlap the range. Segments older than the retention
+    period are deleted when a new segment is started. Series names live in
+    `series.json`, updated under a lock the first time a series is seen.
+    If the directory can't be written, the log warns once and drops samples.
+
+    Long ranges are read from rollups instead of raw records: the first
+    reader of a closed segment writes `<segment>.npz` beside it, holding
+    bucket aggregates at ROLLUP_WIDTHS and a log-scale histogram per
+    series. Only the segments at either end of a range are scanned raw.
+    """
+
+    def __init__(self, directory: str = METRICS_DIR, segment_seconds: int = SEGMENT_SECONDS,
+                 retention_days: float = RETENTION_DAYS):
+        self.directory = Path(directory)
+        self.segment_seconds = segment_seconds
+        self.retention = retention_days * 86400
+        self._series: Dict[int, Tuple[str, str]] = {}
+        self._fd: Optional[int] = None
+        self._segment: Optional[int] = None
+        self._lock = threading.Lock()
+        # Set when the directory can't be written; further samples are dropped
+        self.disabled = False
+        # Segment start -> (records rolled up, arrays of its .npz)
+        self._rollups: Dict[int, Tuple[int, Dict[str, np.ndarray]]] = {}
+
+    # -- writing -----------------------------------------------------------
+
+    def append(self, metric: str, label: str, value: float, timestamp: Optional[float] = None):
+        if self.disabled or value is None or math.isnan(value):
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        key = series_id(metric, label)
+        record = np.array([(timestamp, key, value)], dtype=RECORD).tobytes()
+        with self._lock:
+            if self.disabled:
+                return
+            try:
+                if key not in self._series:
+                    self._register(key, metric, label)
+                segment = int(timestamp // self.segment_seconds) * self.segment_seconds
+                if segment != self._segment:
+                    self._open_segment(segment)
+                os.write(self._fd, record)
+            except OSError as e:
+                # Metrics must never take the agent down; warn once rather than per sample
+                logger.warning(f"Could not write metrics log to {self.directory}, persistence disabled: {e}")
+                self.disabled = True
+
+    def _register(self, key: int, metric: str, label: str):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / 'series.json'
+        with open(self.directory / 'series.json.lock', 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            known = self._read_series(path)
+            if str(key) not in known:
+                known[str(key)] = [metric, label]
+                tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+                tmp.write_text(json.dumps(known))
+                os.replace(tmp, path)
+        self._series.update({int(k): tuple(v) for k, v in known.items()})
+
+    @staticmethod
+    def _read_series(path: Path) -> Dict[str, List[str]]:
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _open_segment(self, segment: int):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f'{segment:012d}.seg'
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._segment = segment
+        self.purge()
+
+    def purge(self, now: Optional[float] = None) -> int:
+        """Delete segments that ended before the retention horizon; returns how many."""
+        horizon = (time.time() if now is None else now) - self.retention
+        removed = 0
+        for start, path in self._segments():
+            if start + self.segment_seconds < horizon:
+                try:
+                    path.unlink()
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                try:
+                    path.with_suffix('.npz').unlink()
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+                self._segment = None
+
+    # -- reading -----------------------------------------------------------
+
+    def _segments(self) -> List[Tuple[int, Path]]:
+        segments = []
+        try:
+            entries = list(self.directory.iterdir())
+        except FileNotFoundError:
+            return segments
+        for path in entries:
+            if path.suffix == '.seg' and path.stem.isdigit():
+                segments.append((int(path.stem), path))
+        return sorted(segments)
+
+    def series(self) -> Dict[int, Tuple[str, str]]:
+        known = self._read_series(self.directory / 'series.json')
+        with self._lock:
+            self._series.update({int(k): tuple(v) for k, v in known.items()})
+            return dict(self._series)
+
+    def _keys(self, names: Dict[int, Tuple[str, str]], metric: str) -> np.ndarray:
+        return np.array([k for k, (m, _) in names.items() if m == metric], dtype='<u4')
+
+    @staticmethod
+    def _read(path: Path, since: float, until: float, keys: Optional[np.ndarray]) -> np.ndarray:
+        count = path.stat().st_size // RECORD.itemsize
+        if not count:
+            return np.empty(0, dtype=RECORD)
+        # A concurrent append may have left a partial record at the end; map whole records only
+        records = np.memmap(path, dtype=RECORD, mode='r', shape=(count,))
+        mask = (records['ts'] >= since) & (records['ts'] < until)
+        if keys is not None:
+            mask &= np.isin(records['series'], keys)
+        selected = np.array(records[mask])
+        del records
+        return selected
+
+    def scan(self, since: float, until: Optional[float] = None, metric: Optional[str] = None) -> pd.DataFrame:
+        """Samples with since <= ts < until, as columns ts (epoch seconds), metric, label, value."""
+        until = time.time() + 1 if until is None else until
+        names = self.series()
+        keys = self._keys(names, metric) if metric is not None else None
+        parts = [self._read(path, since, until, keys) for start, path in self._segments()
+                 if start + self.segment_seconds > since and start < until]
+        data = np.concatenate(parts) if parts else np.empty(0, dtype=RECORD)
+        # Decode each distinct series once rather than per row
+        keys, inverse = np.unique(data['series'], return_inverse=True)
+        decoded = [names.get(int(k), ('?', str(k))) for k in keys]
+        frame = pd.DataFrame({
+            'ts': data['ts'],
+            'metric': np.array([m for m, _ in decoded], dtype=object)[inverse],
+            'label': np.array([l for _, l in decoded], dtype=object)[inverse],
+            'value': data['value'],
+        })
+        return frame.sort_values('ts', ignore_index=True)
+
+    def _raw_records(self, since: float) -> int:
+        """Upper bound on the raw records a read from `since` to now would scan."""
+        total = 0
+        for start, path in self._segments():
+            if start + self.segment_seconds > since:
+                try:
+                    total += path.stat().st_size
+                except FileNotFoundError:
+                    pass
+        return total // RECORD.itemsize
+
+    def _segment_rollup(self, start: int, path: Path) -> Dict[str, np.ndarray]:
+        """Rollup arrays of a closed segment: from memory, its .npz, or built and saved now."""
+        count = path.stat().st_size // RECORD.itemsize
+        cached = self._rollups.get(start)
+        if cached is not None and cached[0] == count:
+            return cached[1]
+        target = path.with_suffix('.npz')
+        arrays = None
+        try:
+            with np.load(target) as saved:
+                # A late append to the segment makes the saved rollup stale
+                if int(saved['records']) == count:
+                    arrays = {name: saved[name] for name in saved.files}
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            pass
+        if arrays is None:
+            records = np.array(np.memmap(path, dtype=RECORD, mode='r', shape=(count,))) if count else \
+                np.empty(0, dtype=RECORD)
+            arrays = {'records': np.array(count), 'histogram': _histogram(records)}
+            for width in ROLLUP_WIDTHS:
+                arrays[f'w{width}'] = _rollup(records, width)
+            try:
+                tmp = target.with_suffix(f'.{os.getpid()}.tmp')
+                with open(tmp, 'wb') as f:
+                    np.savez(f, **arrays)
+                os.replace(tmp, target)
+            except OSError as e:
+                # A read-only log still works, with the rollup kept in memory only
+                logger.debug(f"Could not save rollup {target}: {e}")
+        self._rollups[start] = (count, arrays)
+        return arrays
+
+    def _split(self, since: float, until: float, keys: np.ndarray) -> Tuple[List[Dict[str, np.ndarray]], np.ndarray]:
+        """Rollups of the closed segments inside [since, until), and the raw records of the range's other segments."""
+        rollups, raw = [], []
+        segments = self._segments()
+        for start, path in segments:
+            end = start + self.segment_seconds
+            if end <= since or start >= until:
+                continue
+            try:
+                if start >= since and end <= until:
+                    rollups.append(self._segment_rollup(start, path))
+                else:
+                    raw.append(self._read(path, since, until, keys))
+            except FileNotFoundError:
+                # Purged while reading
+                continue
+        for start in set(self._rollups) - {start for start, _ in segments}:
+            self._rollups.pop(start, None)
+        return rollups, np.concatenate(raw) if raw else np.empty(0, dtype=RECORD)
+
+    def percentiles(self, series: str, window: float) -> pd.DataFrame:
+        """Per-label count, mean, p50/p95/p99 and max of `series` over the last `window` seconds.
+
+        Exact for windows short enough to scan raw; otherwise the
+        percentiles come from the rollup histograms (within ~1%).
+        """
+        now = time.time()
+        since = now - window
+        if self._raw_records(since) <= RAW_SCAN_RECORDS:
+            samples = self.scan(since, metric=series)
+            return percentile_table(samples['label'], samples['value'])
+        names = self.series()
+        keys = self._keys(names, series)
+        rollups, raw = self._split(since, now, keys)
+        histogram = np.concatenate([r['histogram'] for r in rollups] + [_histogram(raw)])
+        histogram = histogram[np.isin(histogram['series'], keys)]
+        totals = np.concatenate([r[f'w{ROLLUP_WIDTHS[-1]}'] for r in rollups] + [_rollup(raw, ROLLUP_WIDTHS[-1])])
+        totals = pd.DataFrame(totals[np.isin(totals['series'], keys)]).groupby('series').agg(
+            {'count': 'sum', 'sum': 'sum', 'max': 'max'})
+        bins, counts = histogram['bin'].astype(np.int64), histogram['count'].astype(np.int64)
+        owners = np.ascontiguousarray(histogram['series'])
+        rows = []
+        for key, count, total, maximum in totals.itertuples():
+            selected = owners == key
+            estimates = bin_quantiles(bins[selected], counts[selected], maximum)
+            rows.append([names.get(int(key), ('?', str(key)))[1], count, total / count, *estimates, maximum])
+        columns = ['label', 'count', 'mean'] + [f"p{q * 100:g}" for q in QUANTILES] + ['max']
+        table = pd.DataFrame(rows, columns=columns)
+        return table.sort_values(f"p{QUANTILES[1] * 100:g}", ascending=False, ignore_index=True)
+
+    def timeseries(self, series: str, window: float, max_points: int = 2000):
+        """(resolution, frame) for the last `window` seconds of `series`, in the rollup layout.
+
+        Short windows are scanned raw: the samples themselves if there are
+        at most `max_points`, otherwise buckets of the finest width that
+        fits. Longer windows read those buckets from the segment rollups.
+        """
+        now = time.time()
+        since = now - window
+        width = next((w for w in BUCKET_WIDTHS if window / w <= max_points), BUCKET_WIDTHS[-1])
+        if width not in ROLLUP_WIDTHS or self._raw_records(since) <= RAW_SCAN_RECORDS:
+            return self._raw_timeseries(series, since, width, max_points)
+        names = self.series()
+        keys = self._keys(names, series)
+        rollups, raw = self._split(since, now, keys)
+        data = np.concatenate([r[f'w{width}'] for r in rollups] + [_rollup(raw, width)])
+        data = data[np.isin(data['series'], keys)]
+        keys, inverse = np.unique(data['series'], return_inverse=True)
+        frame = pd.DataFrame(data)
+        frame['label'] = np.array([names.get(int(k), ('?', str(k)))[1] for k in keys], dtype=object)[inverse]
+        # A bucket that spans two segments has a row from each; p95 can only be bounded
+        frame = frame.groupby(['ts', 'label'], as_index=False).agg(
+            {'count': 'sum', 'sum': 'sum', 'min': 'min', 'max': 'max', 'p95': 'max'})
+        frame['mean'] = frame['sum'] / frame['count']
+        frame['timestamp'] = pd.to_datetime(frame['ts'], unit='s')
+        return f"{width}s", frame[ROLLUP_COLUMNS]
+
+    def _raw_timeseries(self, series: str, since: float, width: int, max_points: int):
+        samples = self.scan(since, metric=series)
+        if len(samples) <= max_points:
+            values = samples['value']
+            frame = pd.DataFrame({
+                'timestamp': pd.to_datetime(samples['ts'], unit='s'),
+                'label': samples['label'],
+                'count': 1,
+                'sum': values, 'mean': values, 'min': values, 'max': values, 'p95': values,
+            }, columns=ROLLUP_COLUMNS)
+            return 'raw', frame
+        samples['bucket'] = (samples['ts'] // width) * width
+        grouped = samples.groupby(['bucket', 'label'], observed=True)['value']
+        frame = grouped.agg(['count', 'sum', 'mean', 'min', 'max']).join(grouped.quantile(0.95).rename('p95'))
+        frame = frame.reset_index().rename(columns={'bucket': 'timestamp'})
+        frame['timestamp'] = pd.to_datetime(frame['timestamp'], unit='s')
+        return f"{width}s", frame[ROLLUP_COLUMNS]
@@ -1,20 +1,15 @@
 from dash import Dash, html, dcc
 import plotly.express as px
-from prometheus_client import start_http_server, Counter, Gauge, Histogram
 import pandas as pd
 from pathlib import Path
 import time
 from typing import Dict, Any
 from loguru import logger
 
+from .instrumentation import command_counter, execution_time_histogram, file_operations, memory_usage_gauge
+
 class MonitoringDashboard:
     def __init__(self):
-        # Prometheus metrics
-        self.command_counter = Counter('devops_agent_commands_total', 'Total commands executed')
-        self.file_operations = Counter('devops_agent_file_operations', 'File operations', ['operation'])
-        self.execution_time = Histogram('devops_agent_execution_time', 'Command execution time')
-        self.memory_usage = Gauge('devops_agent_memory_usage_bytes', 'Memory usage in bytes')
-
         # Initialize Dash app
         self.app = Dash(__name__)
         self.setup_dashboard()
@@ -55,23 +50,22 @@ class MonitoringDashboard:
 
     def start(self, port: int = 8050):
         """Start the monitoring dashboard"""
-        # Start Prometheus metrics server
-        start_http_server(9090)
+        # Prometheus scrapes the agent's own /metrics route; no separate metrics server
         # Start Dash server
         self.app.run_server(debug=True, port=port)
 
     def record_command(self, command: str, execution_time: float):
         """Record command execution metrics"""
-        self.command_counter.inc()
-        self.execution_time.observe(execution_time)
+        command_counter.inc()
+        execution_time_histogram.labels(action=command).observe(execution_time)
 
     def record_file_operation(self, operation: str):
         """Record file operation metrics"""
-        self.file_operations.labels(operation=operation).inc()
+        file_operations.labels(operation=operation).inc()
 
     def update_memory_usage(self, usage: float):
         """Update memory usage gauge"""
-        self.memory_usage.set(usage)
+        memory_usage_gauge.set(usage)
 
 class MonitoringGuide:
     @staticmethod
@@ -94,8 +88,10 @@ class MonitoringGuide:
                 {
                     "step": 2,
                     "title": "Configure Prometheus",
-                    "description": "Access Prometheus metrics at:",
-                    "code": "http://localhost:9090/metrics"
+                    "description": "Point Prometheus at the agent's metrics route. When running several "
+                                   "uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty directory "
+                                   "shared by the workers so every scrape reports all of them:",
+                    "code": "http://localhost:8000/metrics"
                 },
                 {
                     "step": 3,
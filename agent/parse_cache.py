@@ -0,0 +1,171 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+# Bump when a parser's output shape changes so stale disk entries are ignored
+PARSER_VERSION = 2
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ParseCache:
+    """Extracted file content keyed by (content hash, parser).
+
+    Identical bytes parse once no matter which path they are read from.
+    Results live in an in-memory LRU bounded by entry count and serialized
+    size, and optionally as JSON files under `disk_dir` so they survive
+    restarts. JSON rather than pickle: the directory sits in a workspace
+    that API clients can write to. Values JSON can't reproduce exactly
+    (non-string keys, dates, tuples) stay in memory only, so a hit always
+    equals what the parser returned. The disk tier is kept under
+    `disk_max_bytes` by deleting the least recently used files (hits touch
+    their file's mtime). Callers get their own deep copy of every value.
+    """
+
+    def __init__(self, disk_dir: Optional[Path] = None, max_entries: int = 128, max_bytes: int = 256 * 1024 * 1024,
+                 disk_max_bytes: int = 512 * 1024 * 1024):
+        self.disk_dir = disk_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        # Bytes on disk, counted on the first write and kept up to date after
+        self._disk_bytes: Optional[int] = None
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(digest: str, parser: str) -> str:
+        return f"{digest}-{parser}-v{PARSER_VERSION}"
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def get(self, digest: str, parser: str) -> Optional[Dict[str, Any]]:
+        key = self._key(digest, parser)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[0])
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            try:
+                raw = path.read_text()
+                value = json.loads(raw)
+                os.utime(path)
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._remember(key, value, len(raw))
+                    self.hits += 1
+                    self.disk_hits += 1
+                return copy.deepcopy(value)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, digest: str, parser: str, value: Dict[str, Any]) -> Dict[str, Any]:
+        key = self._key(digest, parser)
+        try:
+            raw = json.dumps(value)
+            durable = json.loads(raw) == value
+        except (TypeError, ValueError):
+            raw, durable = repr(value), False
+        with self._lock:
+            self._remember(key, value, len(raw))
+        if durable and self.disk_dir is not None:
+            self._write_disk(key, raw)
+        return value
+
+    def _write_disk(self, key: str, raw: str):
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_text(raw)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write parse cache entry {key}: {e}")
+            return
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self._disk_bytes += len(raw)
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self.prune_disk()
+
+    def _disk_entries(self) -> List[Tuple[float, int, Path]]:
+        entries = []
+        for path in self.disk_dir.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def prune_disk(self) -> int:
+        """Delete least recently used disk entries until 90% of the budget is left; returns how many."""
+        if self.disk_dir is None:
+            return 0
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.disk_max_bytes * 0.9)
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        with self._lock:
+            self._disk_bytes = total
+        return removed
+
+    def _remember(self, key: str, value: Dict[str, Any], size: int):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old[1]
+        self._memory[key] = (value, size)
+        self._memory_bytes += size
+        while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+            }
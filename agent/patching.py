@@ -0,0 +1,264 @@
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, List, Optional
+
+from .uploads import replacement_mode
+
+_HUNK_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+_BUFFER_SIZE = 1024 * 1024
+
+
+class PatchConflict(ValueError):
+    """A diff hunk's context or removed lines don't match the file."""
+
+
+class LineEdit:
+    """Replace lines [start, end) (0-based) with `lines`.
+
+    `expect`, when set, holds the lines the range must currently contain;
+    unified-diff hunks use it to refuse patching a file that has moved on.
+    """
+
+    __slots__ = ('start', 'end', 'lines', 'expect')
+
+    def __init__(self, start: int, end: int, lines: List[bytes], expect: Optional[List[bytes]] = None):
+        if start < 0 or end < start:
+            raise ValueError(f"Invalid line range {start}-{end}")
+        self.start = start
+        self.end = end
+        self.lines = lines
+        self.expect = expect
+
+
+def _encode_lines(content: str) -> List[bytes]:
+    return [line.encode('utf-8') for line in content.splitlines(True)]
+
+
+def line_range_edit(line_range: str, content: str) -> LineEdit:
+    """Edit for the write action's "start-end" syntax: slice semantics, like lines[start:end]."""
+    try:
+        start, end = map(int, line_range.split('-'))
+    except ValueError:
+        raise ValueError(f"Invalid line range: {line_range!r} (expected 'start-end')")
+    return LineEdit(start, end, _encode_lines(content or ''))
+
+
+def parse_unified_diff(diff: str) -> List[LineEdit]:
+    """Edits for the hunks of a single-file unified diff; file headers are ignored."""
+    edits = []
+    hunk = None
+    tag = ''
+    old_left = new_left = 0
+    for line in diff.splitlines(True):
+        if hunk is not None and line.startswith('\\'):
+            # "\ No newline at end of file": the line before it has no newline in the file
+            if tag in (' ', '+') and hunk.lines:
+                hunk.lines[-1] = hunk.lines[-1].rstrip(b'\r\n')
+            continue
+        if hunk is None or (old_left == 0 and new_left == 0):
+            match = _HUNK_RE.match(line)
+            if match:
+                old_start, old_left = int(match.group(1)), int(match.group(2) or 1)
+                new_left = int(match.group(4) or 1)
+                # A hunk that removes nothing names the line *before* the insertion point
+                start = old_start if old_left == 0 else old_start - 1
+                hunk = LineEdit(start, start + old_left, [], [])
+                edits.append(hunk)
+                tag = ''
+            # Anything else outside a hunk is a header or trailing noise
+            continue
+        tag, text = line[:1], line[1:].encode('utf-8')
+        if tag == ' ' or line in ('\n', '\r\n'):
+            text = text or b'\n'
+            hunk.expect.append(text)
+            hunk.lines.append(text)
+            old_left -= 1
+            new_left -= 1
+        elif tag == '-':
+            hunk.expect.append(text)
+            old_left -= 1
+        elif tag == '+':
+            hunk.lines.append(text)
+            new_left -= 1
+        else:
+            raise ValueError(f"Unexpected line in hunk at line {hunk.start + 1}: {line!r}")
+        if old_left < 0 or new_left < 0:
+            raise ValueError(f"Malformed hunk at line {hunk.start + 1}: header and body disagree")
+    if not edits:
+        raise ValueError("Patch contains no hunks")
+    if old_left or new_left:
+        raise ValueError(f"Truncated hunk at line {hunk.start + 1}")
+    return edits
+
+
+def _ordered(edits: Iterable[LineEdit]) -> List[LineEdit]:
+    ordered = sorted(edits, key=lambda e: (e.start, e.end))
+    for previous, current in zip(ordered, ordered[1:]):
+        if current.start < previous.end:
+            raise ValueError(f"Overlapping edits at lines {previous.start}-{previous.end} and {current.start}-{current.end}")
+    return ordered
+
+
+def _same_line(a: bytes, b: bytes) -> bool:
+    return a.rstrip(b'\r\n') == b.rstrip(b'\r\n')
+
+
+def _line_ending(path: Path) -> bytes:
+    """The file's line ending, judged by its first line; LF for new or one-line files."""
+    try:
+        with open(path, 'rb') as f:
+            first = f.readline()
+    except FileNotFoundError:
+        return b'\n'
+    return b'\r\n' if first.endswith(b'\r\n') else b'\n'
+
+
+def _with_ending(lines: List[bytes], eol: bytes) -> List[bytes]:
+    """`lines` with their line endings changed to `eol`, so edits match the file they go into."""
+    return [line.rstrip(b'\r\n') + eol if line.endswith(b'\n') else line for line in lines]
+
+
+def _check(edit: LineEdit, seen: List[bytes]):
+    if edit.expect is None:
+        return
+    if len(seen) != len(edit.expect) or not all(_same_line(a, b) for a, b in zip(seen, edit.expect)):
+        raise PatchConflict(f"Hunk at line {edit.start + 1} does not match the file")
+
+
+class _Writer:
+    """Hashing output that holds back the last emitted block until it knows
+    whether anything follows, so replacement text without a trailing newline
+    isn't glued onto the next original line."""
+
+    def __init__(self, out, eol: bytes = b'\n'):
+        self.out = out
+        self.eol = eol
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.lines = 0
+        self._held: List[bytes] = []
+
+    def _write(self, data: bytes):
+        self.out.write(data)
+        self.digest.update(data)
+        self.size += len(data)
+
+    def _release(self, more_follow: bool):
+        held, self._held = self._held, []
+        if more_follow and held and not held[-1].endswith(b'\n'):
+            held[-1] += self.eol
+        for line in held:
+            self._write(line)
+
+    def lines_out(self, lines: List[bytes]):
+        if lines:
+            self._release(True)
+            self._held = list(lines)
+            self.lines += len(lines)
+
+    def line_out(self, line: bytes):
+        """Pass one original line through (the hot path between edits)."""
+        if self._held:
+            self._release(True)
+        if line.endswith(b'\n'):
+            self._write(line)
+            self.lines += 1
+        else:
+            self.lines_out([line])
+
+    def copy_rest(self, source):
+        """Bulk-copy the remainder of `source`; no line splitting needed."""
+        first = source.read(_BUFFER_SIZE)
+        if not first:
+            return
+        self._release(True)
+        last = b''
+        chunk = first
+        while chunk:
+            self._write(chunk)
+            self.lines += chunk.count(b'\n')
+            last = chunk
+            chunk = source.read(_BUFFER_SIZE)
+        if not last.endswith(b'\n'):
+            self.lines += 1
+
+    def close(self):
+        self._release(False)
+
+
+@contextmanager
+def _atomic_output(path: Path):
+    """Binary file that replaces `path` (keeping its mode, or the umask default if new) only if the block completes."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb', buffering=_BUFFER_SIZE) as out:
+            yield out
+            out.flush()
+            os.fsync(out.fileno())
+        os.chmod(tmp, replacement_mode(path))
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def apply_edits(path: Path, edits: Iterable[LineEdit]) -> Dict[str, Any]:
+    """Apply `edits` to `path` in one streaming pass and atomically replace it.
+
+    Edits address lines of the original file and may come in any order.
+    Lines after the last edit are copied in bulk. Inserted lines take the
+    file's line ending (CRLF or LF). Returns the SHA-256, size and line
+    count of the new content.
+    """
+    eol = _line_ending(path)
+    pending = iter(_ordered(edits))
+    with _atomic_output(path) as out:
+        writer = _Writer(out, eol)
+        edit = next(pending, None)
+        seen: List[bytes] = []
+        if path.exists():
+            with open(path, 'rb', buffering=_BUFFER_SIZE) as source:
+                number = 0
+                while edit is not None:
+                    line = source.readline()
+                    if not line:
+                        break
+                    while edit is not None and number == edit.start == edit.end:
+                        writer.lines_out(_with_ending(edit.lines, eol))
+                        edit = next(pending, None)
+                    if edit is not None and edit.start <= number < edit.end:
+                        seen.append(line)
+                        if number == edit.end - 1:
+                            _check(edit, seen)
+                            writer.lines_out(_with_ending(edit.lines, eol))
+                            seen = []
+                            edit = next(pending, None)
+                    else:
+                        writer.line_out(line)
+                    number += 1
+                writer.copy_rest(source)
+        # Edits at or past the end of the file append, like a list slice would
+        while edit is not None:
+            _check(edit, seen)
+            writer.lines_out(_with_ending(edit.lines, eol))
+            seen = []
+            edit = next(pending, None)
+        writer.close()
+    return {"sha256": writer.digest.hexdigest(), "size": writer.size, "lines": writer.lines}
+
+
+def write_atomic(path: Path, content: str) -> Dict[str, Any]:
+    """Replace `path` with `content` via temp file + rename; same result shape as apply_edits."""
+    data = content.encode('utf-8')
+    with _atomic_output(path) as out:
+        out.write(data)
+    lines = data.count(b'\n') + (1 if data and not data.endswith(b'\n') else 0)
+    return {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data), "lines": lines}
@@ -0,0 +1,112 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Column kinds: 'time' is epoch nanoseconds shown as datetime64[ns] (UTC),
+# 'category' interns strings as int16 codes, anything else is a NumPy dtype.
+TIME = 'time'
+CATEGORY = 'category'
+
+
+class RingBuffer:
+    """Fixed-capacity columnar store for metric samples.
+
+    Each column is a preallocated NumPy array of twice the capacity, and
+    every value is written at `i` and `i + capacity`. The newest
+    `capacity` samples are therefore always one contiguous slice, so
+    appends are O(1) and `arrays()`/`frame()` hand out views without
+    copying or reassembling the ring. Views stay valid until the next
+    append overwrites the oldest slot.
+    """
+
+    def __init__(self, capacity: int, columns: Dict[str, str]):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.kinds = dict(columns)
+        self._data: Dict[str, np.ndarray] = {}
+        for name, kind in self.kinds.items():
+            dtype = np.int64 if kind == TIME else np.int16 if kind == CATEGORY else np.dtype(kind)
+            self._data[name] = np.zeros(2 * capacity, dtype=dtype)
+        self._categories: Dict[str, List[str]] = {name: [] for name, kind in self.kinds.items() if kind == CATEGORY}
+        self._codes: Dict[str, Dict[str, int]] = {name: {} for name in self._categories}
+        self._next = 0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return min(self.total, self.capacity)
+
+    def _code(self, column: str, value: str) -> int:
+        codes = self._codes[column]
+        code = codes.get(value)
+        if code is None:
+            if len(codes) >= np.iinfo(np.int16).max:
+                raise ValueError(f"Too many distinct values in column {column}")
+            code = codes[value] = len(codes)
+            self._categories[column].append(value)
+        return code
+
+    def append(self, timestamp: Optional[float] = None, **values: Any):
+        """Add one sample; `timestamp` (epoch seconds) defaults to now for every 'time' column."""
+        with self._lock:
+            now = time.time_ns() if timestamp is None else int(timestamp * 1e9)
+            i = self._next
+            for name, kind in self.kinds.items():
+                if kind == TIME:
+                    value = now
+                elif kind == CATEGORY:
+                    value = self._code(name, values[name])
+                else:
+                    value = values.get(name)
+                    if value is None:
+                        value = np.nan
+                column = self._data[name]
+                column[i] = value
+                column[i + self.capacity] = value
+            self._next = (i + 1) % self.capacity
+            self.total += 1
+
+    def _window(self) -> slice:
+        if self.total < self.capacity:
+            return slice(0, self.total)
+        return slice(self._next, self._next + self.capacity)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Oldest-first views of the raw columns (categories as codes)."""
+        with self._lock:
+            window = self._window()
+            return {name: column[window] for name, column in self._data.items()}
+
+    def categories(self, column: str) -> List[str]:
+        return list(self._categories[column])
+
+    def frame(self, since: Optional[float] = None) -> pd.DataFrame:
+        """Oldest-first DataFrame over the buffer, optionally only samples at or after `since` (epoch seconds)."""
+        with self._lock:
+            window = self._window()
+            categories = {name: list(values) for name, values in self._categories.items()}
+            views = {name: column[window] for name, column in self._data.items()}
+        time_column = next((name for name, kind in self.kinds.items() if kind == TIME), None)
+        if since is not None and time_column is not None:
+            # Timestamps are appended in order, so the cut is a binary search
+            start = int(np.searchsorted(views[time_column], int(since * 1e9), side='left'))
+            views = {name: view[start:] for name, view in views.items()}
+        columns = {}
+        for name, kind in self.kinds.items():
+            view = views[name]
+            if kind == TIME:
+                columns[name] = view.view('datetime64[ns]')
+            elif kind == CATEGORY:
+                columns[name] = pd.Categorical.from_codes(view, categories=categories[name])
+            else:
+                columns[name] = view
+        return pd.DataFrame(columns, copy=False)
+
+    def clear(self):
+        with self._lock:
+            self._next = 0
+            self.total = 0
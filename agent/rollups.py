@@ -0,0 +1,117 @@
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+# (bucket width, retention) in seconds
+RESOLUTIONS: Tuple[Tuple[int, int], ...] = (
+    (10, 6 * 3600),
+    (60, 2 * 86400),
+    (600, 30 * 86400),
+)
+# Relative width of the bins used to estimate percentiles (~5% error)
+_BIN_GROWTH = 1.1
+_LOG_GROWTH = math.log(_BIN_GROWTH)
+ROLLUP_COLUMNS = ['timestamp', 'label', 'count', 'sum', 'mean', 'min', 'max', 'p95']
+
+
+class _Bucket:
+    __slots__ = ('count', 'total', 'low', 'high', 'bins')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.low = math.inf
+        self.high = -math.inf
+        # Sparse log-scale histogram: bin index -> count (None holds values <= 0)
+        self.bins: Dict[Optional[int], int] = {}
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        if value < self.low:
+            self.low = value
+        if value > self.high:
+            self.high = value
+        key = int(math.floor(math.log(value) / _LOG_GROWTH)) if value > 0 else None
+        self.bins[key] = self.bins.get(key, 0) + 1
+
+    def quantile(self, q: float) -> float:
+        rank = q * self.count
+        seen = 0
+        keys = sorted(self.bins, key=lambda k: -math.inf if k is None else k)
+        for key in keys:
+            seen += self.bins[key]
+            if seen >= rank:
+                if key is None:
+                    return min(self.high, 0.0)
+                # Geometric middle of the bin, kept inside the observed range
+                estimate = _BIN_GROWTH ** (key + 0.5)
+                return min(max(estimate, self.low), self.high)
+        return self.high
+
+
+class RollupStore:
+    """Per-series aggregates at several bucket widths, updated as samples arrive.
+
+    Each sample updates one bucket per resolution (count, sum, min, max and
+    a sparse log histogram for p95), so long windows can be charted from a
+    few thousand buckets instead of every raw point. Buckets older than a
+    resolution's retention are dropped as new ones open.
+    """
+
+    def __init__(self, resolutions: Tuple[Tuple[int, int], ...] = RESOLUTIONS):
+        self.resolutions = tuple(sorted(resolutions))
+        # (metric, label) -> one OrderedDict of bucket start -> _Bucket per resolution
+        self._series: Dict[Tuple[str, str], List["OrderedDict[int, _Bucket]"]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, metric: str, label: str, value: float, timestamp: float):
+        if value is None or math.isnan(value):
+            return
+        with self._lock:
+            levels = self._series.get((metric, label))
+            if levels is None:
+                levels = self._series[(metric, label)] = [OrderedDict() for _ in self.resolutions]
+            for (width, retention), buckets in zip(self.resolutions, levels):
+                start = int(timestamp // width) * width
+                bucket = buckets.get(start)
+                if bucket is None:
+                    bucket = buckets[start] = _Bucket()
+                    horizon = start - retention
+                    while buckets:
+                        oldest = next(iter(buckets))
+                        if oldest >= horizon:
+                            break
+                        del buckets[oldest]
+                bucket.add(value)
+
+    def pick_resolution(self, window: float, max_points: int = 2000) -> int:
+        """Finest bucket width that covers `window` seconds in at most `max_points` buckets."""
+        for width, retention in self.resolutions:
+            if retention >= window and window / width <= max_points:
+                return width
+        return self.resolutions[-1][0]
+
+    def query(self, metric: str, since: float, width: int) -> pd.DataFrame:
+        """One row per (bucket, label) of `width` seconds for `metric` from `since` (epoch seconds) on."""
+        level = [w for w, _ in self.resolutions].index(width)
+        rows = []
+        with self._lock:
+            for (name, label), levels in self._series.items():
+                if name != metric:
+                    continue
+                for start, bucket in levels[level].items():
+                    if start + width <= since:
+                        continue
+                    rows.append((start, label, bucket.count, bucket.total, bucket.total / bucket.count,
+                                 bucket.low, bucket.high, bucket.quantile(0.95)))
+        frame = pd.DataFrame(rows, columns=ROLLUP_COLUMNS)
+        frame['timestamp'] = pd.to_datetime(frame['timestamp'], unit='s')
+        return frame.sort_values(['timestamp', 'label'], ignore_index=True)
+
+    def labels(self, metric: str) -> List[str]:
+        with self._lock:
+            return sorted(label for name, label in self._series if name == metric)
@@ -2,57 +2,186 @@ import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
-from datetime import datetime, timedelta
+import numpy as np
+import os
 import time
 import json
 from pathlib import Path
 import yaml
-from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, start_http_server
+from typing import Dict, Optional
 
-# Initialize Prometheus metrics
-REGISTRY = CollectorRegistry()
-command_counter = Counter('devops_agent_commands_total', 'Total commands executed', registry=REGISTRY)
-file_operations = Counter('devops_agent_file_operations', 'File operations', ['operation'], registry=REGISTRY)
-execution_time = Histogram('devops_agent_execution_time', 'Command execution time', registry=REGISTRY)
-memory_usage = Gauge('devops_agent_memory_usage_bytes', 'Memory usage in bytes', registry=REGISTRY)
+try:
+    from .instrumentation import (command_counter, execution_time_histogram, file_operation_latency,
+                                  file_operations, latency_tracker, memory_usage_gauge, phase_latency)
+    from .latency import percentile_table
+    from .metrics_log import METRICS_PERSIST, MetricsLog
+    from .ring_buffer import CATEGORY, TIME, RingBuffer
+    from .rollups import ROLLUP_COLUMNS, RollupStore
+except ImportError:
+    # Run directly with `streamlit run agent/streamlit_dashboard.py`
+    from instrumentation import (command_counter, execution_time_histogram, file_operation_latency,
+                                 file_operations, latency_tracker, memory_usage_gauge, phase_latency)
+    from latency import percentile_table
+    from metrics_log import METRICS_PERSIST, MetricsLog
+    from ring_buffer import CATEGORY, TIME, RingBuffer
+    from rollups import ROLLUP_COLUMNS, RollupStore
+
+# Samples kept per history; memory is fixed at roughly 36 bytes per slot per history
+METRICS_CAPACITY = int(os.environ.get('AGENT_METRICS_CAPACITY', '100000'))
+# Charts switch from raw samples to rollup buckets above this many points
+METRICS_MAX_POINTS = int(os.environ.get('AGENT_METRICS_MAX_POINTS', '2000'))
+
+TIME_RANGES = {"Last Hour": 3600, "Last 24 Hours": 86400, "Last 7 Days": 7 * 86400}
+
+# Series name -> (history, label column, value column)
+_SERIES = {
+    'commands': ('commands', 'command', 'execution_time'),
+    'file_ops': ('file_ops', 'operation', 'duration'),
+    'cpu_usage': ('performance', None, 'cpu_usage'),
+    'memory_usage': ('performance', None, 'memory_usage'),
+    # Labelled "<action>/<phase>"
+    'phases': ('phases', 'phase', 'seconds'),
+}
 
 class MetricsManager:
-    def __init__(self):
-        self.commands_history = []
-        self.file_ops_history = []
-        self.performance_history = []
+    """In-memory metric histories, optionally mirrored to an on-disk MetricsLog.
+
+    Rollups for charting are kept only when this manager is itself the
+    dashboard's data source; the agent passes rollups=False and the
+    dashboard charts from the log's segment rollups instead.
+    """
+
+    def __init__(self, capacity: int = METRICS_CAPACITY, log: Optional[MetricsLog] = None, rollups: bool = True):
+        self.log = log
+        self.commands = RingBuffer(capacity, {'timestamp': TIME, 'command': CATEGORY, 'execution_time': 'float64'})
+        self.file_ops = RingBuffer(capacity, {'timestamp': TIME, 'operation': CATEGORY, 'duration': 'float64'})
+        self.performance = RingBuffer(capacity, {'timestamp': TIME, 'cpu_usage': 'float64', 'memory_usage': 'float64'})
+        self.phases = RingBuffer(capacity, {'timestamp': TIME, 'phase': CATEGORY, 'seconds': 'float64'})
+        self.rollups = RollupStore() if rollups else None
 
-    def record_command(self, command: str, execution_time: float):
+    def record_command(self, command: str, execution_time: float, phases: Optional[Dict[str, float]] = None):
+        now = time.time()
         command_counter.inc()
-        execution_time.observe(execution_time)
-        self.commands_history.append({
-            'timestamp': datetime.now(),
-            'command': command,
-            'execution_time': execution_time
-        })
-
-    def record_file_operation(self, operation: str):
+        execution_time_histogram.labels(action=command).observe(execution_time)
+        latency_tracker.observe(command, 'total', execution_time, now)
+        self.commands.append(now, command=command, execution_time=execution_time)
+        if self.rollups is not None:
+            self.rollups.add('commands', command, execution_time, now)
+        if self.log is not None:
+            self.log.append('commands', command, execution_time, now)
+        for phase, seconds in (phases or {}).items():
+            self.record_phase(command, phase, seconds, now)
+
+    def record_phase(self, action: str, phase: str, seconds: float, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        # Exclusive phase times can come out a hair below zero from clock jitter
+        seconds = max(seconds, 0.0)
+        label = f"{action}/{phase}"
+        phase_latency.labels(action=action, phase=phase).observe(seconds)
+        latency_tracker.observe(action, phase, seconds, now)
+        self.phases.append(now, phase=label, seconds=seconds)
+        if self.rollups is not None:
+            self.rollups.add('phases', label, seconds, now)
+        if self.log is not None:
+            self.log.append('phases', label, seconds, now)
+
+    def record_file_operation(self, operation: str, duration: Optional[float] = None):
+        now = time.time()
         file_operations.labels(operation=operation).inc()
-        self.file_ops_history.append({
-            'timestamp': datetime.now(),
-            'operation': operation
-        })
+        if duration is not None:
+            file_operation_latency.labels(operation=operation).observe(duration)
+            if self.rollups is not None:
+                self.rollups.add('file_ops', operation, duration, now)
+            if self.log is not None:
+                self.log.append('file_ops', operation, duration, now)
+        self.file_ops.append(now, operation=operation, duration=duration)
+
+    def operation_latency_stats(self):
+        """Count and latency percentiles (seconds) per file operation."""
+        columns = self.file_ops.arrays()
+        codes, durations = columns['operation'], columns['duration']
+        timed = ~np.isnan(durations)
+        stats = {}
+        for code, operation in enumerate(self.file_ops.categories('operation')):
+            samples = durations[timed & (codes == code)]
+            if not samples.size:
+                continue
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            stats[operation] = {
+                'count': int(samples.size),
+                'mean': round(float(samples.mean()), 6),
+                'p50': round(float(p50), 6),
+                'p95': round(float(p95), 6),
+                'p99': round(float(p99), 6),
+            }
+        return stats
 
     def record_performance(self, cpu_usage: float, memory_usage: float):
-        memory_usage.set(memory_usage)
-        self.performance_history.append({
-            'timestamp': datetime.now(),
-            'cpu_usage': cpu_usage,
-            'memory_usage': memory_usage
-        })
-
-    def get_metrics_data(self):
+        now = time.time()
+        memory_usage_gauge.set(memory_usage)
+        self.performance.append(now, cpu_usage=cpu_usage, memory_usage=memory_usage)
+        if self.rollups is not None:
+            self.rollups.add('cpu_usage', '', cpu_usage, now)
+            self.rollups.add('memory_usage', '', memory_usage, now)
+        if self.log is not None:
+            self.log.append('cpu_usage', '', cpu_usage, now)
+            self.log.append('memory_usage', '', memory_usage, now)
+
+    def timeseries(self, series: str, window: float, max_points: int = METRICS_MAX_POINTS):
+        """(resolution, frame) for the last `window` seconds of `series`.
+
+        Raw samples are used while they cover the window in at most
+        `max_points` rows (or always, without rollups); otherwise the
+        coarsest-needed rollup buckets. Either way the frame has the
+        rollup columns (a raw sample is a bucket of one).
+        """
+        history_name, label_column, value_column = _SERIES[series]
+        history = getattr(self, history_name)
+        since = time.time() - window
+        raw = history.frame(since)
+        timestamps = history.arrays()['timestamp']
+        covers_window = history.total <= history.capacity or (len(timestamps) and timestamps[0] <= since * 1e9)
+        if self.rollups is None or (covers_window and len(raw) <= max_points):
+            values = raw[value_column]
+            frame = pd.DataFrame({
+                'timestamp': raw['timestamp'],
+                'label': raw[label_column].astype(str) if label_column else '',
+                'count': 1,
+                'sum': values, 'mean': values, 'min': values, 'max': values, 'p95': values,
+            }, columns=ROLLUP_COLUMNS)
+            return 'raw', frame.dropna(subset=['mean'])
+        width = self.rollups.pick_resolution(window, max_points)
+        return f"{width}s", self.rollups.query(series, since, width)
+
+    def percentiles(self, series: str, window: float) -> pd.DataFrame:
+        """Per-label count, mean, p50/p95/p99 and max over the raw samples of the last `window` seconds."""
+        history_name, label_column, value_column = _SERIES[series]
+        raw = getattr(self, history_name).frame(time.time() - window)
+        labels = raw[label_column].astype(str) if label_column else pd.Series('', index=raw.index)
+        return percentile_table(labels, raw[value_column])
+
+    def get_metrics_data(self, since: Optional[float] = None):
+        """DataFrame views over each history, optionally only samples since `since` (epoch seconds)."""
         return {
-            'commands': pd.DataFrame(self.commands_history),
-            'file_ops': pd.DataFrame(self.file_ops_history),
-            'performance': pd.DataFrame(self.performance_history)
+            'commands': self.commands.frame(since),
+            'file_ops': self.file_ops.frame(since),
+            'performance': self.performance.frame(since)
         }
 
+@st.cache_resource
+def metrics_source():
+    """Where every dashboard session reads metrics from.
+
+    With persistence on, that's the agent's on-disk log, so history survives
+    restarts, all sessions see the same data, and long ranges are charted
+    from the rollups written beside its segments. Otherwise one in-memory
+    MetricsManager, with its own rollups, is shared by all sessions of
+    this process.
+    """
+    if METRICS_PERSIST:
+        return MetricsLog()
+    return MetricsManager()
+
 def main():
     st.set_page_config(
         page_title="DevOps Agent Dashboard",
@@ -60,10 +189,6 @@ def main():
         layout="wide"
     )
 
-    # Initialize metrics manager
-    if 'metrics_manager' not in st.session_state:
-        st.session_state.metrics_manager = MetricsManager()
-
     # Sidebar
     st.sidebar.title("Dashboard Controls")
     time_range = st.sidebar.selectbox(
@@ -74,54 +199,81 @@ def main():
     # Main content
     st.title("DevOps Agent Monitoring Dashboard")
 
+    metrics = metrics_source()
+    window = TIME_RANGES[time_range]
+    commands_resolution, df_commands = metrics.timeseries('commands', window)
+    files_resolution, df_files = metrics.timeseries('file_ops', window)
+    _, df_cpu = metrics.timeseries('cpu_usage', window)
+    perf_resolution, df_memory = metrics.timeseries('memory_usage', window)
+
     # Create three columns for metrics
     col1, col2, col3 = st.columns(3)
 
     with col1:
         st.metric(
-            label="Total Commands",
-            value=len(st.session_state.metrics_manager.commands_history),
+            label="Commands",
+            value=int(df_commands['count'].sum()),
             delta="↑"
         )
 
     with col2:
         st.metric(
             label="File Operations",
-            value=len(st.session_state.metrics_manager.file_ops_history),
+            value=int(df_files['count'].sum()),
             delta="↑"
         )
 
     with col3:
+        count = df_commands['count'].sum()
         st.metric(
             label="Avg Execution Time",
-            value=f"{sum([cmd['execution_time'] for cmd in st.session_state.metrics_manager.commands_history or [0]])/max(len(st.session_state.metrics_manager.commands_history), 1):.2f}s"
+            value=f"{df_commands['sum'].sum() / count if count else 0:.2f}s"
         )
 
     # Command Statistics
     st.header("Command Statistics")
-    if st.session_state.metrics_manager.commands_history:
-        df_commands = pd.DataFrame(st.session_state.metrics_manager.commands_history)
-        fig_commands = px.line(df_commands, x='timestamp', y='execution_time', color='command',
-                             title='Command Execution Times')
+    if len(df_commands):
+        fig_commands = px.line(df_commands, x='timestamp', y='mean', color='label',
+                             hover_data=['count', 'p95', 'max'],
+                             labels={'mean': 'execution_time', 'label': 'command'},
+                             title=f'Command Execution Times ({commands_resolution})')
         st.plotly_chart(fig_commands, use_container_width=True)
 
+    # Latency Percentiles
+    st.header("Latency Percentiles")
+    df_latency = metrics.percentiles('commands', window)
+    if len(df_latency):
+        st.dataframe(df_latency.rename(columns={'label': 'action'}), use_container_width=True)
+        fig_p95 = px.line(df_commands, x='timestamp', y='p95', color='label',
+                          labels={'p95': 'p95 execution_time', 'label': 'command'},
+                          title=f'p95 Execution Time by Command ({commands_resolution})')
+        st.plotly_chart(fig_p95, use_container_width=True)
+
+    df_phases = metrics.percentiles('phases', window)
+    if len(df_phases):
+        df_phases[['action', 'phase']] = df_phases['label'].str.split('/', n=1, expand=True)
+        fig_phases = px.bar(df_phases, x='action', y='p95', color='phase', barmode='group',
+                            hover_data=['count', 'mean', 'p50', 'p99', 'max'],
+                            title='p95 Time per Phase')
+        st.plotly_chart(fig_phases, use_container_width=True)
+
     # File Operations
     st.header("File Operations")
-    if st.session_state.metrics_manager.file_ops_history:
-        df_files = pd.DataFrame(st.session_state.metrics_manager.file_ops_history)
-        fig_files = px.histogram(df_files, x='operation', title='File Operations Distribution')
+    if len(df_files):
+        df_counts = df_files.groupby('label', as_index=False)['count'].sum()
+        fig_files = px.bar(df_counts, x='label', y='count', labels={'label': 'operation'},
+                           title=f'File Operations Distribution ({files_resolution})')
         st.plotly_chart(fig_files, use_container_width=True)
 
     # Performance Metrics
     st.header("Performance Metrics")
-    if st.session_state.metrics_manager.performance_history:
-        df_perf = pd.DataFrame(st.session_state.metrics_manager.performance_history)
+    if len(df_cpu) or len(df_memory):
         fig_perf = go.Figure()
-        fig_perf.add_trace(go.Scatter(x=df_perf['timestamp'], y=df_perf['cpu_usage'],
+        fig_perf.add_trace(go.Scatter(x=df_cpu['timestamp'], y=df_cpu['mean'],
                                      name='CPU Usage', line=dict(color='blue')))
-        fig_perf.add_trace(go.Scatter(x=df_perf['timestamp'], y=df_perf['memory_usage'],
+        fig_perf.add_trace(go.Scatter(x=df_memory['timestamp'], y=df_memory['mean'],
                                      name='Memory Usage', line=dict(color='red')))
-        fig_perf.update_layout(title='System Performance')
+        fig_perf.update_layout(title=f'System Performance ({perf_resolution})')
         st.plotly_chart(fig_perf, use_container_width=True)
 
     # File Upload and Analysis Section
@@ -167,29 +319,31 @@ def main():
            - Use the sidebar to select different time ranges for the metrics
         
         2. **Metrics Overview**
-           - Total Commands: Number of commands executed
-           - File Operations: Number of file operations performed
+           - Commands: Number of commands executed in the selected range
+           - File Operations: Number of file operations performed in the selected range
            - Avg Execution Time: Average time taken per command
         
         3. **Command Statistics**
            - View execution times for different commands
            - Track command patterns and performance
         
-        4. **File Operations**
+        4. **Latency Percentiles**
+           - p50/p95/p99 per command over the selected range
+           - p95 per phase (queue, io, parse, docker, ...) to see where slow commands spend their time
+        
+        5. **File Operations**
            - Monitor file-related activities
            - Analyze operation types and frequency
         
-        5. **Performance Metrics**
+        6. **Performance Metrics**
            - Track CPU and Memory usage
            - Identify potential bottlenecks
         
-        6. **File Analysis**
+        7. **File Analysis**
            - Upload files for instant analysis
            - Get suggestions for YAML improvements
            - View file contents and structure
         """)
 
 if __name__ == "__main__":
-    # Start Prometheus metrics server
-    start_http_server(9090)
     main()
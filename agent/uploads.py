@@ -0,0 +1,115 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Dict, Any
+
+from .executors import run_io
+
+UPLOAD_CHUNK_SIZE = int(os.environ.get("AGENT_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.environ.get("AGENT_UPLOAD_MAX_BYTES", str(5 * 1024 ** 3)))
+
+
+def _read_umask() -> int:
+    # os.umask can only be read by setting it; done once, at import
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# Mode a plain open(path, "w") would give a new file
+DEFAULT_FILE_MODE = 0o666 & ~_read_umask()
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def replacement_mode(target: Path) -> int:
+    """Mode for a file about to replace `target`: the existing file's, or the umask default for a new one.
+
+    Temp files from mkstemp are 0600, so this has to be applied before the rename.
+    """
+    try:
+        return target.stat().st_mode & 0o7777
+    except FileNotFoundError:
+        return DEFAULT_FILE_MODE
+
+
+def resolve_target(workspace: Path, filepath: str) -> Path:
+    """Workspace path for an uploaded file, refusing anything that escapes the workspace."""
+    if not filepath:
+        raise ValueError("A file name is required")
+    root = workspace.resolve()
+    target = (root / filepath).resolve()
+    if target == root or root not in target.parents:
+        raise ValueError(f"Invalid upload path: {filepath}")
+    return target
+
+
+def _sha256_of(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AtomicUpload:
+    """Write to a temp file beside the target, then rename it into place.
+
+    Readers never see a partially written file, and a failed upload leaves
+    the previous version untouched. Methods block and are meant to run off
+    the event loop.
+    """
+
+    def __init__(self, target: Path, max_bytes: int = UPLOAD_MAX_BYTES):
+        self.target = target
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".upload")
+        self._tmp_path = Path(tmp)
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds the {self.max_bytes} byte limit")
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self) -> Dict[str, Any]:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        sha256 = self._hash.hexdigest()
+        # Same bytes already in place: keep the existing file (and its mtime)
+        if self.target.exists() and self.target.stat().st_size == self.size and _sha256_of(self.target) == sha256:
+            self._tmp_path.unlink()
+            return {"sha256": sha256, "size": self.size, "deduplicated": True}
+        os.chmod(self._tmp_path, replacement_mode(self.target))
+        os.replace(self._tmp_path, self.target)
+        return {"sha256": sha256, "size": self.size, "deduplicated": False}
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        try:
+            self._tmp_path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+async def save_stream(chunks: AsyncIterator[bytes], target: Path, max_bytes: int = UPLOAD_MAX_BYTES) -> Dict[str, Any]:
+    """Copy an async stream of chunks to `target` without holding it in memory or blocking the loop."""
+    upload = await run_io(AtomicUpload, target, max_bytes)
+    try:
+        async for chunk in chunks:
+            if chunk:
+                await run_io(upload.write, chunk)
+        return await run_io(upload.commit)
+    except BaseException:
+        await run_io(upload.abort)
+        raise
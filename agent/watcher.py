@@ -0,0 +1,227 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from .workspace_index import SKIP_DIRS
+
+# Subscribers get the set of changed workspace-relative paths, or None when
+# the watcher lost track (queue overflow, directory moved) and everything
+# should be treated as changed.
+ChangeCallback = Callable[[Optional[Set[str]]], None]
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _skip_dir(name: str) -> bool:
+    return name in SKIP_DIRS or name.startswith('.')
+
+
+class WatchLimitReached(OSError):
+    """The inotify watch limit (fs.inotify.max_user_watches) ran out."""
+
+
+class _Inotify:
+    """Minimal recursive inotify binding over libc via ctypes."""
+
+    def __init__(self, root: Path):
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.root = root
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._dirs: Dict[int, str] = {}
+        self.add_tree(root)
+
+    def add_tree(self, directory: Path) -> List[str]:
+        """Watch `directory` and its subdirectories; returns the files already in them."""
+        files = []
+        for root, dirs, names in os.walk(directory):
+            dirs[:] = [d for d in dirs if not _skip_dir(d)]
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    raise WatchLimitReached(err, 'inotify watch limit reached (fs.inotify.max_user_watches)')
+                continue
+            self._dirs[wd] = Path(root).relative_to(self.root).as_posix()
+            files.extend((Path(root) / n).relative_to(self.root).as_posix() for n in names)
+        return files
+
+    def read(self, timeout: float) -> Tuple[Set[str], bool]:
+        """Wait up to `timeout` for events; returns (changed paths, needs full rescan)."""
+        changed: Set[str] = set()
+        rescan = False
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return changed, rescan
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed, rescan
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                rescan = True
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            parent = self._dirs.get(wd)
+            if parent is None:
+                continue
+            rel = name if parent == '.' else (f"{parent}/{name}" if name else parent)
+            if mask & IN_ISDIR:
+                if _skip_dir(name):
+                    continue
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed.update(self.add_tree(self.root / rel))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    # We don't track which files lived under the directory
+                    rescan = True
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if parent == '.':
+                    rescan = True
+            elif name:
+                changed.add(rel)
+        return changed, rescan
+
+    def close(self):
+        os.close(self.fd)
+
+
+class WorkspaceWatcher:
+    """Background thread that reports changed workspace files to subscribers.
+
+    Uses inotify where available and falls back to periodic stat polling.
+    Events are coalesced for `debounce` seconds so an editor save or a
+    `git checkout` arrives as one batch.
+    """
+
+    def __init__(self, root: Path, poll_interval: float = 2.0, debounce: float = 0.1, use_inotify: bool = True):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.use_inotify = use_inotify
+        self.backend: Optional[str] = None
+        self._subscribers: List[ChangeCallback] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def subscribe(self, callback: ChangeCallback):
+        self._subscribers.append(callback)
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='workspace-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _emit(self, changed: Optional[Set[str]]):
+        for callback in self._subscribers:
+            try:
+                callback(changed)
+            except Exception as e:
+                logger.error(f"Workspace watcher subscriber failed: {str(e)}")
+
+    def _run(self):
+        while not self.root.exists() and not self._stop.wait(self.poll_interval):
+            pass
+        inotify = None
+        if self.use_inotify:
+            try:
+                inotify = _Inotify(self.root)
+            except (OSError, AttributeError) as e:
+                logger.warning(f"inotify unavailable ({e}); polling {self.root} every {self.poll_interval}s")
+        try:
+            if inotify is not None:
+                self.backend = 'inotify'
+                try:
+                    self._run_inotify(inotify)
+                except WatchLimitReached as e:
+                    logger.warning(f"{e}; polling {self.root} every {self.poll_interval}s instead")
+                    inotify.close()
+                    inotify = None
+                    # Changes under the directory that couldn't be watched may have been missed
+                    self._emit(None)
+            if inotify is None and not self._stop.is_set():
+                self.backend = 'polling'
+                self._run_polling()
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _run_inotify(self, inotify: '_Inotify'):
+        while not self._stop.is_set():
+            changed, rescan = inotify.read(timeout=0.5)
+            if not changed and not rescan:
+                continue
+            # Coalesce the burst that usually follows the first event
+            deadline = time.monotonic() + self.debounce
+            while time.monotonic() < deadline:
+                more, more_rescan = inotify.read(timeout=max(deadline - time.monotonic(), 0))
+                changed |= more
+                rescan = rescan or more_rescan
+            self._emit(None if rescan else changed)
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for root, dirs, names in os.walk(self.root):
+            dirs[:] = [d for d in dirs if not _skip_dir(d)]
+            for name in names:
+                path = Path(root) / name
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                snapshot[path.relative_to(self.root).as_posix()] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def _run_polling(self):
+        previous = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            changed = {rel for rel, sig in current.items() if previous.get(rel) != sig}
+            changed.update(rel for rel in previous if rel not in current)
+            previous = current
+            if changed:
+                self._emit(changed)
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from bm25 import idf, length_norm, term_score, tokenize
+from loguru import logger
+
+from .file_handler import FileHandler
+
+SKIP_DIRS = {'.git', '.hg', '.svn', 'node_modules', '__pycache__', '.venv', 'venv', '.mypy_cache', '.pytest_cache'}
+BINARY_SUFFIXES = {'.png', '.jpg', '.jpeg', '.gif', '.ico', '.zip', '.gz', '.tgz', '.tar', '.whl',
+                   '.so', '.dll', '.exe', '.bin', '.pyc', '.class', '.jar', '.db', '.sqlite'}
+EXTRACTED_SUFFIXES = {'.pdf', '.docx'}
+MAX_INDEXED_BYTES = int(os.environ.get('AGENT_INDEX_MAX_BYTES', str(5 * 1024 * 1024)))
+
+class _Doc:
+    __slots__ = ('stat', 'sha256', 'terms', 'length', 'lines')
+
+    def __init__(self, stat, sha256, terms, length, lines):
+        self.stat = stat
+        self.sha256 = sha256
+        self.terms = terms
+        self.length = length
+        self.lines = lines
+
+
+class WorkspaceIndex:
+    """Inverted index over the files in the agent workspace.
+
+    `refresh()` only re-reads files whose mtime or size changed, and only
+    re-tokenizes those whose content hash changed, so keeping the index
+    current costs a stat per file rather than a full re-read.
+    """
+
+    def __init__(self, workspace: Path, file_handler: FileHandler, k1: float = 1.2, b: float = 0.75):
+        self.workspace = workspace
+        self.file_handler = file_handler
+        self.k1 = k1
+        self.b = b
+        self._docs: Dict[str, _Doc] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def refresh(self) -> Dict[str, int]:
+        """Bring the index in line with the workspace on disk."""
+        seen = set()
+        changed = 0
+        if self.workspace.exists():
+            for root, dirs, files in os.walk(self.workspace):
+                dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith('.')]
+                for name in files:
+                    path = Path(root) / name
+                    rel = path.relative_to(self.workspace).as_posix()
+                    seen.add(rel)
+                    if self.update(rel):
+                        changed += 1
+        with self._lock:
+            removed = [rel for rel in self._docs if rel not in seen]
+        for rel in removed:
+            self.remove(rel)
+        return {'files': len(self._docs), 'changed': changed, 'removed': len(removed)}
+
+    def update(self, rel: str) -> bool:
+        """(Re)index one workspace-relative path; returns True if its content changed."""
+        path = self.workspace / rel
+        if path.suffix.lower() in BINARY_SUFFIXES:
+            return False
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            self.remove(rel)
+            return False
+        if st.st_size > MAX_INDEXED_BYTES:
+            self.remove(rel)
+            return False
+        stat = (st.st_mtime_ns, st.st_size)
+        doc = self._docs.get(rel)
+        if doc is not None and doc.stat == stat:
+            return False
+
+        try:
+            raw = path.read_bytes()
+        except OSError as e:
+            logger.warning(f"Skipping {rel} in workspace index: {e}")
+            return False
+        sha256 = hashlib.sha256(raw).hexdigest()
+        if doc is not None and doc.sha256 == sha256:
+            doc.stat = stat
+            return False
+
+        text = self._extract_text(rel, path, raw)
+        if text is None:
+            self.remove(rel)
+            return False
+        lines = text.splitlines()
+        terms = Counter(tokenize(text))
+        with self._lock:
+            self._drop(rel)
+            self._docs[rel] = _Doc(stat, sha256, terms, sum(terms.values()), lines)
+            self._total_length += self._docs[rel].length
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[rel] = tf
+        return True
+
+    def remove(self, rel: str):
+        with self._lock:
+            self._drop(rel)
+
+    def _drop(self, rel: str):
+        doc = self._docs.pop(rel, None)
+        if doc is None:
+            return
+        self._total_length -= doc.length
+        for term in doc.terms:
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(rel, None)
+                if not posting:
+                    del self._postings[term]
+
+    def _extract_text(self, rel: str, path: Path, raw: bytes) -> Optional[str]:
+        suffix = path.suffix.lower()
+        if suffix in EXTRACTED_SUFFIXES:
+            try:
+                content = self.file_handler.read_file(rel)['content']
+            except Exception as e:
+                logger.warning(f"Could not extract {rel} for the workspace index: {e}")
+                return None
+            return '\n'.join(part for part in content if part)
+        if b'\0' in raw[:8192]:
+            return None
+        return raw.decode('utf-8', errors='replace')
+
+    def search(self, query: str, limit: int = 10, snippets: int = 3) -> List[Dict[str, Any]]:
+        """BM25-ranked files for `query`, each with the best matching lines."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._docs)
+            if not n or not terms:
+                return []
+            avg_length = self._total_length / n
+            scores: Dict[str, float] = {}
+            for term in terms:
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                term_idf = idf(n, len(posting))
+                for rel, tf in posting.items():
+                    norm = length_norm(self._docs[rel].length, avg_length, self.k1, self.b)
+                    scores[rel] = scores.get(rel, 0.0) + term_score(term_idf, tf, norm, self.k1)
+            ranked = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+            return [{'filepath': rel, 'score': round(score, 4),
+                     'snippets': self._snippets(self._docs[rel].lines, terms, snippets)}
+                    for rel, score in ranked]
+
+    @staticmethod
+    def _snippets(lines: List[str], terms: set, limit: int) -> List[Dict[str, Any]]:
+        hits = []
+        for number, line in enumerate(lines, start=1):
+            lower = line.lower()
+            if not any(term in lower for term in terms):
+                continue
+            matched = len(terms.intersection(tokenize(line)))
+            if matched:
+                hits.append((matched, number, line.strip()[:240]))
+        hits.sort(key=lambda h: (-h[0], h[1]))
+        return [{'line': number, 'text': text} for _, number, text in hits[:limit]]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'files': len(self._docs), 'terms': len(self._postings)}
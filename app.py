@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from azure_openai import generate_pitch, summarize_call, estimate_cost
+from azure_openai import generate_pitch, stream_pitch, summarize_call, estimate_cost, cache_stats, format_ttft
 from analytics import get_kpi_dataframe
 from crm_integration import fetch_customer_profile
 
@@ -22,7 +22,7 @@ view = st.sidebar.radio("Smart Analytics View", ["KPIs", "Raw Data"])
 
 # Main panel tabs
 st.title("🤖 GenAI-powered Sales Assistant")
-tabs = st.tabs(["Pitch Generator", "Call Summary", "Analytics"])
+tabs = st.tabs(["Pitch Generator", "Call Summary", "Batch Campaign", "Analytics"])
 
 # Pitch Generator Tab
 with tabs[0]:
@@ -169,20 +169,29 @@ with tabs[0]:
         if fetch_crm and last_interaction:
             st.write(f"**Last Interaction:** {last_interaction['summary']} (Status: {last_interaction['status']})")
     if st.button("Generate Smart Pitch"):
-        with st.spinner("Generating smart pitch..."):
-            try:
-                # Securely retrieve credentials from st.secrets
-                az_key = st.secrets.get("AZURE_OPENAI_KEY", "")
-                az_endpoint = st.secrets.get("AZURE_OPENAI_ENDPOINT", "")
-                az_deployment = st.secrets.get("AZURE_OPENAI_DEPLOYMENT", "gpt-4o")
-                # Pass last interaction context if available
-                interaction_context = f"\nLast Interaction: {last_interaction['summary']} (Status: {last_interaction['status']})" if fetch_crm and last_interaction else ""
-                pitch, usage = generate_pitch(profile_input + interaction_context, tone, output_channel, az_key, az_endpoint, az_deployment, temperature, max_tokens, top_p)
-                st.success("Smart pitch generated!")
-                st.text_area("Generated Smart Pitch", value=pitch, height=200)
-                st.caption(f"Estimated Cost: ${estimate_cost(usage):.4f}")
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
+        try:
+            # Securely retrieve credentials from st.secrets
+            az_key = st.secrets.get("AZURE_OPENAI_KEY", "")
+            az_endpoint = st.secrets.get("AZURE_OPENAI_ENDPOINT", "")
+            az_deployment = st.secrets.get("AZURE_OPENAI_DEPLOYMENT", "gpt-4o")
+            # Pass last interaction context if available
+            interaction_context = f"\nLast Interaction: {last_interaction['summary']} (Status: {last_interaction['status']})" if fetch_crm and last_interaction else ""
+            stream = stream_pitch(profile_input + interaction_context, tone, output_channel, az_key, az_endpoint, az_deployment, temperature, max_tokens, top_p)
+            # Render tokens as they arrive, then swap in the editable text area
+            pitch_placeholder = st.empty()
+            partial = ""
+            for delta in stream:
+                partial += delta
+                pitch_placeholder.markdown(partial + "▌")
+            pitch_placeholder.empty()
+            pitch, usage = stream.text, stream.usage
+            st.success("Smart pitch generated!")
+            st.text_area("Generated Smart Pitch", value=pitch, height=200)
+            stats = cache_stats()
+            cache_note = " (cached)" if usage.get("cached") else ""
+            st.caption(f"Estimated Cost: ${estimate_cost(usage):.4f}{cache_note} | Cache: {stats['hits']} hits / {stats['misses']} misses | {format_ttft(stream)}")
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
 
 # Call Summary Tab
 with tabs[1]:
@@ -201,12 +210,51 @@ with tabs[1]:
                 st.markdown(f"**Executive Summary:**\n{summary}")
                 st.markdown(f"**Sentiment:** {sentiment}")
                 st.markdown(f"**Key Takeaways:**\n{highlights}")
-                st.caption(f"Estimated Cost: ${estimate_cost(usage):.4f}")
+                stats = cache_stats()
+                cache_note = " (cached)" if usage.get("cached") else ""
+                st.caption(f"Estimated Cost: ${estimate_cost(usage):.4f}{cache_note} | Cache: {stats['hits']} hits / {stats['misses']} misses")
             except Exception as e:
                 st.error(f"Error: {str(e)}")
 
-# Analytics Tab
+# Batch Campaign Tab
 with tabs[2]:
+    st.header("Batch Pitch Campaign")
+    from crm_integration import list_customers
+    from batch_pitch import run_batch, BATCH_CONCURRENCY
+    batch_customers = list_customers()
+    batch_all = st.checkbox("All CRM customers", value=False)
+    if batch_all:
+        batch_ids = [c['customer_id'] for c in batch_customers]
+    else:
+        batch_labels = {f"{c['customer_id']} - {c['name']} ({c['company']})": c['customer_id'] for c in batch_customers}
+        batch_ids = [batch_labels[label] for label in st.multiselect("Customers", list(batch_labels.keys()))]
+    concurrency = st.slider("Concurrent requests", 1, 32, BATCH_CONCURRENCY)
+    if st.button("Generate Campaign Pitches", disabled=not batch_ids):
+        az_key = st.secrets.get("AZURE_OPENAI_KEY", "")
+        az_endpoint = st.secrets.get("AZURE_OPENAI_ENDPOINT", "")
+        az_deployment = st.secrets.get("AZURE_OPENAI_DEPLOYMENT", "gpt-4o")
+        progress = st.progress(0.0)
+        table = st.empty()
+        batch_rows = []
+
+        def show_result(row):
+            batch_rows.append(row)
+            progress.progress(len(batch_rows) / len(batch_ids), text=f"{len(batch_rows)}/{len(batch_ids)} pitches")
+            table.dataframe(pd.DataFrame(batch_rows))
+
+        try:
+            run_batch(batch_ids, tone, output_channel, az_key, az_endpoint, az_deployment, temperature, max_tokens, top_p,
+                      concurrency=concurrency, on_result=show_result)
+            failed = sum(1 for r in batch_rows if r['error'])
+            total_tokens = sum(r['total_tokens'] for r in batch_rows)
+            st.success(f"Generated {len(batch_rows) - failed} pitches ({failed} failed).")
+            st.caption(f"Estimated Cost: ${estimate_cost({'total_tokens': total_tokens}):.4f}")
+            st.download_button("Download CSV", pd.DataFrame(batch_rows).to_csv(index=False), file_name="campaign_pitches.csv", mime="text/csv")
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
+
+# Analytics Tab
+with tabs[3]:
     st.header("Analytics Dashboard")
     try:
         df = get_kpi_dataframe(view)
@@ -2,7 +2,43 @@ import openai
 import os
 import re
 import logging
-from typing import Tuple, Dict
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Tuple, Dict, Iterator, Optional
+
+from completion_cache import CompletionCache, make_key
+
+AZURE_OPENAI_API_VERSION = "2024-08-01-preview"
+
+# HTTP connection pool shared by every call that uses the same endpoint/key
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE = int(os.environ.get("OPENAI_MAX_KEEPALIVE", "10"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.environ.get("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", "5"))
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Completion cache: LRU entries in memory, optional SQLite file shared across processes
+COMPLETION_CACHE_SIZE = int(os.environ.get("COMPLETION_CACHE_SIZE", "256"))
+COMPLETION_CACHE_TTL = float(os.environ.get("COMPLETION_CACHE_TTL", str(24 * 3600)))
+COMPLETION_CACHE_PATH = os.environ.get("COMPLETION_CACHE_PATH") or None
+COMPLETION_CACHE_DISK_SIZE = int(os.environ.get("COMPLETION_CACHE_DISK_SIZE", "10000"))
+
+_completion_cache = CompletionCache(
+    max_entries=COMPLETION_CACHE_SIZE,
+    ttl=COMPLETION_CACHE_TTL,
+    disk_path=COMPLETION_CACHE_PATH,
+    disk_max_entries=COMPLETION_CACHE_DISK_SIZE,
+)
+# Usage reported for cache hits: nothing was billed
+CACHED_USAGE = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached": True}
+
+# Recent time-to-first-token samples (seconds) for streamed completions
+_ttft_samples = deque(maxlen=200)
 
 # Setup logging for Azure Monitor integration (stub)
 def log_query_to_azure_monitor(prompt, response, usage):
@@ -16,17 +52,57 @@ def mask_pii(text: str) -> str:
     text = re.sub(r"\b\d{10,}\b", "<PHONE>", text)
     return text
 
-def get_openai_client(api_key, api_base):
-    from openai import AzureOpenAI
-    return AzureOpenAI(
-        api_key=api_key,
-        azure_endpoint=api_base,
-        api_version="2024-08-01-preview"
-    )
+def get_openai_client(api_key, api_base, api_version=AZURE_OPENAI_API_VERSION):
+    """Return the process-wide client for (endpoint, key, api_version).
 
-def generate_pitch(profile, tone, channel, key, endpoint, deployment, temperature, max_tokens, top_p) -> Tuple[str, Dict]:
-    prompt = f"You are a sales assistant. Craft a {tone.lower()} {channel.lower()} pitch for the following customer profile:\n{profile}"
-    masked_prompt = mask_pii(prompt)
+    Clients are created once and keep their keep-alive HTTP pool, so repeat
+    calls skip the TCP/TLS handshake.
+    """
+    cache_key = (api_base, api_key, api_version)
+    client = _clients.get(cache_key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(cache_key)
+            if client is None:
+                import httpx
+                from openai import AzureOpenAI
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+                    ),
+                    timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+                )
+                client = AzureOpenAI(
+                    api_key=api_key,
+                    azure_endpoint=api_base,
+                    api_version=api_version,
+                    http_client=http_client,
+                )
+                _clients[cache_key] = client
+    return client
+
+def get_completion_cache():
+    return _completion_cache
+
+def completion_key(masked_prompt, endpoint, deployment, temperature, max_tokens, top_p):
+    return make_key(prompt=masked_prompt, endpoint=endpoint, deployment=deployment,
+                    temperature=temperature, max_tokens=max_tokens, top_p=top_p)
+
+def _api_error(e):
+    err_msg = str(e)
+    if "deployment" in err_msg or "model" in err_msg or "authentication" in err_msg or "key" in err_msg:
+        return RuntimeError("Azure OpenAI API error: Please check your deployment name, endpoint, or API key. If you need help, please provide the correct deployment/model or credentials.")
+    return RuntimeError(f"Azure OpenAI API error: {err_msg}")
+
+def _complete(masked_prompt, key, endpoint, deployment, temperature, max_tokens, top_p, use_cache=True):
+    """Run one sales-assistant completion, answering repeats from the completion cache."""
+    cache_key = completion_key(masked_prompt, endpoint, deployment, temperature, max_tokens, top_p)
+    if use_cache:
+        cached = _completion_cache.get(cache_key)
+        if cached is not None:
+            return cached["content"], dict(CACHED_USAGE)
     client = get_openai_client(key, endpoint)
     try:
         response = client.chat.completions.create(
@@ -37,41 +113,137 @@ def generate_pitch(profile, tone, channel, key, endpoint, deployment, temperatur
             max_tokens=max_tokens,
             top_p=top_p,
         )
-        pitch = response.choices[0].message.content
+        content = response.choices[0].message.content
         usage = response.usage.model_dump() if hasattr(response, 'usage') else {}
-        log_query_to_azure_monitor(masked_prompt, pitch, usage)
-        return pitch, usage
     except Exception as e:
-        err_msg = str(e)
-        if "deployment" in err_msg or "model" in err_msg or "authentication" in err_msg or "key" in err_msg:
-            raise RuntimeError("Azure OpenAI API error: Please check your deployment name, endpoint, or API key. If you need help, please provide the correct deployment/model or credentials.")
-        raise RuntimeError(f"Azure OpenAI API error: {err_msg}")
+        raise _api_error(e)
+    log_query_to_azure_monitor(masked_prompt, content, usage)
+    if use_cache and content:
+        _completion_cache.set(cache_key, {"content": content, "usage": usage})
+    return content, usage
+
+def pitch_prompt(profile, tone, channel):
+    return f"You are a sales assistant. Craft a {tone.lower()} {channel.lower()} pitch for the following customer profile:\n{profile}"
 
-def summarize_call(transcript, key, endpoint, deployment, temperature, max_tokens, top_p):
+def generate_pitch(profile, tone, channel, key, endpoint, deployment, temperature, max_tokens, top_p, use_cache=True) -> Tuple[str, Dict]:
+    prompt = pitch_prompt(profile, tone, channel)
+    masked_prompt = mask_pii(prompt)
+    return _complete(masked_prompt, key, endpoint, deployment, temperature, max_tokens, top_p, use_cache)
+
+def summarize_call(transcript, key, endpoint, deployment, temperature, max_tokens, top_p, use_cache=True):
     prompt = f"Summarize the following sales call transcript. Highlight key takeaways and analyze sentiment.\nTranscript:\n{transcript}"
     masked_prompt = mask_pii(prompt)
-    client = get_openai_client(key, endpoint)
-    try:
-        response = client.chat.completions.create(
-            model=deployment,
-            messages=[{"role": "system", "content": "You are a helpful sales assistant."},
-                      {"role": "user", "content": masked_prompt}],
-            temperature=temperature,
-            max_tokens=max_tokens,
-            top_p=top_p,
-        )
-        content = response.choices[0].message.content
-        sentiment = "Positive" if "positive" in content.lower() else "Neutral"
-        highlights = "\n".join([line for line in content.split("\n") if line.strip().startswith("-")])
-        summary = content.split("Key Takeaways:")[0].strip() if "Key Takeaways:" in content else content
-        usage = response.usage.model_dump() if hasattr(response, 'usage') else {}
-        log_query_to_azure_monitor(masked_prompt, content, usage)
-        return summary, sentiment, highlights, usage
-    except Exception as e:
-        err_msg = str(e)
-        if "deployment" in err_msg or "model" in err_msg or "authentication" in err_msg or "key" in err_msg:
-            raise RuntimeError("Azure OpenAI API error: Please check your deployment name, endpoint, or API key. If you need help, please provide the correct deployment/model or credentials.")
-        raise RuntimeError(f"Azure OpenAI API error: {err_msg}")
+    content, usage = _complete(masked_prompt, key, endpoint, deployment, temperature, max_tokens, top_p, use_cache)
+    sentiment = "Positive" if "positive" in content.lower() else "Neutral"
+    highlights = "\n".join([line for line in content.split("\n") if line.strip().startswith("-")])
+    summary = content.split("Key Takeaways:")[0].strip() if "Key Takeaways:" in content else content
+    return summary, sentiment, highlights, usage
+
+def cache_stats():
+    return _completion_cache.stats()
+
+class CompletionStream:
+    """Iterator over the text deltas of a streamed chat completion.
+
+    Once iteration finishes, `text` holds the full completion, `usage` the
+    token usage (when the service reports it) and `ttft` the seconds from
+    request to first token.
+    """
+
+    def __init__(self, client, deployment, messages, on_complete=None, **params):
+        self.client = client
+        self.deployment = deployment
+        self.messages = messages
+        self.params = params
+        self.on_complete = on_complete
+        self.text = ""
+        self.usage: Dict = {}
+        self.ttft: Optional[float] = None
+
+    def __iter__(self) -> Iterator[str]:
+        start = time.perf_counter()
+        parts = []
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.deployment,
+                messages=self.messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **self.params,
+            )
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    self.usage = chunk.usage.model_dump()
+                # Azure sends content-filter results as a chunk without choices
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if self.ttft is None:
+                        self.ttft = time.perf_counter() - start
+                        _ttft_samples.append(self.ttft)
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            raise _api_error(e)
+        self.text = "".join(parts)
+        if self.on_complete is not None:
+            self.on_complete(self)
+
+class _CachedStream:
+    """A cache hit presented through the CompletionStream interface."""
+
+    def __init__(self, text):
+        self.text = text
+        self.usage = dict(CACHED_USAGE)
+        self.ttft = 0.0
+
+    def __iter__(self) -> Iterator[str]:
+        yield self.text
+
+def stream_completion(masked_prompt, key, endpoint, deployment, temperature, max_tokens, top_p, use_cache=True):
+    """Streaming counterpart of _complete: iterate the result for text deltas."""
+    cache_key = completion_key(masked_prompt, endpoint, deployment, temperature, max_tokens, top_p)
+    if use_cache:
+        cached = _completion_cache.get(cache_key)
+        if cached is not None:
+            return _CachedStream(cached["content"])
+
+    def finish(stream):
+        log_query_to_azure_monitor(masked_prompt, stream.text, stream.usage)
+        if use_cache and stream.text:
+            _completion_cache.set(cache_key, {"content": stream.text, "usage": stream.usage})
+
+    return CompletionStream(
+        get_openai_client(key, endpoint),
+        deployment,
+        [{"role": "system", "content": "You are a helpful sales assistant."},
+         {"role": "user", "content": masked_prompt}],
+        on_complete=finish,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        top_p=top_p,
+    )
+
+def stream_pitch(profile, tone, channel, key, endpoint, deployment, temperature, max_tokens, top_p, use_cache=True):
+    prompt = pitch_prompt(profile, tone, channel)
+    return stream_completion(mask_pii(prompt), key, endpoint, deployment, temperature, max_tokens, top_p, use_cache)
+
+def ttft_stats():
+    """Time-to-first-token over the last 200 streamed (uncached) completions."""
+    samples = list(_ttft_samples)
+    if not samples:
+        return {"count": 0, "last": None, "p50": None, "p95": None}
+    p95 = statistics.quantiles(samples, n=20, method="inclusive")[18] if len(samples) > 1 else samples[0]
+    return {"count": len(samples), "last": samples[-1], "p50": statistics.median(samples), "p95": p95}
+
+def format_ttft(stream):
+    """Caption text for a stream's first-token latency, with the recent p50/p95 once there are samples."""
+    text = f"First token: {(stream.ttft or 0):.2f}s"
+    stats = ttft_stats()
+    if stats["count"] > 1:
+        text += f" (p50 {stats['p50']:.2f}s, p95 {stats['p95']:.2f}s over {stats['count']})"
+    return text
 
 def estimate_cost(usage):
     # Example: $0.03 per 1K tokens (adjust as needed)
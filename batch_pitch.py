@@ -0,0 +1,205 @@
+"""Concurrent pitch generation for many CRM customers.
+
+Completions are fanned out on an asyncio Azure OpenAI client under a
+concurrency limit, and 429/5xx responses are retried with backoff that
+honours the service's retry-after hints. Results are yielded as they
+complete, so callers can stream them into a table or CSV.
+
+Overnight campaign from the command line (credentials from the
+AZURE_OPENAI_KEY / AZURE_OPENAI_ENDPOINT / AZURE_OPENAI_DEPLOYMENT env vars):
+
+    python batch_pitch.py --all --tone Formal --channel Email --out pitches.csv
+"""
+import argparse
+import asyncio
+import csv
+import os
+import random
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, Optional
+
+import openai
+
+from azure_openai import (AZURE_OPENAI_API_VERSION, OPENAI_CONNECT_TIMEOUT, OPENAI_TIMEOUT,
+                          CACHED_USAGE, completion_key, get_completion_cache, log_query_to_azure_monitor,
+                          mask_pii, pitch_prompt)
+from crm_integration import fetch_customer_profile, fetch_last_interaction, list_customers
+
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_RETRIES = int(os.environ.get("BATCH_MAX_RETRIES", "6"))
+BATCH_BASE_BACKOFF = float(os.environ.get("BATCH_BASE_BACKOFF", "1.0"))
+BATCH_MAX_BACKOFF = float(os.environ.get("BATCH_MAX_BACKOFF", "60"))
+
+RESULT_FIELDS = ["customer_id", "name", "company", "pitch", "total_tokens", "cached", "attempts", "seconds", "error"]
+
+_RETRYABLE = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+
+def _retry_after(exc) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def _backoff(attempt, exc) -> float:
+    hinted = _retry_after(exc)
+    if hinted is not None:
+        return min(hinted, BATCH_MAX_BACKOFF)
+    # Full jitter keeps concurrent workers from retrying in lockstep
+    return random.uniform(0, min(BATCH_MAX_BACKOFF, BATCH_BASE_BACKOFF * 2 ** attempt))
+
+
+def build_profile(customer_id) -> str:
+    profile = fetch_customer_profile(customer_id)
+    last = fetch_last_interaction(customer_id)
+    if last:
+        profile += f"\nLast Interaction: {last['summary']} (Status: {last['status']})"
+    return profile
+
+
+async def generate_pitches(customer_ids: Iterable[str], tone, channel, key, endpoint, deployment,
+                           temperature, max_tokens, top_p, concurrency=BATCH_CONCURRENCY,
+                           max_retries=BATCH_MAX_RETRIES, use_cache=True) -> AsyncIterator[Dict]:
+    """Yield one result row per customer, in completion order."""
+    import httpx
+    from openai import AsyncAzureOpenAI
+
+    customers = {c["customer_id"]: c for c in list_customers()}
+    cache = get_completion_cache()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max(1, concurrency), max_keepalive_connections=max(1, concurrency)),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+    )
+    client = AsyncAzureOpenAI(
+        api_key=key,
+        azure_endpoint=endpoint,
+        api_version=AZURE_OPENAI_API_VERSION,
+        http_client=http_client,
+        max_retries=0,  # retries are handled below so they respect the concurrency limit
+    )
+
+    async def one(customer_id):
+        customer = customers.get(customer_id, {})
+        row = {"customer_id": customer_id, "name": customer.get("name"), "company": customer.get("company"),
+               "pitch": None, "total_tokens": 0, "cached": False, "attempts": 0, "seconds": 0.0, "error": None}
+        start = time.perf_counter()
+        masked_prompt = mask_pii(pitch_prompt(build_profile(customer_id), tone, channel))
+        cache_key = completion_key(masked_prompt, endpoint, deployment, temperature, max_tokens, top_p)
+        cached = cache.get(cache_key) if use_cache else None
+        if cached is not None:
+            row.update(pitch=cached["content"], cached=True, total_tokens=CACHED_USAGE["total_tokens"])
+            return row
+
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                row["attempts"] = attempt + 1
+                try:
+                    response = await client.chat.completions.create(
+                        model=deployment,
+                        messages=[{"role": "system", "content": "You are a helpful sales assistant."},
+                                  {"role": "user", "content": masked_prompt}],
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        top_p=top_p,
+                    )
+                except _RETRYABLE as e:
+                    if attempt == max_retries:
+                        row["error"] = f"Azure OpenAI API error: {e}"
+                        break
+                    await asyncio.sleep(_backoff(attempt, e))
+                    continue
+                except Exception as e:
+                    row["error"] = f"Azure OpenAI API error: {e}"
+                    break
+                pitch = response.choices[0].message.content
+                usage = response.usage.model_dump() if response.usage else {}
+                log_query_to_azure_monitor(masked_prompt, pitch, usage)
+                if use_cache and pitch:
+                    cache.set(cache_key, {"content": pitch, "usage": usage})
+                row.update(pitch=pitch, total_tokens=usage.get("total_tokens", 0))
+                break
+        row["seconds"] = round(time.perf_counter() - start, 3)
+        return row
+
+    tasks = []
+    try:
+        tasks = [asyncio.ensure_future(one(cid)) for cid in customer_ids]
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        await client.close()
+
+
+def run_batch(customer_ids, tone, channel, key, endpoint, deployment, temperature, max_tokens, top_p,
+              concurrency=BATCH_CONCURRENCY, on_result: Optional[Callable[[Dict], None]] = None, out_path=None):
+    """Blocking wrapper for Streamlit and the CLI. Returns all result rows."""
+    async def drive():
+        rows = []
+        writer = None
+        out = open(out_path, "w", newline="") if out_path else None
+        try:
+            if out is not None:
+                writer = csv.DictWriter(out, fieldnames=RESULT_FIELDS)
+                writer.writeheader()
+            async for row in generate_pitches(customer_ids, tone, channel, key, endpoint, deployment,
+                                              temperature, max_tokens, top_p, concurrency=concurrency):
+                rows.append(row)
+                if writer is not None:
+                    writer.writerow(row)
+                    out.flush()
+                if on_result is not None:
+                    on_result(row)
+        finally:
+            if out is not None:
+                out.close()
+        return rows
+
+    return asyncio.run(drive())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate pitches for many CRM customers")
+    parser.add_argument("customer_ids", nargs="*")
+    parser.add_argument("--all", action="store_true", help="every customer in the CRM")
+    parser.add_argument("--tone", default="Formal")
+    parser.add_argument("--channel", default="Email")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--max-tokens", type=int, default=512)
+    parser.add_argument("--top-p", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--out", default="pitches.csv")
+    args = parser.parse_args()
+
+    customer_ids = [c["customer_id"] for c in list_customers()] if args.all else args.customer_ids
+    if not customer_ids:
+        parser.error("pass customer IDs or --all")
+
+    done = {"ok": 0, "failed": 0}
+
+    def report(row):
+        done["failed" if row["error"] else "ok"] += 1
+        print(f"[{done['ok'] + done['failed']}/{len(customer_ids)}] {row['customer_id']}: "
+              f"{row['error'] or 'ok'} ({row['seconds']}s)")
+
+    start = time.perf_counter()
+    run_batch(customer_ids, args.tone, args.channel, os.environ.get("AZURE_OPENAI_KEY", ""),
+              os.environ.get("AZURE_OPENAI_ENDPOINT", ""), os.environ.get("AZURE_OPENAI_DEPLOYMENT", "gpt-4o"),
+              args.temperature, args.max_tokens, args.top_p, concurrency=args.concurrency,
+              on_result=report, out_path=args.out)
+    print(f"{done['ok']} pitches, {done['failed']} failures in {time.perf_counter() - start:.1f}s -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Throughput of InteractionIdAllocator under concurrent writer processes.
+
+Usage: python benchmarks/bench_interaction_ids.py [--writers 8] [--ids 2000]
+
+Each writer process allocates `--ids` IDs against a shared counter file in a
+temporary directory. The run fails loudly if any ID is handed out twice.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crm_integration import InteractionIdAllocator
+
+
+def _worker(seq_path, interactions_path, count, block_size, fsync, out):
+    allocator = InteractionIdAllocator(seq_path, interactions_path, block_size=block_size, fsync=fsync)
+    out.put([allocator.next_id() for _ in range(count)])
+
+
+def run(writers, ids, block_size, fsync):
+    with tempfile.TemporaryDirectory() as tmp:
+        seq_path = os.path.join(tmp, 'interactions.seq')
+        interactions_path = os.path.join(tmp, 'interactions.csv')
+        out = mp.Queue()
+        procs = [mp.Process(target=_worker, args=(seq_path, interactions_path, ids, block_size, fsync, out))
+                 for _ in range(writers)]
+        start = time.perf_counter()
+        for p in procs:
+            p.start()
+        allocated = []
+        for _ in procs:
+            allocated.extend(out.get())
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - start
+
+    if len(set(allocated)) != len(allocated):
+        raise SystemExit(f"duplicate IDs allocated (block={block_size}, fsync={fsync})")
+    return len(allocated) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--ids', type=int, default=2000, help='IDs allocated per writer')
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers x {args.ids} IDs")
+    print(f"{'block':>6} {'fsync':>6} {'ids/sec':>12}")
+    for fsync in (False, True):
+        for block_size in (1, 16, 256):
+            rate = run(args.writers, args.ids, block_size, fsync)
+            print(f"{block_size:>6} {str(fsync):>6} {rate:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
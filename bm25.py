@@ -0,0 +1,32 @@
+"""Tokenizer and Okapi BM25 weights shared by the agent's workspace index and chat retrieval.
+
+Top level so the Streamlit app can use it without importing the agent
+package. The functions accept plain floats or NumPy arrays, so both the
+dictionary-based and the vectorized index score with the same formula.
+"""
+import re
+from typing import List
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r'[a-z0-9_]+')
+
+
+def tokenize(text: str) -> List[str]:
+    # Split identifiers like helm.chart-name / CamelCase keys into their parts as well
+    text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text)
+    return _TOKEN_RE.findall(text.lower())
+
+
+def idf(n_docs: int, doc_freq: int) -> float:
+    return np.log(1 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+def length_norm(length, avg_length, k1: float, b: float):
+    """The k1 * (1 - b + b * |d| / avgdl) term of a document's denominator."""
+    return k1 * (1 - b + b * length / avg_length)
+
+
+def term_score(term_idf, tf, norm, k1: float):
+    """One query term's contribution to a document's score."""
+    return term_idf * tf * (k1 + 1) / (tf + norm)
@@ -0,0 +1,175 @@
+"""Token-budgeted context window for the DevOps Assistant chat.
+
+The Streamlit history grows for the whole session; this module decides
+what is actually sent on each turn: the system prompt, the latest copy of
+each uploaded file, as many recent turns as fit the budget, and a short
+rolling summary of the turns that fell out of the window.
+"""
+import hashlib
+import os
+import re
+from collections import OrderedDict
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken is optional; fall back to a local estimate
+    _encoding = None
+
+CHAT_CONTEXT_TOKENS = int(os.environ.get("CHAT_CONTEXT_TOKENS", "6000"))
+CHAT_SUMMARY_TOKENS = int(os.environ.get("CHAT_SUMMARY_TOKENS", "400"))
+CHAT_MAX_TURNS = int(os.environ.get("CHAT_MAX_TURNS", "20"))
+
+FILE_MESSAGE_RE = re.compile(r"^The user has uploaded a file named '(?P<name>[^']*)'")
+
+# Per-message framing the chat format adds on top of the content
+_MESSAGE_OVERHEAD = 4
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # Roughly one token per short word or punctuation mark, long words split every 4 chars
+    return sum(1 + len(w) // 5 for w in _WORD_RE.findall(text))
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens]) + "\n[...truncated]"
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo] + "\n[...truncated]"
+
+
+def _first_sentence(text: str, limit: int = 160) -> str:
+    text = " ".join(text.split())
+    match = re.search(r"(.+?[.!?])(\s|$)", text)
+    sentence = match.group(1) if match else text
+    return sentence if len(sentence) <= limit else sentence[:limit].rstrip() + "..."
+
+
+class ConversationWindow:
+    def __init__(self, max_tokens=CHAT_CONTEXT_TOKENS, summary_tokens=CHAT_SUMMARY_TOKENS,
+                 max_turns=CHAT_MAX_TURNS, file_share=0.5, context_share=0.5):
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.max_turns = max_turns
+        self.file_share = file_share
+        self.context_share = context_share
+        self._token_cache = OrderedDict()
+        self.last_stats = {}
+
+    def _tokens(self, message) -> int:
+        key = hashlib.sha1(message["content"].encode("utf-8", "ignore")).digest()
+        n = self._token_cache.get(key)
+        if n is None:
+            n = count_tokens(message["content"]) + _MESSAGE_OVERHEAD
+            self._token_cache[key] = n
+            if len(self._token_cache) > 2048:
+                self._token_cache.popitem(last=False)
+        return n
+
+    def build(self, system_prompt, history, context=()):
+        """Return the message list to send for the next completion.
+
+        `context` messages (e.g. retrieved excerpts) are sent after the file
+        messages and counted against the same budget. They get at most
+        `context_share` of what the files leave, and give way further so
+        the newest message is sent whole whenever it fits on its own.
+        """
+        files = OrderedDict()
+        turns = []
+        for m in history:
+            match = FILE_MESSAGE_RE.match(m["content"]) if m["role"] == "system" else None
+            if match:
+                # Re-uploads of the same file supersede earlier copies
+                files.pop(match.group("name"), None)
+                files[match.group("name")] = m
+            else:
+                turns.append({"role": m["role"], "content": m["content"]})
+
+        system = {"role": "system", "content": system_prompt}
+        remaining = self.max_tokens - self._tokens(system)
+
+        file_messages = []
+        file_budget = int(remaining * self.file_share)
+        per_file = file_budget // max(len(files), 1)
+        for m in files.values():
+            if self._tokens(m) > per_file:
+                m = {"role": "system", "content": _truncate(m["content"], per_file - _MESSAGE_OVERHEAD)}
+            file_messages.append(m)
+            remaining -= self._tokens(m)
+        context = self._fit_context(list(context), remaining, self._tokens(turns[-1]) if turns else 0)
+        remaining -= sum(self._tokens(m) for m in context)
+
+        total = sum(self._tokens(m) for m in turns)
+        if total > remaining or len(turns) > self.max_turns:
+            remaining -= self.summary_tokens
+
+        window = []
+        for m in reversed(turns):
+            if len(window) >= self.max_turns:
+                break
+            cost = self._tokens(m)
+            if cost > remaining:
+                if not window:
+                    # Always send the newest message, cut down to what fits
+                    m = {"role": m["role"], "content": _truncate(m["content"], max(remaining - _MESSAGE_OVERHEAD, 1))}
+                    window.append(m)
+                break
+            window.append(m)
+            remaining -= cost
+        window.reverse()
+
+        dropped = turns[:len(turns) - len(window)]
+        messages = [system]
+        if dropped:
+            messages.append({"role": "system", "content": self._summarize(dropped)})
+        messages.extend(file_messages)
+        messages.extend(context)
+        messages.extend(window)
+
+        self.last_stats = {
+            "tokens": sum(self._tokens(m) for m in messages),
+            "turns_sent": len(window),
+            "turns_summarized": len(dropped),
+            "files": len(file_messages),
+        }
+        return messages
+
+    def _fit_context(self, context, remaining, newest_cost):
+        """Truncate `context` to its share of `remaining`, leaving room for the newest message."""
+        budget = min(int(remaining * self.context_share), remaining - newest_cost)
+        if not context or sum(self._tokens(m) for m in context) <= budget:
+            return context
+        per_message = budget // len(context) - _MESSAGE_OVERHEAD
+        if per_message <= 0:
+            return []
+        return [m if self._tokens(m) <= per_message + _MESSAGE_OVERHEAD
+                else {"role": m["role"], "content": _truncate(m["content"], per_message)}
+                for m in context]
+
+    def _summarize(self, dropped):
+        """Rolling extractive summary: one line per dropped turn, newest lines kept."""
+        header = "Summary of earlier conversation:"
+        lines = []
+        used = count_tokens(header)
+        for m in reversed(dropped):
+            who = "User" if m["role"] == "user" else "Assistant"
+            line = f"- {who}: {_first_sentence(m['content'])}"
+            cost = count_tokens(line) + 1
+            if used + cost > self.summary_tokens - _MESSAGE_OVERHEAD:
+                break
+            lines.append(line)
+            used += cost
+        return "\n".join([header] + lines[::-1])
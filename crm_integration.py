@@ -1,31 +1,376 @@
 import pandas as pd
+import atexit
+import csv
+import io
 import os
+import re
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer only
+    fcntl = None
 
 CRM_PATH = os.path.join(os.path.dirname(__file__), 'dummy_crm.csv')
 INTERACTIONS_PATH = os.path.join(os.path.dirname(__file__), 'crm_interactions.csv')
+INTERACTION_SEQ_PATH = os.path.join(os.path.dirname(__file__), 'crm_interactions.seq')
+INTERACTION_COLUMNS = ['customer_id', 'interaction_id', 'date', 'summary', 'interaction_type', 'status']
+
+# Append-log tuning: fsync every flush, rows buffered before a flush
+CRM_FSYNC = os.environ.get('CRM_FSYNC', '1') != '0'
+CRM_LOG_BATCH = int(os.environ.get('CRM_LOG_BATCH', '1'))
+# Interaction IDs reserved from the sequence file per lock round-trip
+CRM_ID_BLOCK = int(os.environ.get('CRM_ID_BLOCK', '1'))
+
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive advisory lock on a sidecar `<path>.lock` file.
+
+    The lock lives beside the data file rather than on it, so that compaction
+    can swap the data file out with os.replace while other writers wait.
+    """
+    with open(path + '.lock', 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class CRMStore:
+    """Process-wide in-memory copy of the CRM CSVs.
+
+    Each CSV is parsed once and indexed by customer_id; interactions are kept
+    per customer, newest first (by date, then by file order, later rows first).
+    A file is re-read only when its mtime (or size) changes.
+    """
+
+    def __init__(self, crm_path, interactions_path):
+        self.crm_path = crm_path
+        self.interactions_path = interactions_path
+        self._lock = threading.RLock()
+        self._crm_mtime = None
+        self._crm_df = None
+        self._profiles = {}
+        self._interactions_mtime = None
+        self._interactions_df = None
+        self._appended = []
+        self._by_customer = {}
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _refresh_crm(self):
+        mtime = self._mtime(self.crm_path)
+        if self._crm_df is not None and mtime == self._crm_mtime:
+            return
+        with self._lock:
+            if self._crm_df is not None and mtime == self._crm_mtime:
+                return
+            df = pd.read_csv(self.crm_path)
+            self._profiles = {r['customer_id']: r for r in df.to_dict(orient='records')}
+            self._crm_df = df
+            self._crm_mtime = mtime
+
+    def _refresh_interactions(self):
+        mtime = self._mtime(self.interactions_path)
+        if self._interactions_df is not None and mtime == self._interactions_mtime:
+            return
+        with self._lock:
+            if self._interactions_df is not None and mtime == self._interactions_mtime:
+                return
+            df = pd.read_csv(self.interactions_path)
+            # Stable sort of the reversed file: same-date rows stay newest first
+            ordered = df.iloc[::-1].sort_values('date', ascending=False, kind='mergesort')
+            by_customer = {}
+            for r in ordered.to_dict(orient='records'):
+                by_customer.setdefault(r['customer_id'], []).append(r)
+            self._by_customer = by_customer
+            self._interactions_df = df
+            self._appended = []
+            self._interactions_mtime = mtime
+
+    def note_append(self, rows, before, after):
+        """Fold rows we just appended into the index without re-reading the file.
+
+        `before`/`after` are the file signatures around the write. If the file
+        changed behind our back in between, the cache is left stale and the
+        next lookup reloads it.
+        """
+        with self._lock:
+            if self._interactions_df is None or before != self._interactions_mtime:
+                return
+            for row in rows:
+                cust = self._by_customer.setdefault(row['customer_id'], [])
+                pos = 0
+                while pos < len(cust) and cust[pos]['date'] > row['date']:
+                    pos += 1
+                cust.insert(pos, row)
+            self._appended.extend(rows)
+            self._interactions_mtime = after
+
+    def invalidate(self):
+        with self._lock:
+            self._crm_df = None
+            self._interactions_df = None
+            self._appended = []
+
+    def crm_frame(self):
+        self._refresh_crm()
+        return self._crm_df
+
+    def interactions_frame(self):
+        self._refresh_interactions()
+        with self._lock:
+            if self._appended:
+                self._interactions_df = pd.concat(
+                    [self._interactions_df, pd.DataFrame(self._appended, columns=INTERACTION_COLUMNS)],
+                    ignore_index=True
+                )
+                self._appended = []
+            return self._interactions_df
+
+    def profile(self, crm_id):
+        self._refresh_crm()
+        return self._profiles.get(crm_id)
+
+    def interactions(self, crm_id):
+        """Interactions for one customer, newest first."""
+        self._refresh_interactions()
+        return self._by_customer.get(crm_id, [])
+
+
+class InteractionLog:
+    """Append-only writer for the interactions CSV.
+
+    Rows are buffered and written `batch_size` at a time as plain CSV appends
+    under a cross-process file lock, so the cost of logging an interaction
+    does not depend on how much history the file holds. Rewriting the
+    whole file (`compact`) is left to explicit maintenance runs.
+    """
+
+    def __init__(self, path, store=None, batch_size=1, fsync=True):
+        self.path = path
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def append(self, row):
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator='\n')
+        for row in rows:
+            writer.writerow([row.get(c, '') for c in INTERACTION_COLUMNS])
+        data = buf.getvalue().encode('utf-8')
+
+        with _file_lock(self.path):
+            with open(self.path, 'ab+') as f:
+                st = os.fstat(f.fileno())
+                before = (st.st_mtime_ns, st.st_size)
+                if st.st_size == 0:
+                    data = (','.join(INTERACTION_COLUMNS) + '\n').encode('utf-8') + data
+                else:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        data = b'\n' + data
+                f.write(data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+                st = os.fstat(f.fileno())
+                after = (st.st_mtime_ns, st.st_size)
+        if self.store is not None:
+            self.store.note_append(rows, before, after)
+
+    def compact(self):
+        """Rewrite the file without duplicate rows or a torn trailing line; holds the lock for a full read and write."""
+        with self._lock:
+            self._flush_locked()
+            self._compact_locked()
+
+    def _compact_locked(self):
+        with _file_lock(self.path):
+            df = pd.read_csv(self.path, dtype=str, keep_default_na=False, on_bad_lines='skip')
+            df = df.drop_duplicates()
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', newline='') as f:
+                df.to_csv(f, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+
+class InteractionIdAllocator:
+    """Monotonic INTnnn sequence persisted in a small counter file.
+
+    IDs are handed out without touching the interactions table: the counter
+    file holds the last ID issued and is bumped under a file lock. With
+    `block_size` > 1 a process reserves a range per lock round-trip, trading
+    gaps in the sequence for fewer lock acquisitions. The counter is seeded
+    from the highest existing ID the first time it is created.
+    """
+
+    _ID_RE = re.compile(r'INT(\d+)$')
+
+    def __init__(self, seq_path, interactions_path, block_size=1, fsync=True):
+        self.seq_path = seq_path
+        self.interactions_path = interactions_path
+        self.block_size = max(1, block_size)
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._next = 0
+        self._limit = 0
+
+    def next_id(self):
+        with self._lock:
+            if self._next >= self._limit:
+                self._reserve()
+            n = self._next
+            self._next += 1
+        return f"INT{str(n).zfill(3)}"
+
+    def _reserve(self):
+        with _file_lock(self.seq_path):
+            try:
+                with open(self.seq_path) as f:
+                    last = int(f.read().strip() or 0)
+            except FileNotFoundError:
+                last = self._highest_existing_id()
+            high = last + self.block_size
+            tmp_path = self.seq_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(str(high))
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, self.seq_path)
+        self._next, self._limit = last + 1, high + 1
+
+    def _highest_existing_id(self):
+        highest = 0
+        try:
+            with open(self.interactions_path, newline='') as f:
+                reader = csv.reader(f)
+                header = next(reader, [])
+                if 'interaction_id' not in header:
+                    return 0
+                col = header.index('interaction_id')
+                for row in reader:
+                    m = self._ID_RE.match(row[col]) if len(row) > col else None
+                    if m:
+                        highest = max(highest, int(m.group(1)))
+        except FileNotFoundError:
+            pass
+        return highest
+
+
+def format_profile(r):
+    return f"Name: {r['name']}\nCompany: {r['company']}\nIndustry: {r['industry']}\nRole: {r['role']}\nNeeds: {r['needs']}\nEngagement: {r['engagement']}\nEmail: {r['contact_email']}\nPhone: {r['phone']}"
+
+
+class CSVBackend:
+    """CRM backed by dummy_crm.csv / crm_interactions.csv (the default)."""
+
+    def __init__(self, crm_path=CRM_PATH, interactions_path=INTERACTIONS_PATH, seq_path=INTERACTION_SEQ_PATH):
+        self.store = CRMStore(crm_path, interactions_path)
+        self.ids = InteractionIdAllocator(seq_path, interactions_path,
+                                          block_size=CRM_ID_BLOCK, fsync=CRM_FSYNC)
+        self.log = InteractionLog(interactions_path, self.store, batch_size=CRM_LOG_BATCH, fsync=CRM_FSYNC)
+        atexit.register(self.log.flush)
+
+    def load_crm(self):
+        return self.store.crm_frame().copy()
+
+    def load_interactions(self):
+        return self.store.interactions_frame().copy()
+
+    def fetch_customer_profile(self, crm_id):
+        return self.store.profile(crm_id)
+
+    def fetch_all_interactions(self, crm_id, limit=None):
+        rows = self.store.interactions(crm_id)
+        if limit is not None:
+            rows = rows[:limit]
+        return [dict(r) for r in rows]
+
+    def list_customers(self):
+        df = self.store.crm_frame()
+        return df[['customer_id', 'name', 'company', 'needs']].to_dict(orient='records')
+
+    def add_interaction(self, row):
+        row['interaction_id'] = self.ids.next_id()
+        self.log.append(row)
+        return row
+
+    def flush(self):
+        self.log.flush()
+
+    def compact(self):
+        self.log.compact()
+
+
+# Backend selection: CRM_BACKEND=csv (default) or sqlite (see crm_sqlite.py)
+CRM_BACKEND = os.environ.get('CRM_BACKEND', 'csv').lower()
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if CRM_BACKEND == 'sqlite':
+                    from crm_sqlite import SQLiteBackend
+                    _backend = SQLiteBackend()
+                elif CRM_BACKEND == 'csv':
+                    _backend = CSVBackend()
+                else:
+                    raise ValueError(f"Unknown CRM_BACKEND: {CRM_BACKEND}")
+    return _backend
+
 
 # Load CRM data into a DataFrame (cached)
 def load_crm():
-    return pd.read_csv(CRM_PATH)
+    return get_backend().load_crm()
 
 def load_interactions():
-    return pd.read_csv(INTERACTIONS_PATH)
+    return get_backend().load_interactions()
 
 def fetch_customer_profile(crm_id):
-    df = load_crm()
-    row = df[df['customer_id'] == crm_id]
-    if row.empty:
+    r = get_backend().fetch_customer_profile(crm_id)
+    if r is None:
         return "No profile found for this CRM ID."
-    r = row.iloc[0]
-    profile = f"Name: {r['name']}\nCompany: {r['company']}\nIndustry: {r['industry']}\nRole: {r['role']}\nNeeds: {r['needs']}\nEngagement: {r['engagement']}\nEmail: {r['contact_email']}\nPhone: {r['phone']}"
-    return profile
+    return format_profile(r)
 
 def fetch_last_interaction(crm_id):
-    df = load_interactions()
-    cust = df[df['customer_id'] == crm_id]
-    if cust.empty:
+    cust = get_backend().fetch_all_interactions(crm_id, limit=1)
+    if not cust:
         return None
-    last = cust.sort_values('date', ascending=False).iloc[0]
+    last = cust[0]
     return {
         'date': last['date'],
         'summary': last['summary'],
@@ -34,30 +379,42 @@ def fetch_last_interaction(crm_id):
     }
 
 def fetch_all_interactions(crm_id):
-    df = load_interactions()
-    cust = df[df['customer_id'] == crm_id]
-    if cust.empty:
-        return []
-    return cust.sort_values('date', ascending=False).to_dict(orient='records')
+    return get_backend().fetch_all_interactions(crm_id)
 
 def list_customers():
-    df = load_crm()
-    return df[['customer_id', 'name', 'company', 'needs']].to_dict(orient='records')
+    return get_backend().list_customers()
 
 def add_interaction(crm_id, summary, interaction_type, status, date=None):
     import datetime
-    df = load_interactions()
     if date is None:
         date = datetime.datetime.now().strftime('%Y-%m-%d')
-    new_id = f"INT{str(len(df)+1).zfill(3)}"
     new_row = {
         'customer_id': crm_id,
-        'interaction_id': new_id,
+        'interaction_id': None,
         'date': date,
         'summary': summary,
         'interaction_type': interaction_type,
         'status': status
     }
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    df.to_csv(INTERACTIONS_PATH, index=False)
-    return new_row
+    return get_backend().add_interaction(new_row)
+
+def flush_interactions():
+    """Write out any interactions still buffered by a batched log."""
+    get_backend().flush()
+
+def compact_interactions():
+    """Maintenance: rewrite the interactions store (CSV dedupe, or SQLite WAL checkpoint).
+
+    Not run automatically; use `python crm_integration.py compact` during a quiet period.
+    """
+    get_backend().compact()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="CRM maintenance")
+    parser.add_argument('command', choices=['compact'])
+    args = parser.parse_args()
+    if args.command == 'compact':
+        compact_interactions()
+        print(f"Compacted interactions ({CRM_BACKEND} backend)")
@@ -0,0 +1,183 @@
+"""SQLite storage for the CRM, selected with CRM_BACKEND=sqlite.
+
+Customers and interactions live in one WAL-mode database so that lookups
+and appends stay index-bound however large the CRM extract gets. Import
+the existing CSVs with:
+
+    python crm_sqlite.py [--db crm.db] [--crm dummy_crm.csv] [--interactions crm_interactions.csv]
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from crm_integration import CRM_PATH, INTERACTIONS_PATH, INTERACTION_COLUMNS
+
+CRM_DB_PATH = os.environ.get('CRM_DB_PATH', os.path.join(os.path.dirname(__file__), 'crm.db'))
+CUSTOMER_COLUMNS = ['customer_id', 'name', 'company', 'industry', 'role', 'needs',
+                    'engagement', 'contact_email', 'phone']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS customers (
+    customer_id TEXT PRIMARY KEY,
+    name TEXT,
+    company TEXT,
+    industry TEXT,
+    role TEXT,
+    needs TEXT,
+    engagement TEXT,
+    contact_email TEXT,
+    phone TEXT
+);
+CREATE TABLE IF NOT EXISTS interactions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_id TEXT NOT NULL,
+    interaction_id TEXT NOT NULL UNIQUE,
+    date TEXT,
+    summary TEXT,
+    interaction_type TEXT,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_customer_date ON interactions (customer_id, date);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+_INTERACTION_SELECT = f"SELECT {', '.join(INTERACTION_COLUMNS)} FROM interactions"
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _iter_csv(path, columns):
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            yield tuple(row.get(c) for c in columns)
+
+
+def import_csv(db_path=CRM_DB_PATH, crm_path=CRM_PATH, interactions_path=INTERACTIONS_PATH, batch_size=10000):
+    """Load the CRM CSVs into `db_path`, replacing whatever it held."""
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM customers")
+        conn.execute("DELETE FROM interactions")
+        for table, path, columns in (('customers', crm_path, CUSTOMER_COLUMNS),
+                                     ('interactions', interactions_path, INTERACTION_COLUMNS)):
+            sql = f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+            batch = []
+            for values in _iter_csv(path, columns):
+                batch.append(values)
+                if len(batch) >= batch_size:
+                    conn.executemany(sql, batch)
+                    batch = []
+            conn.executemany(sql, batch)
+        highest = conn.execute(
+            "SELECT COALESCE(MAX(CAST(SUBSTR(interaction_id, 4) AS INTEGER)), 0) FROM interactions "
+            "WHERE interaction_id LIKE 'INT%'"
+        ).fetchone()[0]
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_interaction_id', ?)", (highest,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+class SQLiteBackend:
+    """Same surface as crm_integration.CSVBackend, stored in SQLite.
+
+    Each thread gets its own connection; WAL lets Streamlit sessions read
+    while another one appends.
+    """
+
+    def __init__(self, db_path=CRM_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        if not os.path.exists(db_path):
+            import_csv(db_path)
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect(self.db_path)
+        return conn
+
+    def load_crm(self):
+        return pd.read_sql_query(f"SELECT {', '.join(CUSTOMER_COLUMNS)} FROM customers ORDER BY rowid", self.conn)
+
+    def load_interactions(self):
+        return pd.read_sql_query(f"{_INTERACTION_SELECT} ORDER BY seq", self.conn)
+
+    def fetch_customer_profile(self, crm_id):
+        row = self.conn.execute("SELECT * FROM customers WHERE customer_id = ?", (crm_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def fetch_all_interactions(self, crm_id, limit=None):
+        sql = f"{_INTERACTION_SELECT} WHERE customer_id = ? ORDER BY date DESC, seq DESC"
+        params = (crm_id,)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (limit,)
+        return [dict(r) for r in self.conn.execute(sql, params)]
+
+    def list_customers(self):
+        rows = self.conn.execute("SELECT customer_id, name, company, needs FROM customers ORDER BY rowid")
+        return [dict(r) for r in rows]
+
+    def add_interaction(self, row):
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('last_interaction_id', 0)")
+            n = conn.execute(
+                "UPDATE meta SET value = value + 1 WHERE key = 'last_interaction_id' RETURNING value"
+            ).fetchone()[0]
+            row['interaction_id'] = f"INT{str(n).zfill(3)}"
+            conn.execute(
+                f"INSERT INTO interactions ({', '.join(INTERACTION_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(INTERACTION_COLUMNS))})",
+                tuple(row[c] for c in INTERACTION_COLUMNS)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def flush(self):
+        pass
+
+    def compact(self):
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the CRM CSVs into SQLite")
+    parser.add_argument('--db', default=CRM_DB_PATH)
+    parser.add_argument('--crm', default=CRM_PATH)
+    parser.add_argument('--interactions', default=INTERACTIONS_PATH)
+    args = parser.parse_args()
+    import_csv(args.db, args.crm, args.interactions)
+    conn = connect(args.db)
+    customers = conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+    interactions = conn.execute("SELECT COUNT(*) FROM interactions").fetchone()[0]
+    conn.close()
+    print(f"Imported {customers} customers and {interactions} interactions into {args.db}")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,9 @@ import io
 from docx import Document
 import json
 from PyPDF2 import PdfReader
+from azure_openai import CompletionStream, format_ttft
+from conversation import ConversationWindow
+from retrieval import FileRetriever, needs_retrieval
 
 st.set_page_config(
     page_title="DevOps Assistant",
@@ -16,11 +19,11 @@ st.set_page_config(
 # Initialize OpenAI client
 if 'openai_client' not in st.session_state:
     try:
-        from openai import AzureOpenAI
-        st.session_state.openai_client = AzureOpenAI(
-            api_key=st.secrets["AZURE_OPENAI_KEY"],
-            api_version=st.secrets["AZURE_OPENAI_API_VERSION"],
-            azure_endpoint=st.secrets["AZURE_OPENAI_ENDPOINT"]
+        from azure_openai import get_openai_client
+        st.session_state.openai_client = get_openai_client(
+            st.secrets["AZURE_OPENAI_KEY"],
+            st.secrets["AZURE_OPENAI_ENDPOINT"],
+            st.secrets["AZURE_OPENAI_API_VERSION"]
         )
     except Exception as e:
         st.error(f"Error initializing OpenAI client: {str(e)}")
@@ -33,6 +36,12 @@ if 'openai_client' not in st.session_state:
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 
+if 'conversation' not in st.session_state:
+    st.session_state.conversation = ConversationWindow()
+
+if 'file_retriever' not in st.session_state:
+    st.session_state.file_retriever = FileRetriever()
+
 if 'current_file_content' not in st.session_state:
     st.session_state.current_file_content = None
 
@@ -64,7 +73,9 @@ def extract_file_content(file_bytes, filename):
         # Try PDF
         try:
             pdf = PdfReader(io.BytesIO(file_bytes))
-            return '\n'.join(page.extract_text() for page in pdf.pages if page.extract_text()), 'text'
+            # Extract each page once; empty pages are skipped
+            texts = (page.extract_text() for page in pdf.pages)
+            return '\n'.join(text for text in texts if text), 'text'
         except:
             pass
 
@@ -104,14 +115,19 @@ with col1:
         
         with st.chat_message("assistant"):
             try:
-                messages = [
-                    {"role": "system", "content": "You are a helpful DevOps assistant."},
-                    *[{"role": m["role"], "content": m["content"]} for m in st.session_state.messages]
-                ]
+                # Send a bounded window of the history rather than all of it
+                # plus the excerpts of large uploaded files that match the question
+                retrieved = st.session_state.file_retriever.context_message(prompt)
+                messages = st.session_state.conversation.build(
+                    "You are a helpful DevOps assistant.",
+                    st.session_state.messages,
+                    context=[retrieved] if retrieved else ()
+                )
                 
-                response = st.session_state.openai_client.chat.completions.create(
-                    model="gpt-4.1",  # Exact deployment name from Azure OpenAI
-                    messages=messages,
+                stream = CompletionStream(
+                    st.session_state.openai_client,
+                    "gpt-4.1",  # Exact deployment name from Azure OpenAI
+                    messages,
                     temperature=0.7,
                     max_tokens=800,
                     top_p=0.95,
@@ -120,11 +136,21 @@ with col1:
                     stop=None
                 )
                 
-                if response and response.choices:
-                    assistant_response = response.choices[0].message.content
-                    st.markdown(assistant_response)
+                response_placeholder = st.empty()
+                partial = ""
+                for delta in stream:
+                    partial += delta
+                    response_placeholder.markdown(partial + "▌")
+                
+                if stream.text:
+                    assistant_response = stream.text
+                    response_placeholder.markdown(assistant_response)
+                    context = st.session_state.conversation.last_stats
+                    st.caption(f"{format_ttft(stream)} | Context: {context['tokens']} tokens, "
+                               f"{context['turns_sent']} turns ({context['turns_summarized']} summarized)")
                     st.session_state.messages.append({"role": "assistant", "content": assistant_response})
                 else:
+                    response_placeholder.empty()
                     st.error("No response received from the assistant. Please try again.")
                     
             except Exception as e:
@@ -148,6 +174,12 @@ with col2:
             
             # Add file content to chat context
             if content != st.session_state.get('last_file_content'):
-                system_message = f"The user has uploaded a file named '{uploaded_file.name}'. Here's its content:\n\n{content}\n\nPlease help analyze or modify this content as needed."
+                if needs_retrieval(content):
+                    # Too large to inline: index it and send matching chunks with each question
+                    sections = st.session_state.file_retriever.add(uploaded_file.name, content)
+                    system_message = f"The user has uploaded a file named '{uploaded_file.name}'. It is too large to include in full ({sections} sections); the sections most relevant to each question are provided as excerpts.\n\nPlease help analyze or modify this content as needed."
+                else:
+                    st.session_state.file_retriever.discard(uploaded_file.name)
+                    system_message = f"The user has uploaded a file named '{uploaded_file.name}'. Here's its content:\n\n{content}\n\nPlease help analyze or modify this content as needed."
                 st.session_state.messages.append({"role": "system", "content": system_message})
                 st.session_state.last_file_content = content
@@ -0,0 +1,159 @@
+"""Local BM25 retrieval over uploaded file content.
+
+Large uploads are split into overlapping line-aligned chunks and indexed
+in-process with NumPy; each chat question then carries only the few
+chunks that score best against it instead of the whole file.
+"""
+import os
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from bm25 import idf, length_norm, term_score, tokenize
+from conversation import count_tokens
+
+RETRIEVAL_CHUNK_WORDS = int(os.environ.get("RETRIEVAL_CHUNK_WORDS", "180"))
+RETRIEVAL_OVERLAP_WORDS = int(os.environ.get("RETRIEVAL_OVERLAP_WORDS", "30"))
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", "4"))
+# Files at or under this size are sent whole; retrieval only pays off above it
+RETRIEVAL_INLINE_TOKENS = int(os.environ.get("RETRIEVAL_INLINE_TOKENS", "1500"))
+
+# Chunk sizes count a line as its words or its length / _CHARS_PER_WORD,
+# whichever is larger, so lines of long unbroken tokens still get split
+_CHARS_PER_WORD = 8
+
+
+def _split_long_lines(text: str, chunk_words: int) -> List[str]:
+    """Lines of `text`, with any line over `chunk_words` words broken at word boundaries.
+
+    Runs without whitespace (minified files) are also cut, at roughly the
+    character length of a chunk, so no piece can grow past one chunk.
+    """
+    max_chars = chunk_words * _CHARS_PER_WORD
+    lines = []
+    for line in text.splitlines():
+        words = line.split()
+        if len(words) <= chunk_words and len(line) <= max_chars:
+            lines.append(line)
+            continue
+        piece, piece_chars = [], 0
+        for word in words:
+            for part in (word[i:i + max_chars] for i in range(0, len(word), max_chars)):
+                if piece and (len(piece) >= chunk_words or piece_chars + len(part) > max_chars):
+                    lines.append(" ".join(piece))
+                    piece, piece_chars = [], 0
+                piece.append(part)
+                piece_chars += len(part) + 1
+        if piece:
+            lines.append(" ".join(piece))
+    return lines
+
+
+def _weight(line: str) -> int:
+    return max(len(line.split()), -(-len(line) // _CHARS_PER_WORD))
+
+
+def chunk_text(text: str, chunk_words=RETRIEVAL_CHUNK_WORDS, overlap_words=RETRIEVAL_OVERLAP_WORDS) -> List[str]:
+    """Group lines into chunks of about `chunk_words` words with some overlap.
+
+    Lines longer than a chunk are first split at word boundaries.
+    """
+    lines = _split_long_lines(text, chunk_words)
+    chunks = []
+    start = 0
+    while start < len(lines):
+        words = 0
+        end = start
+        while end < len(lines) and (words < chunk_words or end == start):
+            words += _weight(lines[end])
+            end += 1
+        chunk = "\n".join(lines[start:end]).strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(lines):
+            break
+        # Repeat up to `overlap_words` words of trailing lines in the next chunk
+        back, overlap = end, 0
+        while back > start + 1:
+            words = _weight(lines[back - 1])
+            if overlap + words > overlap_words:
+                break
+            back -= 1
+            overlap += words
+        start = back
+    return chunks
+
+
+class BM25Index:
+    def __init__(self, chunks: List[str], k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        postings = defaultdict(lambda: ([], []))
+        lengths = np.zeros(len(chunks), dtype=np.float32)
+        for i, chunk in enumerate(chunks):
+            terms = Counter(tokenize(chunk))
+            lengths[i] = sum(terms.values())
+            for term, tf in terms.items():
+                ids, tfs = postings[term]
+                ids.append(i)
+                tfs.append(tf)
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {
+            term: (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for term, (ids, tfs) in postings.items()
+        }
+        avg = lengths.mean() if len(chunks) else 1.0
+        self._norm = length_norm(lengths, max(avg, 1.0), k1, b)
+
+    def search(self, query: str, k=RETRIEVAL_TOP_K) -> List[Tuple[float, int]]:
+        n = len(self.chunks)
+        if not n:
+            return []
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs = posting
+            scores[ids] += term_score(idf(n, len(ids)), tfs, self._norm[ids], self.k1)
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(i)) for i in top if scores[i] > 0]
+
+
+class FileRetriever:
+    """Chunk indexes for every file uploaded in a chat session, keyed by name."""
+
+    def __init__(self):
+        self._files: Dict[str, BM25Index] = {}
+
+    def add(self, name: str, text: str) -> int:
+        self._files[name] = BM25Index(chunk_text(text))
+        return len(self._files[name].chunks)
+
+    def discard(self, name: str):
+        self._files.pop(name, None)
+
+    def __bool__(self):
+        return bool(self._files)
+
+    def search(self, query: str, k=RETRIEVAL_TOP_K) -> List[Tuple[float, str, str]]:
+        hits = []
+        for name, index in self._files.items():
+            hits.extend((score, name, index.chunks[i]) for score, i in index.search(query, k))
+        hits.sort(key=lambda h: -h[0])
+        return hits[:k]
+
+    def context_message(self, query: str, k=RETRIEVAL_TOP_K):
+        """System message with the excerpts most relevant to `query`, or None."""
+        hits = self.search(query, k)
+        if not hits:
+            return None
+        excerpts = "\n\n".join(f"[{name}]\n{chunk}" for _, name, chunk in hits)
+        return {"role": "system", "content": f"Relevant excerpts from the uploaded files:\n\n{excerpts}"}
+
+
+def needs_retrieval(text: str) -> bool:
+    return count_tokens(text) > RETRIEVAL_INLINE_TOKENS
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+
+import docker
+import pytest
+from fastapi import HTTPException
+
+from agent.jobs import CANCELLED, JobQueue, JobStore
+
+
+@pytest.fixture
+def agent(monkeypatch, tmp_path):
+    # agent.main builds its Agent at import time; no Docker daemon is needed
+    # for jobs that never start
+    monkeypatch.setenv("AGENT_METRICS_PERSIST", "0")
+    monkeypatch.setattr(docker, "from_env", lambda: object())
+    from agent.main import agent
+    jobs = JobQueue(workers=1, store=JobStore(tmp_path / "jobs.db"))
+    monkeypatch.setattr(agent, "jobs", jobs)
+    yield agent
+    jobs.shutdown()
+
+
+def test_cancelling_a_queued_build_returns_409(agent):
+    release = threading.Event()
+    agent.jobs.submit("block", lambda job: release.wait(5))
+
+    async def scenario():
+        build = asyncio.ensure_future(agent._build(wait=True))
+        await asyncio.sleep(0.05)
+        queued = [job for job in agent.jobs.list() if job.kind == "build"]
+        assert len(queued) == 1
+        assert agent.jobs.cancel(queued[0].id)
+        with pytest.raises(HTTPException) as excinfo:
+            await build
+        return queued[0].id, excinfo.value
+
+    try:
+        job_id, error = asyncio.run(scenario())
+    finally:
+        release.set()
+    assert error.status_code == 409
+    assert "cancelled" in error.detail
+    assert agent.jobs.get(job_id).status == CANCELLED
@@ -0,0 +1,49 @@
+import asyncio
+from types import SimpleNamespace
+
+from agent.batch import plan_dependencies, run_batch
+
+
+def command(action, filepath=None, depends_on=None):
+    return SimpleNamespace(action=action, filepath=filepath, depends_on=depends_on)
+
+
+def run(commands, failing=()):
+    async def execute(cmd):
+        if (cmd.action, cmd.filepath) in failing:
+            raise ValueError(f"{cmd.action} {cmd.filepath} failed")
+        return {"ok": True}
+
+    return asyncio.run(run_batch(commands, execute))
+
+
+def test_failed_read_does_not_skip_later_write():
+    result = run([command("read", "a.txt"), command("write", "a.txt")], failing={("read", "a.txt")})
+    statuses = [entry["status"] for entry in result["results"]]
+    assert statuses == ["error", "success"]
+
+
+def test_failed_write_skips_reads_and_writes_of_that_file():
+    commands = [command("write", "a.txt"), command("read", "a.txt"), command("write", "a.txt"),
+                command("read", "b.txt")]
+    result = run(commands, failing={("write", "a.txt")})
+    statuses = [entry["status"] for entry in result["results"]]
+    assert statuses == ["error", "skipped", "skipped", "success"]
+    assert result["results"][1]["blocked_by"] == [0]
+
+
+def test_failed_test_does_not_skip_commands_after_the_barrier():
+    result = run([command("test"), command("write", "a.txt")], failing={("test", None)})
+    assert [entry["status"] for entry in result["results"]] == ["error", "success"]
+
+
+def test_explicit_dependency_blocks_on_failure():
+    commands = [command("read", "a.txt"), command("write", "b.txt", depends_on=[0])]
+    result = run(commands, failing={("read", "a.txt")})
+    assert [entry["status"] for entry in result["results"]] == ["error", "skipped"]
+
+
+def test_write_after_read_is_ordering_only():
+    deps, blocking = plan_dependencies([command("read", "a.txt"), command("write", "a.txt")])
+    assert deps == [set(), {0}]
+    assert blocking == [set(), set()]
@@ -0,0 +1,213 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pandas as pd
+import pytest
+
+import crm_integration
+from crm_integration import INTERACTION_COLUMNS, CRMStore, InteractionIdAllocator, InteractionLog
+from crm_sqlite import CUSTOMER_COLUMNS, SQLiteBackend, import_csv
+
+
+def interaction(n, date='2024-03-01', customer='C1'):
+    return {'customer_id': customer, 'interaction_id': f'INT{n:03d}', 'date': date,
+            'summary': f'call {n}', 'interaction_type': 'call', 'status': 'open'}
+
+
+@pytest.fixture
+def interactions_path(tmp_path):
+    path = tmp_path / 'interactions.csv'
+    path.write_text(','.join(INTERACTION_COLUMNS) + '\n'
+                    'C1,INT001,2024-01-01,first,call,closed\n'
+                    'C1,INT002,2024-03-01,second,email,open\n'
+                    'C2,INT003,2024-02-01,other,call,open\n')
+    return str(path)
+
+
+def ids(rows):
+    return [r['interaction_id'] for r in rows]
+
+
+def in_processes(count, script, *args):
+    """Run `script` in `count` interpreters at once, as separate app processes would."""
+    cwd = os.path.dirname(os.path.abspath(crm_integration.__file__))
+    procs = [subprocess.Popen([sys.executable, '-c', script, str(i), *map(str, args)], cwd=cwd,
+                              stdout=subprocess.PIPE, text=True)
+             for i in range(count)]
+    outputs = [p.communicate(timeout=60)[0] for p in procs]
+    assert [p.returncode for p in procs] == [0] * count
+    return outputs
+
+
+def test_interactions_are_newest_first(interactions_path):
+    store = CRMStore('unused.csv', interactions_path)
+    assert ids(store.interactions('C1')) == ['INT002', 'INT001']
+    assert store.interactions('missing') == []
+
+
+def test_same_date_append_is_the_last_interaction(interactions_path):
+    store = CRMStore('unused.csv', interactions_path)
+    log = InteractionLog(interactions_path, store, fsync=False)
+    store.interactions('C1')
+    log.append(interaction(4))
+    log.append(interaction(5))
+    assert ids(store.interactions('C1')) == ['INT005', 'INT004', 'INT002', 'INT001']
+    # A fresh load of the same file agrees with the incrementally folded index
+    assert ids(CRMStore('unused.csv', interactions_path).interactions('C1')) == ids(store.interactions('C1'))
+
+
+def test_reload_after_append(interactions_path):
+    store = CRMStore('unused.csv', interactions_path)
+    log = InteractionLog(interactions_path, store, fsync=False)
+    log.append(interaction(4, '2024-04-01'))
+    assert ids(store.interactions('C1'))[0] == 'INT004'
+    assert len(store.interactions_frame()) == 4
+
+    # Another process appends: the signature no longer matches, so the store reloads
+    InteractionLog(interactions_path, fsync=False).append(interaction(5, '2024-05-01'))
+    assert ids(store.interactions('C1'))[:2] == ['INT005', 'INT004']
+    assert store.interactions_frame()['interaction_id'].tolist()[-2:] == ['INT004', 'INT005']
+
+    # The next append is folded in without a re-read
+    log.append(interaction(6, '2024-04-15'))
+    assert ids(store.interactions('C1')) == ['INT005', 'INT006', 'INT004', 'INT002', 'INT001']
+    assert len(store.interactions_frame()) == 6
+
+    # A rewrite behind the store's back (e.g. compaction elsewhere) is picked up too
+    os.remove(interactions_path)
+    InteractionLog(interactions_path, fsync=False).append(interaction(7))
+    assert ids(store.interactions('C1')) == ['INT007']
+
+
+def test_sqlite_same_date_append_is_the_last_interaction(tmp_path, interactions_path):
+    crm_path = tmp_path / 'crm.csv'
+    crm_path.write_text(','.join(CUSTOMER_COLUMNS) + '\n')
+    db_path = str(tmp_path / 'crm.db')
+    import_csv(db_path, str(crm_path), interactions_path)
+    backend = SQLiteBackend(db_path)
+    backend.add_interaction(interaction(0))
+    backend.add_interaction(interaction(0))
+    assert ids(backend.fetch_all_interactions('C1')) == ['INT005', 'INT004', 'INT002', 'INT001']
+    assert ids(backend.fetch_all_interactions('C1', limit=1)) == ['INT005']
+
+
+def test_concurrent_appends_from_threads(interactions_path):
+    store = CRMStore('unused.csv', interactions_path)
+    log = InteractionLog(interactions_path, store, batch_size=3, fsync=False)
+    store.interactions('C1')
+
+    def writer(t):
+        for i in range(50):
+            log.append(interaction(100 + t * 50 + i, customer=f'T{t}'))
+
+    threads = [threading.Thread(target=writer, args=(t,)) for t in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    log.flush()
+
+    on_disk = pd.read_csv(interactions_path)
+    assert len(on_disk) == 3 + 200
+    assert on_disk['interaction_id'].is_unique
+    for t in range(4):
+        # Each thread's rows keep their order, newest first in the index
+        expected = [f'INT{100 + t * 50 + i:03d}' for i in reversed(range(50))]
+        assert ids(store.interactions(f'T{t}')) == expected
+        assert ids(CRMStore('unused.csv', interactions_path).interactions(f'T{t}')) == expected
+
+
+APPEND_SCRIPT = """
+import sys
+from crm_integration import InteractionLog
+worker, path = int(sys.argv[1]), sys.argv[2]
+log = InteractionLog(path, batch_size=2, fsync=False)
+for i in range(100):
+    log.append({'customer_id': f'P{worker}', 'interaction_id': f'INT{1000 + worker * 100 + i}',
+                'date': '2024-03-01', 'summary': 'x' * 200, 'interaction_type': 'call', 'status': 'open'})
+log.flush()
+"""
+
+
+def test_concurrent_appends_from_processes(tmp_path):
+    path = str(tmp_path / 'interactions.csv')
+    in_processes(4, APPEND_SCRIPT, path)
+    # One header, no torn or interleaved rows
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert lines[0] == ','.join(INTERACTION_COLUMNS)
+    on_disk = pd.read_csv(path)
+    assert len(lines) == len(on_disk) + 1 == 401
+    for worker in range(4):
+        rows = on_disk[on_disk['customer_id'] == f'P{worker}']
+        assert rows['interaction_id'].tolist() == [f'INT{1000 + worker * 100 + i}' for i in range(100)]
+
+
+def test_batched_rows_are_written_on_flush(interactions_path):
+    log = InteractionLog(interactions_path, batch_size=10, fsync=False)
+    log.append(interaction(4))
+    assert len(pd.read_csv(interactions_path)) == 3
+    log.flush()
+    assert pd.read_csv(interactions_path)['interaction_id'].tolist()[-1] == 'INT004'
+
+
+def test_append_after_a_torn_last_line(interactions_path):
+    with open(interactions_path, 'a') as f:
+        f.write('C1,INT009,2024-0')
+    InteractionLog(interactions_path, fsync=False).append(interaction(4))
+    with open(interactions_path) as f:
+        assert f.read().splitlines()[-1].startswith('C1,INT004,')
+
+
+def test_ids_are_seeded_from_the_highest_existing_id(tmp_path, interactions_path):
+    with open(interactions_path, 'a') as f:
+        f.write('C2,INT059,2024-02-02,x,call,open\nC2,legacy-7,2024-02-03,x,call,open\n')
+    seq_path = str(tmp_path / 'interactions.seq')
+    allocator = InteractionIdAllocator(seq_path, interactions_path, fsync=False)
+    assert [allocator.next_id() for _ in range(2)] == ['INT060', 'INT061']
+    # Later allocators continue from the counter file, not the CSV
+    assert InteractionIdAllocator(seq_path, interactions_path, fsync=False).next_id() == 'INT062'
+    assert InteractionIdAllocator(str(tmp_path / 'fresh.seq'), str(tmp_path / 'missing.csv')).next_id() == 'INT001'
+
+
+def test_ids_keep_counting_past_three_digits(tmp_path):
+    seq_path = tmp_path / 'interactions.seq'
+    seq_path.write_text('999')
+    assert InteractionIdAllocator(str(seq_path), 'unused.csv', fsync=False).next_id() == 'INT1000'
+
+
+def test_concurrent_ids_from_threads_are_unique(tmp_path, interactions_path):
+    seq_path = str(tmp_path / 'interactions.seq')
+    allocators = [InteractionIdAllocator(seq_path, interactions_path, block_size=b, fsync=False) for b in (1, 1, 5, 5)]
+    issued = []
+
+    def take(allocator):
+        issued.extend(allocator.next_id() for _ in range(50))
+
+    threads = [threading.Thread(target=take, args=(a,)) for a in allocators for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(issued) == len(set(issued)) == 400
+    assert min(issued) == 'INT004'
+
+
+ALLOCATE_SCRIPT = """
+import sys
+from crm_integration import InteractionIdAllocator
+ids = InteractionIdAllocator(sys.argv[2], sys.argv[3], block_size=int(sys.argv[4]), fsync=False)
+print(' '.join(ids.next_id() for _ in range(100)))
+"""
+
+
+@pytest.mark.parametrize('block_size', [1, 8])
+def test_concurrent_ids_from_processes_are_unique(tmp_path, interactions_path, block_size):
+    seq_path = str(tmp_path / 'interactions.seq')
+    issued = ' '.join(in_processes(4, ALLOCATE_SCRIPT, seq_path, interactions_path, block_size)).split()
+    assert len(issued) == len(set(issued)) == 400
+    if block_size == 1:
+        # No gaps when nothing is reserved ahead
+        assert sorted(int(i[3:]) for i in issued) == list(range(4, 404))
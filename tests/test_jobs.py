@@ -0,0 +1,105 @@
+import asyncio
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from agent.jobs import CANCELLED, FAILED, QUEUED, SUCCEEDED, Job, JobQueue, JobStore
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Two job queues sharing one database, as two agent worker processes would."""
+    queues = [JobQueue(workers=1, store=JobStore(tmp_path / "jobs.db")) for _ in range(2)]
+    yield queues
+    for queue in queues:
+        queue.shutdown()
+
+
+def test_finished_job_is_visible_from_another_worker(workers):
+    a, b = workers
+
+    def work(job):
+        job.log("step 1\nstep 2")
+        return {"exit_code": 0}
+
+    job = a.submit("test", work, {"image": "app"})
+    job._future.result(timeout=5)
+    seen = b.get(job.id)
+    assert seen.status == SUCCEEDED
+    assert seen.result == {"exit_code": 0}
+    assert seen.params == {"image": "app"}
+    assert seen.log_lines() == {"lines": ["step 1", "step 2"], "first": 0, "next": 2}
+    assert [j.id for j in b.list()] == [job.id]
+    assert b.stats()["jobs"] == {SUCCEEDED: 1}
+    assert b.get("missing") is None
+
+
+def test_cancel_from_another_worker(workers):
+    a, b = workers
+    release = threading.Event()
+    ran = []
+    blocker = a.submit("block", lambda job: release.wait(5))
+    queued = a.submit("build", lambda job: ran.append(job.id))
+    try:
+        assert b.get(queued.id).status == QUEUED
+        assert b.cancel(queued.id)
+        assert not b.cancel(queued.id)
+    finally:
+        release.set()
+    blocker._future.result(timeout=5)
+    queued._future.result(timeout=5)
+    assert ran == []
+    assert queued.status == CANCELLED
+    assert a.get(queued.id).status == b.get(queued.id).status == CANCELLED
+    # A running job can't be cancelled
+    running = threading.Event()
+    release.clear()
+    busy = a.submit("block", lambda job: (running.set(), release.wait(5)))
+    assert running.wait(5)
+    assert not b.cancel(busy.id)
+    release.set()
+
+
+def test_follow_from_another_worker(workers):
+    a, b = workers
+
+    def work(job):
+        for i in range(5):
+            job.log(f"line {i}")
+            time.sleep(0.02)
+
+    job = a.submit("test", work)
+
+    async def follow():
+        return [line async for line in b.follow(b.get(job.id), poll_interval=0.01)]
+
+    assert asyncio.run(follow()) == [f"line {i}" for i in range(5)]
+
+
+def test_jobs_of_an_exited_worker_are_failed(tmp_path):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    store = JobStore(tmp_path / "jobs.db")
+    orphan = Job("build")
+    store.insert(orphan)
+    store.conn.execute("UPDATE jobs SET owner = ? WHERE id = ?", (f"{socket.gethostname()}:{dead.pid}", orphan.id))
+    store.claim(orphan.id, time.time())
+
+    row = JobStore(tmp_path / "jobs.db").load(orphan.id)
+    assert row["status"] == FAILED
+    assert "exited" in row["error"]
+
+
+def test_stored_log_keeps_the_newest_lines(tmp_path):
+    store = JobStore(tmp_path / "jobs.db", max_lines=3)
+    job = Job("test", store=store)
+    store.insert(job)
+    for i in range(5):
+        job.log(f"line {i}")
+    snapshot = Job.from_row(store.load(job.id), store)
+    assert snapshot.log_lines() == {"lines": ["line 2", "line 3", "line 4"], "first": 2, "next": 5}
+    assert snapshot.log_lines(4) == {"lines": ["line 4"], "first": 4, "next": 5}
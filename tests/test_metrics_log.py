@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+from loguru import logger
+
+from agent import metrics_log
+from agent.metrics_log import MetricsLog
+
+
+def test_append_round_trips(tmp_path):
+    log = MetricsLog(tmp_path / 'metrics')
+    now = time.time()
+    log.append('commands', 'read_file', 0.25, timestamp=now)
+    log.append('commands', 'build', 3.0, timestamp=now + 1)
+    samples = log.scan(now - 60)
+    assert samples['label'].tolist() == ['read_file', 'build']
+    assert samples['value'].tolist() == [0.25, 3.0]
+
+
+def test_unwritable_directory_warns_once_and_disables(tmp_path):
+    blocker = tmp_path / 'not-a-dir'
+    blocker.write_text('')
+    warnings = []
+    sink = logger.add(warnings.append, level='WARNING')
+    try:
+        log = MetricsLog(blocker / 'metrics')
+        for _ in range(5):
+            log.append('commands', 'read_file', 0.1, timestamp=time.time())
+    finally:
+        logger.remove(sink)
+    assert log.disabled
+    assert len(warnings) == 1
+
+
+def test_long_windows_read_rollups_written_beside_closed_segments(tmp_path, monkeypatch):
+    log = MetricsLog(tmp_path, segment_seconds=3600)
+    rng = np.random.default_rng(0)
+    now = time.time()
+    for ts in np.sort(rng.uniform(now - 5 * 3600, now, 20000)):
+        log.append('commands', rng.choice(['build', 'read_file']), rng.lognormal(-2, 1), timestamp=ts)
+    exact = log.percentiles('commands', 6 * 3600).set_index('label')
+    raw_resolution, raw_frame = log.timeseries('commands', 6 * 3600, max_points=100)
+
+    monkeypatch.setattr(metrics_log, 'RAW_SCAN_RECORDS', 0)
+    resolution, frame = log.timeseries('commands', 6 * 3600, max_points=100)
+    assert resolution == raw_resolution == '600s'
+    assert sorted(tmp_path.glob('*.npz'))
+    merged = raw_frame.merge(frame, on=['timestamp', 'label'])
+    assert len(merged) == len(raw_frame) == len(frame)
+    for column in ('count', 'sum', 'min', 'max', 'p95'):
+        assert np.allclose(merged[f'{column}_x'], merged[f'{column}_y'])
+
+    table = log.percentiles('commands', 6 * 3600).set_index('label')
+    assert (table['count'] == exact['count']).all()
+    for column in ('p50', 'p95', 'p99'):
+        assert np.allclose(table[column], exact[column], rtol=0.02)
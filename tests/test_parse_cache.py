@@ -0,0 +1,39 @@
+import datetime
+
+from agent.file_handler import FileHandler
+from agent.parse_cache import ParseCache
+
+
+def read_three_ways(workspace, name):
+    """A cold read, a memory hit, and a read from a fresh handler (disk tier or reparse)."""
+    handler = FileHandler(workspace)
+    first = handler.read_file(name)
+    second = handler.read_file(name)
+    third = FileHandler(workspace).read_file(name)
+    return first, second, third
+
+
+def test_int_keys_survive_the_cache(tmp_path):
+    (tmp_path / 'ports.yaml').write_text('ports:\n  80: 8080\n  443: 8443\n')
+    for result in read_three_ways(tmp_path, 'ports.yaml'):
+        assert result['content'] == {'ports': {80: 8080, 443: 8443}}
+
+
+def test_date_keys_survive_the_cache(tmp_path):
+    (tmp_path / 'changelog.yaml').write_text('2024-01-01: first\n2024-02-01: second\n')
+    for result in read_three_ways(tmp_path, 'changelog.yaml'):
+        assert result['content'] == {datetime.date(2024, 1, 1): 'first', datetime.date(2024, 2, 1): 'second'}
+
+
+def test_lossy_values_are_not_written_to_disk(tmp_path):
+    cache = ParseCache(disk_dir=tmp_path)
+    cache.put('a' * 64, 'yaml', {'content': {80: 8080}})
+    cache.put('b' * 64, 'yaml', {'content': {'name': 'web'}})
+    assert [p.name.split('-')[0] for p in tmp_path.glob('*/*.json')] == ['b' * 64]
+
+
+def test_hits_are_independent_copies(tmp_path):
+    cache = ParseCache(disk_dir=tmp_path)
+    cache.put('c' * 64, 'yaml', {'content': {'items': [1, 2]}})
+    cache.get('c' * 64, 'yaml')['content']['items'].append(3)
+    assert cache.get('c' * 64, 'yaml') == {'content': {'items': [1, 2]}}
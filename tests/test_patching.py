@@ -0,0 +1,120 @@
+import asyncio
+import difflib
+import os
+import stat
+
+import docker
+import pytest
+from fastapi import HTTPException
+
+from agent.patching import PatchConflict, apply_edits, line_range_edit, parse_unified_diff
+
+
+def diff(old: str, new: str) -> str:
+    return "".join(difflib.unified_diff(old.splitlines(True), new.splitlines(True), "a/f", "b/f"))
+
+
+def patch(path, old: str, new: str):
+    return apply_edits(path, parse_unified_diff(diff(old, new)))
+
+
+def test_several_line_range_edits_in_one_pass(tmp_path):
+    path = tmp_path / "f.txt"
+    path.write_bytes(b"a\nb\nc\nd\ne\n")
+    # Out of order; both address lines of the original file
+    stored = apply_edits(path, [line_range_edit("3-4", "D\n"), line_range_edit("0-1", "A1\nA2\n")])
+    assert path.read_bytes() == b"A1\nA2\nb\nc\nD\ne\n"
+    assert stored["lines"] == 6
+    assert stored["size"] == len(path.read_bytes())
+
+
+def test_diff_with_several_hunks(tmp_path):
+    old = "".join(f"line {i}\n" for i in range(40))
+    new = old.replace("line 2\n", "line two\n").replace("line 30\n", "").replace("line 39\n", "line 39\nline 40\n")
+    path = tmp_path / "f.txt"
+    path.write_text(old)
+    patch(path, old, new)
+    assert path.read_text() == new
+
+
+def test_stale_diff_conflicts_and_leaves_the_file_alone(tmp_path):
+    path = tmp_path / "f.txt"
+    path.write_bytes(b"a\nb\nc\n")
+    stale = diff("a\nB\nc\n", "a\nB2\nc\n")
+    with pytest.raises(PatchConflict):
+        apply_edits(path, parse_unified_diff(stale))
+    assert path.read_bytes() == b"a\nb\nc\n"
+    assert os.listdir(tmp_path) == ["f.txt"]
+
+
+def test_stale_diff_is_a_409(tmp_path, monkeypatch):
+    monkeypatch.setenv("AGENT_METRICS_PERSIST", "0")
+    monkeypatch.setattr(docker, "from_env", lambda: object())
+    from agent.main import Command, agent
+    monkeypatch.setattr(agent, "workspace", tmp_path)
+    (tmp_path / "f.txt").write_bytes(b"a\nb\nc\n")
+    command = Command(action="write", filepath="f.txt", patch=diff("a\nB\nc\n", "a\nB2\nc\n"))
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(agent.execute_command(command))
+    assert excinfo.value.status_code == 409
+    assert (tmp_path / "f.txt").read_bytes() == b"a\nb\nc\n"
+
+
+@pytest.mark.parametrize("original, expected", [
+    (b"a\nb\n", b"a\nb\nc\n"),
+    (b"a\nb", b"a\nb\nc\n"),
+    (b"", b"c\n"),
+])
+def test_append_at_eof(tmp_path, original, expected):
+    path = tmp_path / "f.txt"
+    path.write_bytes(original)
+    count = len(original.splitlines())
+    apply_edits(path, [line_range_edit(f"{count}-{count}", "c\n")])
+    assert path.read_bytes() == expected
+
+
+def test_append_hunk_at_eof(tmp_path):
+    path = tmp_path / "f.txt"
+    path.write_text("a\nb\n")
+    patch(path, "a\nb\n", "a\nb\nc\nd\n")
+    assert path.read_text() == "a\nb\nc\nd\n"
+
+
+@pytest.mark.parametrize("ending", [b"\n", b""])
+def test_trailing_newline_is_kept_as_it_was(tmp_path, ending):
+    path = tmp_path / "f.txt"
+    path.write_bytes(b"a\nb\nc" + ending)
+    apply_edits(path, [line_range_edit("1-2", "B\n")])
+    assert path.read_bytes() == b"a\nB\nc" + ending
+    stored = apply_edits(path, [line_range_edit("0-1", "A\n")])
+    assert path.read_bytes() == b"A\nB\nc" + ending
+    assert stored["lines"] == 3
+
+
+def test_diff_touching_a_last_line_without_newline(tmp_path):
+    path = tmp_path / "f.txt"
+    path.write_bytes(b"a\nb")
+    # As git writes it; difflib leaves the markers out
+    apply_edits(path, parse_unified_diff(
+        "--- a/f\n+++ b/f\n@@ -1,2 +1,2 @@\n a\n-b\n\\ No newline at end of file\n+B\n\\ No newline at end of file\n"))
+    assert path.read_bytes() == b"a\nB"
+    apply_edits(path, parse_unified_diff("@@ -2 +2 @@\n-B\n\\ No newline at end of file\n+B2\n"))
+    assert path.read_bytes() == b"a\nB2\n"
+
+
+def test_crlf_file_keeps_its_line_endings(tmp_path):
+    path = tmp_path / "f.txt"
+    path.write_bytes(b"a\r\nb\r\nc\r\nd\r\n")
+    # A client that normalised the file to LF before diffing
+    patch(path, "a\nb\nc\nd\n", "a\nb\nC\nc2\nd\n")
+    assert path.read_bytes() == b"a\r\nb\r\nC\r\nc2\r\nd\r\n"
+    apply_edits(path, [line_range_edit("0-1", "A\n")])
+    assert path.read_bytes() == b"A\r\nb\r\nC\r\nc2\r\nd\r\n"
+
+
+def test_mode_is_kept(tmp_path):
+    path = tmp_path / "run.sh"
+    path.write_text("echo a\n")
+    path.chmod(0o750)
+    apply_edits(path, [line_range_edit("1-1", "echo b\n")])
+    assert stat.S_IMODE(path.stat().st_mode) == 0o750